@@ -0,0 +1,173 @@
+"""
+The bot: dispatcher, middlewares, background tasks and run modes. Started by `main.py`.
+"""
+
+import asyncio
+import os
+import signal
+from typing import List
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from config import config
+import handlers
+from aiogram.methods import DeleteWebhook
+from middlewares import HandlerMetrics, ProfilingMiddleware, TelegramMetrics
+from utils.storage import GAME_LOG, STORAGE, WRITE_BEHIND
+from utils import metrics
+from utils.logs import setup_logging
+from utils.profiling import ProfilerControl
+from utils.webhook import WebhookServer
+
+# Commands labelled by name in the handler metrics
+COMMANDS = ("find", "join", "rematch", "solo", "leave", "start", "help", "echo")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """
+    Serves webhook updates until SIGINT or SIGTERM, then drains the updates in flight.
+    """
+    secret = config.webhook_secret.get_secret_value() if config.webhook_secret else None
+    server = WebhookServer(
+        dp,
+        bot,
+        path=config.webhook_path,
+        secret=secret,
+        max_concurrency=config.webhook_max_concurrency,
+    )
+    await server.start(config.webhook_host, config.webhook_port)
+    await bot.set_webhook(
+        config.webhook_url.rstrip("/") + config.webhook_path,
+        secret_token=server.secret,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=min(100, config.webhook_max_concurrency),
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop(config.webhook_drain_timeout)
+
+
+def create_bot() -> Bot:
+    session = None
+    if config.api_base_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.api_base_url))
+    bot = Bot(token=config.bot_token.get_secret_value(), session=session)
+    bot.session.middleware(TelegramMetrics())
+    return bot
+
+
+def create_dispatcher() -> Dispatcher:
+    dp = Dispatcher(name='main', storage=STORAGE)
+    dp.message.middleware(ProfilingMiddleware(config.slow_update_threshold))
+    dp.message.outer_middleware(handlers.rooms_manager.ROOM_ORDER)
+
+    dp.message.middleware(
+        HandlerMetrics(
+            handlers.rooms_manager.ACTIONS,
+            COMMANDS,
+            room_of=handlers.rooms_manager.MANAGER.room_of,
+        )
+    )
+
+    dp.include_routers(
+        handlers.rooms_manager.router,
+        handlers.start.router,
+        handlers.echo.router,
+        handlers.base.router,  # Make sure it's the last handler
+    )
+    return dp
+
+
+def start_background(bot: Bot) -> List[asyncio.Task]:
+    """
+    Starts the storage writer, the game log flush, the /solo search workers, the idle-room
+    reaper, the matchmaker and the metrics.
+
+    Returns:
+    - List[asyncio.Task]: The background tasks, to pass to `stop_background`.
+    """
+    if WRITE_BEHIND is not None:
+        WRITE_BEHIND.start()
+    if GAME_LOG is not None:
+        handlers.rooms_manager.SCHEDULER.call_later(
+            config.game_log_flush_interval,
+            handlers.rooms_manager.flush_game_log,
+            config.game_log_flush_interval,
+        )
+    handlers.rooms_manager.SEARCH.start()
+    handlers.rooms_manager.SCHEDULER.call_later(
+        config.reaper_interval,
+        handlers.rooms_manager.reap_idle_rooms,
+        bot,
+        config.reaper_interval,
+    )
+    tasks = [
+        asyncio.create_task(
+            handlers.rooms_manager.run_matchmaking(bot, config.matchmaking_interval)
+        ),
+        asyncio.create_task(metrics.watch_loop_lag(config.loop_lag_interval)),
+    ]
+    if config.metrics_port:
+        # Profiles are taken on demand through the metrics server
+        profiler = ProfilerControl(os.path.join(os.path.dirname(os.path.abspath(__file__)), "log"))
+        tasks.append(
+            asyncio.create_task(
+                metrics.serve(config.metrics_host, config.metrics_port, setup=profiler.add_routes)
+            )
+        )
+    return tasks
+
+
+async def stop_background(bot: Bot, tasks: List[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await handlers.rooms_manager.SCHEDULER.close()
+    await handlers.rooms_manager.OUTBOX.close()
+    await handlers.rooms_manager.MANAGER.close()
+    await handlers.rooms_manager.SEARCH.close()
+    if WRITE_BEHIND is not None:
+        await WRITE_BEHIND.close()
+    if GAME_LOG is not None:
+        GAME_LOG.close()
+    await bot.session.close()
+
+
+async def run_bot() -> None:
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    if not config.webhook_url:
+        await bot(DeleteWebhook(drop_pending_updates=True))
+    background = start_background(bot)
+    try:
+        if config.webhook_url:
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(
+                bot,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+    finally:
+        await stop_background(bot, background)
+
+
+async def main() -> None:
+    path = os.path.abspath(os.path.dirname(__file__))
+    listener = setup_logging(
+        path + "/log/buchshot.log",
+        queue_size=config.log_queue_size,
+        sample_every=config.log_sample_every,
+    )
+    try:
+        await run_bot()
+    finally:
+        # Writes the records still queued
+        listener.stop()
+
@@ -0,0 +1,232 @@
+"""
+Local stand-in for the Telegram Bot API, to run the bot offline.
+
+It implements the few methods the bot uses (getMe, setWebhook, deleteWebhook, getUpdates,
+sendMessage, editMessageText), delivers updates either to the webhook the bot set or
+through getUpdates, and records every message the bot sends.
+
+Load test the webhook path from the `app` directory:
+    python -m benchmarks.fake_telegram --port 8081 --users 500 --rounds 4
+    API_BASE_URL=http://127.0.0.1:8081 WEBHOOK_URL=http://127.0.0.1:8080 python main.py
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def message_update(update_id: int, user_id: int, text: str, first_name: str = "Player") -> Dict[str, Any]:
+    """
+    Builds the update of a private text message.
+    """
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": first_name},
+            "from": {"id": user_id, "is_bot": False, "first_name": first_name},
+            "text": text,
+        },
+    }
+
+
+class FakeTelegram:
+    """
+    The fake Bot API server.
+
+    Attributes:
+    - sent (Dict[int, List[dict]]): Messages sent by the bot, by chat id.
+    - webhook_url (Optional[str]): The webhook set by the bot.
+    - calls (Dict[str, int]): Number of calls of every method.
+    - record (bool): Whether to keep the sent messages, off for long load tests.
+    """
+
+    def __init__(self, record: bool = True) -> None:
+        self.record = record
+        self.sent: Dict[int, List[dict]] = defaultdict(list)
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.webhook_set = asyncio.Event()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._updates: Deque[dict] = deque()
+        self._updates_ready = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._listeners: List[Callable[[int, dict], None]] = []
+        self._client: Optional[aiohttp.ClientSession] = None
+
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle)
+
+    def on_message(self, listener: Callable[[int, dict], None]):
+        """
+        Calls `listener(chat_id, message)` for every message the bot sends or edits.
+        """
+        self._listeners.append(listener)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        params = dict(await request.post()) if request.body_exists else {}
+        params.update(request.query)
+        handler = getattr(self, f"_{method}", None)
+        result = await handler(params) if handler is not None else True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _getme(self, params) -> dict:
+        return {"id": 1, "is_bot": True, "first_name": "Buckshot", "username": "fake_buckshot_bot"}
+
+    async def _setwebhook(self, params) -> bool:
+        self.webhook_url = params["url"]
+        self.webhook_secret = params.get("secret_token")
+        self.webhook_set.set()
+        return True
+
+    async def _deletewebhook(self, params) -> bool:
+        self.webhook_url = None
+        self.webhook_set.clear()
+        return True
+
+    async def _getupdates(self, params) -> List[dict]:
+        offset = int(params.get("offset", 0))
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, int(params.get("limit", 100))))
+
+    def _message(self, chat_id: int, text: str, message_id: Optional[int] = None) -> dict:
+        return {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Buckshot"},
+            "text": text,
+        }
+
+    def _notify(self, chat_id: int, message: dict, params: dict):
+        if "reply_markup" in params:
+            message["reply_markup"] = json.loads(params["reply_markup"])
+        if self.record:
+            self.sent[chat_id].append(message)
+        for listener in self._listeners:
+            listener(chat_id, message)
+
+    async def _sendmessage(self, params) -> dict:
+        chat_id = int(params["chat_id"])
+        message = self._message(chat_id, params["text"])
+        self._notify(chat_id, dict(message), params)
+        return message
+
+    async def _editmessagetext(self, params) -> dict:
+        chat_id = int(params["chat_id"])
+        message = self._message(chat_id, params["text"], int(params["message_id"]))
+        self._notify(chat_id, dict(message, edited=True), params)
+        return message
+
+    async def deliver(self, update: Dict[str, Any]):
+        """
+        Hands an update to the bot: posts it to the webhook if one is set, else queues it for getUpdates.
+        """
+        if self.webhook_url is None:
+            self._updates.append(update)
+            self._updates_ready.set()
+            return
+        if self._client is None:
+            self._client = aiohttp.ClientSession()
+        headers = {SECRET_HEADER: self.webhook_secret} if self.webhook_secret else {}
+        # Telegram retries failed deliveries, so does the stand-in
+        for attempt in range(5):
+            async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+                if response.status == 200:
+                    return
+            await asyncio.sleep(0.1 * 2**attempt)
+        raise RuntimeError(f"Webhook rejected update {update['update_id']}")
+
+    async def send_text(self, user_id: int, text: str, first_name: str = "Player"):
+        await self.deliver(message_update(next(self._update_ids), user_id, text, first_name))
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_load(port: int, users: int, rounds: int):
+    """
+    Waits for the bot to set its webhook, then every user sends /start `rounds` times.
+    Reports the time from delivering an update to the bot's reply.
+    """
+    fake = FakeTelegram()
+    runner = await fake.start(port=port)
+    print(f"Fake Bot API on http://127.0.0.1:{port}, waiting for the bot to set a webhook")
+    await fake.webhook_set.wait()
+
+    waiting: Dict[int, Deque[asyncio.Future]] = defaultdict(deque)
+
+    def on_message(chat_id: int, message: dict):
+        if waiting[chat_id]:
+            waiting[chat_id].popleft().set_result(time.perf_counter())
+
+    fake.on_message(on_message)
+
+    async def user(user_id: int) -> List[float]:
+        latencies = []
+        for _ in range(rounds):
+            reply = asyncio.get_running_loop().create_future()
+            waiting[user_id].append(reply)
+            start = time.perf_counter()
+            await fake.send_text(user_id, "/start")
+            latencies.append(await reply - start)
+        return latencies
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(user(10_000 + i) for i in range(users)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for result in results for latency in result]
+    print(
+        f"{len(latencies)} updates in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s), "
+        f"reply latency p50 {percentile(latencies, 0.5) * 1e3:.1f} ms, "
+        f"p95 {percentile(latencies, 0.95) * 1e3:.1f} ms, p99 {percentile(latencies, 0.99) * 1e3:.1f} ms"
+    )
+    await fake.close()
+    await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for offline load tests")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run_load(args.port, args.users, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+End-to-end load test: scripted players against the real bot and a fake Bot API.
+
+The fake Bot API from `benchmarks.fake_telegram` and the bot's own dispatcher, handlers
+and background tasks (`application.create_dispatcher`, `application.start_background`)
+run in this process. Every player is a coroutine reading the messages the bot sends to its chat:
+it looks for a game with /find, plays the moves offered by its keyboard, then either
+takes the /rematch button or leaves with /leave and looks for a new opponent. With
+`--solo`, a share of the players play /solo games against the dealer instead, whose
+moves are searched in the worker processes of the bot.
+
+Reported: updates handled per second, the time from delivering an update to the first
+message the bot sends back to that chat, and the memory taken per 1k live rooms (the
+RSS growth of the process, shard workers included, at the peak of live rooms). The fake
+API and the players share the bot's event loop and core, so the figures are a lower
+bound of what the bot alone sustains; compare them between releases, on the same host.
+
+Telegram's send limits are lifted unless `--telegram-limits` is given, so the bot
+itself is measured and not the outbox pacing. Environment variables still override.
+
+Run from the `app` directory:
+    python -m benchmarks.load_test --scenario smoke
+    python -m benchmarks.load_test --scenario release
+    python -m benchmarks.load_test --players 4000 --games 2 --rematch 0.5 --mode webhook
+    python -m benchmarks.load_test --scenario smoke --solo 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.fake_telegram import FakeTelegram, percentile
+from core.rng import SplitMix64, derive_seed
+
+# players, games per player, share of games followed by a rematch
+SCENARIOS = {
+    "smoke": (100, 2, 0.5),
+    "release": (2000, 3, 0.5),
+    "soak": (10000, 5, 0.8),
+}
+
+FIRST_CHAT_ID = 100_000
+WAIT_BUTTON = "🕓Please, wait🕓"
+
+
+def rss_bytes(pid: str = "self") -> int:
+    """
+    The resident memory of a process, from /proc where available.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak, not current, memory; in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LoadStats:
+    """
+    Counters shared by all players.
+    """
+
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.updates = 0
+        self.games = 0
+        self.rematches = 0
+        self.stalls = 0
+        self.players_left = 0
+
+
+class Player:
+    """
+    A scripted player driving one chat.
+
+    Args:
+    - fake (FakeTelegram): The fake Bot API to send updates through.
+    - chat_id (int): The chat and user id of the player.
+    - games (int): Games to play before leaving.
+    - rematch (float): Share of games followed by a rematch.
+    - think (float): Seconds between a message of the bot and the player's answer.
+    - timeout (float): Seconds without a message after which the player gives up.
+    - stats (LoadStats): Where to count.
+    - seed (int): Seed of the player's moves.
+    - solo (bool): Plays against the dealer with /solo.
+    """
+
+    def __init__(
+        self,
+        fake: FakeTelegram,
+        chat_id: int,
+        games: int,
+        rematch: float,
+        think: float,
+        timeout: float,
+        stats: LoadStats,
+        seed: int,
+        solo: bool = False,
+    ) -> None:
+        self.fake = fake
+        self.chat_id = chat_id
+        self.games = games
+        self.rematch = rematch
+        self.think = think
+        self.timeout = timeout
+        self.stats = stats
+        self.seed = seed
+        self.solo = solo
+        self.rng = SplitMix64(derive_seed(seed, chat_id))
+        self.inbox: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._sent_at: Optional[float] = None
+
+    def on_message(self, message: dict):
+        if message.get("edited"):
+            return
+        if self._sent_at is not None:
+            self.stats.latencies.append(time.perf_counter() - self._sent_at)
+            self._sent_at = None
+        self.inbox.put_nowait(message)
+
+    async def send(self, text: str):
+        await asyncio.sleep(self.think * self.rng.uniform(0.8, 1.2))
+        self._sent_at = time.perf_counter()
+        self.stats.updates += 1
+        await self.fake.send_text(self.chat_id, text, first_name=f"P{self.chat_id}")
+
+    async def receive(self, searching: bool = False) -> Optional[dict]:
+        """
+        The next message of the bot, None on timeout or, while searching, once nobody
+        else is left to play with.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0 or (searching and self.stats.players_left < 2):
+                return None
+            try:
+                return await asyncio.wait_for(self.inbox.get(), min(left, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    def choose_move(self, buttons: List[str]) -> str:
+        items = [text for text in buttons if text not in ("🔼", "🔽", WAIT_BUTTON)]
+        if items and self.rng.random() < 0.3:
+            return self.rng.choice(items)
+        return self.rng.choice(["🔼", "🔽"])
+
+    async def run(self):
+        try:
+            await self._run()
+        finally:
+            self.stats.players_left -= 1
+
+    async def _run(self):
+        played = 0
+        searching = not self.solo
+        await self.send("/solo" if self.solo else "/find")
+        while True:
+            message = await self.receive(searching)
+            if message is None:
+                if not searching or self.stats.players_left >= 2:
+                    self.stats.stalls += 1
+                await self.send("/leave")
+                return
+            text = message["text"]
+            keyboard = message.get("reply_markup", {}).get("keyboard", [])
+            buttons = [button["text"] for row in keyboard for button in row]
+
+            if "Nobody was found" in text:
+                await self.send("/find")
+            elif "has left the game" in text:
+                # The opponent gave up, start over
+                await self.send("/leave")
+                await self.receive()
+                await self.send("/find")
+                searching = True
+            elif "You died" in text or "you've won" in text:
+                played += 1
+                # A game between two players is counted by its winner
+                if "you've won" in text or self.solo:
+                    self.stats.games += 1
+                if played >= self.games:
+                    await self.send("/leave")
+                    return
+                if self.solo:
+                    await self.send("/solo")
+                    continue
+                rematch = next(text for text in buttons if text.startswith("/rematch"))
+                # Both players draw the same decision from the room id
+                room_id = int(rematch.split()[1])
+                if SplitMix64(derive_seed(self.seed, room_id)).random() < self.rematch:
+                    self.stats.rematches += 1
+                    await self.send(rematch)
+                else:
+                    await self.send("/leave")
+                    await self.receive()
+                    await self.send("/find")
+                    searching = True
+            elif "🔼" in buttons:
+                searching = False
+                await self.send(self.choose_move(buttons))
+            elif text == "Make a valid turn":
+                await self.send("🔼")
+            elif WAIT_BUTTON in buttons:
+                searching = False
+
+
+async def run(
+    players: int,
+    games: int,
+    rematch: float,
+    think: float,
+    timeout: float,
+    mode: str,
+    port: int,
+    telegram_limits: bool,
+    seed: int,
+    solo: float = 0.0,
+):
+    """
+    Runs the scenario and prints the report.
+    """
+    os.environ.setdefault("bot_token", "1:fake")
+    os.environ.setdefault("root_seed", str(seed))
+    os.environ["api_base_url"] = f"http://127.0.0.1:{port}"
+    if not telegram_limits:
+        os.environ.setdefault("send_rate_per_chat", "1000")
+        os.environ.setdefault("send_burst_per_chat", "1000")
+        os.environ.setdefault("send_rate_global", "1000000")
+    # The bot reads its configuration on import
+    import application
+    from handlers.rooms_manager import MANAGER, OUTBOX
+    from utils.webhook import WebhookServer
+
+    fake = FakeTelegram(record=False)
+    runner = await fake.start(port=port)
+    bot = application.create_bot()
+    dp = application.create_dispatcher()
+    background = application.start_background(bot)
+    if mode == "webhook":
+        server = WebhookServer(dp, bot, max_concurrency=application.config.webhook_max_concurrency)
+        await server.start("127.0.0.1", port + 1)
+        await bot.set_webhook(f"http://127.0.0.1:{port + 1}/webhook", secret_token=server.secret)
+        polling = None
+    else:
+        server = None
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+
+    stats = LoadStats()
+    stats.players_left = players
+    solo_players = round(players * solo)
+    scripted = [
+        Player(fake, FIRST_CHAT_ID + i, games, rematch, think, timeout, stats, seed, i < solo_players)
+        for i in range(players)
+    ]
+    by_chat: Dict[int, Player] = {player.chat_id: player for player in scripted}
+    fake.on_message(lambda chat_id, message: by_chat[chat_id].on_message(message))
+
+    def process_rss() -> int:
+        workers = getattr(MANAGER, "_processes", [])
+        return rss_bytes() + sum(rss_bytes(str(worker.pid)) for worker in workers)
+
+    await MANAGER.stats()
+    baseline = process_rss()
+    peak = {"live_rooms": 0, "rss": baseline}
+
+    async def sample():
+        while True:
+            await asyncio.sleep(0.5)
+            live = (await MANAGER.stats())["live_rooms"]
+            if live >= peak["live_rooms"]:
+                peak["live_rooms"] = live
+                peak["rss"] = process_rss()
+
+    sampler = asyncio.create_task(sample())
+    start = time.perf_counter()
+    await asyncio.gather(*(player.run() for player in scripted))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    latencies = sorted(stats.latencies)
+    growth = max(0, peak["rss"] - baseline)
+    per_1k = growth / peak["live_rooms"] * 1000 if peak["live_rooms"] else 0.0
+    print(
+        f"{players} players, {stats.games} games ({stats.rematches} rematch requests), "
+        f"{stats.stalls} stalled players, {elapsed:.1f}s"
+    )
+    print(
+        f"{stats.updates} updates ({stats.updates / elapsed:.0f}/s), "
+        f"{fake.calls['sendmessage']} messages and {fake.calls['editmessagetext']} edits sent"
+    )
+    print(
+        f"update-to-reply latency p50 {percentile(latencies, 0.5) * 1e3:.1f} ms, "
+        f"p95 {percentile(latencies, 0.95) * 1e3:.1f} ms, "
+        f"p99 {percentile(latencies, 0.99) * 1e3:.1f} ms"
+    )
+    print(
+        f"peak {peak['live_rooms']} live rooms, RSS {baseline / 2**20:.1f} -> "
+        f"{peak['rss'] / 2**20:.1f} MiB, {per_1k / 2**20:.2f} MiB per 1k rooms"
+    )
+    print(f"outbox {OUTBOX.stats()}, rooms {await MANAGER.stats()}")
+
+    if polling is not None:
+        await dp.stop_polling()
+        await polling
+    if server is not None:
+        await server.stop()
+    await application.stop_background(bot, background)
+    await fake.close()
+    await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the bot with scripted players")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="smoke")
+    parser.add_argument("--players", type=int, help="Overrides the scenario")
+    parser.add_argument("--games", type=int, help="Games per player, overrides the scenario")
+    parser.add_argument("--rematch", type=float, help="Share of rematches, overrides the scenario")
+    parser.add_argument("--think", type=float, default=0.8, help="Seconds before every answer")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds before a player gives up")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--port", type=int, default=8081, help="Fake Bot API port, the webhook uses the next one")
+    parser.add_argument("--telegram-limits", action="store_true", help="Keep the configured send limits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--solo", type=float, default=0.0, help="Share of players playing /solo")
+    args = parser.parse_args()
+
+    players, games, rematch = SCENARIOS[args.scenario]
+    asyncio.run(
+        run(
+            args.players or players,
+            args.games or games,
+            rematch if args.rematch is None else args.rematch,
+            args.think,
+            args.timeout,
+            args.mode,
+            args.port,
+            args.telegram_limits,
+            args.seed,
+            args.solo,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
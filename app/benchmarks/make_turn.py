@@ -0,0 +1,60 @@
+"""
+Measures the per-turn cost of Scene.make_turn over randomly played games.
+
+Run from the `app` directory:
+    python -m benchmarks.make_turn --games 2000
+"""
+
+import argparse
+import random
+import time
+
+from core.models.items import ItemType
+from core.models.player_model import PlayerModel
+from core.scene import Scene
+
+ITEMS = list(ItemType)
+
+
+def new_scene() -> Scene:
+    scene = Scene()
+    scene.add_player(PlayerModel(name="first", chat_id=1, hp=1, max_hp=1), player_seat=0)
+    scene.add_player(PlayerModel(name="second", chat_id=2, hp=1, max_hp=1), player_seat=1)
+    scene.start()
+    return scene
+
+
+def run(games: int, seed: int):
+    """
+    Plays games with random actions and times every make_turn call.
+
+    Returns:
+    - Tuple[int, float]: The number of turns and the total time spent in make_turn.
+    """
+    random.seed(seed)
+    turns = 0
+    elapsed = 0.0
+    for _ in range(games):
+        scene = new_scene()
+        while not scene.game_ended:
+            action = random.choice(["me", "him"]) if random.random() < 0.5 else random.choice(ITEMS)
+            player_id = scene.dealer.player_id
+            start = time.perf_counter()
+            scene.make_turn(action, player_id)
+            elapsed += time.perf_counter() - start
+            turns += 1
+    return turns, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Scene.make_turn")
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    turns, elapsed = run(args.games, args.seed)
+    print(f"{turns} turns in {elapsed:.3f}s: {elapsed / turns * 1e6:.2f} us/turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Load generator for the matchmaker: measures time-to-match and the cost of a tick.
+
+Players arrive as a Poisson process in simulated time, so hours of traffic run in
+seconds; only `Matchmaker.tick` is timed on the wall clock.
+
+Run from the `app` directory:
+    python -m benchmarks.matchmaking --players 100000 --rate 2000
+    python -m benchmarks.matchmaking --players 100000 --rate 50 --ratings
+"""
+
+import argparse
+import math
+import time
+
+from core.matchmaking import Matchmaker
+from core.rng import SplitMix64
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(players: int, rate: float, tick: float, timeout: float, ratings: bool, seed: int):
+    """
+    Feeds `players` /find requests arriving at `rate` per second into a matchmaker ticking
+    every `tick` seconds, with a chance of 1/20 that a waiting player cancels.
+
+    Returns:
+    - Tuple[List[float], Matchmaker, List[float]]: The sorted times-to-match, the matchmaker
+      and the wall-clock duration of every tick.
+    """
+    rng = SplitMix64(seed)
+    matchmaker = Matchmaker(timeout=timeout)
+    waits = []
+    tick_times = []
+    now = 0.0
+    next_tick = tick
+    user_id = 0
+    while user_id < players or len(matchmaker):
+        if user_id < players:
+            arrival = now - math.log(1.0 - rng.random()) / rate
+        else:
+            arrival = math.inf
+        while next_tick <= arrival and (user_id < players or len(matchmaker)):
+            start = time.perf_counter()
+            matches, _ = matchmaker.tick(next_tick)
+            tick_times.append(time.perf_counter() - start)
+            for first, second in matches:
+                waits.append(next_tick - first.since)
+                waits.append(next_tick - second.since)
+            next_tick += tick
+        if user_id >= players:
+            break
+        now = arrival
+        rating = int(rng.normalvariate(1500, 300)) if ratings else None
+        matchmaker.enqueue(user_id, rating=max(0, rating) if ratings else None, now=now)
+        if rng.randbelow(20) == 0:
+            matchmaker.cancel(rng.randbelow(user_id + 1))
+        user_id += 1
+    waits.sort()
+    return waits, matchmaker, tick_times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the matchmaker")
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--rate", type=float, default=1000.0, help="Arrivals per second")
+    parser.add_argument("--tick", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--ratings", action="store_true", help="Draw ratings around 1500")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    waits, matchmaker, tick_times = run(
+        args.players, args.rate, args.tick, args.timeout, args.ratings, args.seed
+    )
+    stats = matchmaker.stats()
+    print(
+        f"matched {stats['matched']}, expired {stats['expired']}, cancelled {stats['cancelled']}"
+    )
+    print(
+        f"time to match: p50 {percentile(waits, 0.5):.2f}s, p95 {percentile(waits, 0.95):.2f}s, "
+        f"p99 {percentile(waits, 0.99):.2f}s, max {percentile(waits, 1.0):.2f}s"
+    )
+    total = sum(tick_times)
+    print(
+        f"{len(tick_times)} ticks in {total:.3f}s: max {max(tick_times, default=0) * 1e3:.2f} ms, "
+        f"{total / max(1, stats['matched']) * 1e6:.2f} us per matched player"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+Micro-benchmarks of the engine hot paths, with JSON baselines to compare against.
+
+Every case builds a batch of fresh, seeded states outside the timer and times one
+operation on each of them, so state-changing calls (using an item, recharging) are
+measured on realistic states and the timer overhead is paid once per batch. A case is
+run `--repeat` times; the best time per operation is the one compared, the median is
+kept for reference. Every report also records the speed of the host on a fixed loop,
+and `compare` scales the times by it, so a host that is faster or slower as a whole
+does not read as a change of the engine.
+
+Run from the `app` directory:
+    python -m benchmarks.micro run
+    python -m benchmarks.micro run --filter use_item --save /tmp/items.json
+    python -m benchmarks.micro save                      # writes benchmarks/baselines/engine.json
+    python -m benchmarks.micro save --filter knowledge   # adds or updates these cases only
+    python -m benchmarks.micro compare                   # runs now, compares with the baseline
+    python -m benchmarks.micro compare --current /tmp/after.json --threshold 0.15
+
+`compare` exits with status 1 if a case got slower than the baseline by more than the
+threshold, so it can gate CI on a stable runner. Cases without a baseline are listed,
+and fail the comparison as well with `--strict`: a new case is added to the baseline
+with `save --filter` in the change that registers it.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.knowledge import Knowledge
+from core.models.items import ItemType
+from core.models.player_model import PlayerModel
+from core.models.turn_model import Dealer, TurnResult
+from core.packed import pack_scene, unpack_scene
+from core.player import Player
+from core.rng import SplitMix64, derive_seed
+from core.scene import Scene
+from core.shotgun import Shotgun
+from core.snapshot import dump_scene, load_scene
+from core.use_item import use_item
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "engine.json")
+
+# name -> (setup(seed) -> state, operation(state))
+CASES: Dict[str, Tuple[Callable[[int], Any], Callable[[Any], Any]]] = {}
+
+
+def case(name: str, setup: Callable[[int], Any]):
+    """
+    Registers the decorated operation as a benchmark case.
+    """
+
+    def register(operation: Callable[[Any], Any]):
+        CASES[name] = (setup, operation)
+        return operation
+
+    return register
+
+
+def new_scene(seed: int) -> Scene:
+    scene = Scene(seed=seed)
+    scene.add_player(PlayerModel(name="first", chat_id=1, hp=1, max_hp=1), player_seat=0)
+    scene.add_player(PlayerModel(name="second", chat_id=2, hp=1, max_hp=1), player_seat=1)
+    return scene
+
+
+def started_scene(seed: int, item: Optional[ItemType] = None) -> Scene:
+    """
+    A started scene, the active player holding `item` if given.
+    """
+    scene = new_scene(seed)
+    scene.start()
+    if item is not None:
+        player, _ = scene.solve_players()
+        if not player.get_number_of_item(item):
+            # Start items never fill the inventory, there is always room for one more
+            player.add_item(item)
+    return scene
+
+
+def loaded_shotgun(seed: int) -> Shotgun:
+    shotgun = Shotgun(rng=SplitMix64(seed))
+    shotgun.recharge()
+    return shotgun
+
+
+def item_args(seed: int, item: ItemType) -> tuple:
+    scene = started_scene(seed, item)
+    player, target = scene.solve_players()
+    return item, player, target, scene.dealer, scene.shotgun
+
+
+def player_with_items(seed: int) -> Player:
+    rng = SplitMix64(seed)
+    player = Player(PlayerModel(name="first", chat_id=1, hp=4, max_hp=4))
+    for _ in range(1 + rng.randbelow(8)):
+        player.add_item(rng.choice(Scene.ITEMS))
+    return player
+
+
+def seen_loadout(seed: int) -> Knowledge:
+    # A full loadout with two shells seen, as after a glass and a phone
+    knowledge = Knowledge(4, 4)
+    knowledge.reveal(7, seed % 2 == 0)
+    knowledge.reveal(seed % 7, True)
+    return knowledge
+
+
+case("scene.start", new_scene)(lambda scene: scene.start())
+
+for action in ("me", "him"):
+    case(f"scene.make_turn[{action}]", started_scene)(
+        lambda scene, action=action: scene.make_turn(action, scene.dealer.player_id)
+    )
+
+for item in ItemType:
+    case(f"scene.make_turn[{item.name}]", lambda seed, item=item: started_scene(seed, item))(
+        lambda scene, item=item: scene.make_turn(item, scene.dealer.player_id)
+    )
+    case(f"use_item[{item.name}]", lambda seed, item=item: item_args(seed, item))(
+        lambda args: use_item(*args)
+    )
+
+case("shotgun.recharge", lambda seed: Shotgun(rng=SplitMix64(seed)))(
+    lambda shotgun: shotgun.recharge()
+)
+case("shotgun.invert", loaded_shotgun)(lambda shotgun: shotgun.invert())
+case("shotgun.get_ammo_sorted", loaded_shotgun)(lambda shotgun: shotgun.get_ammo_sorted())
+
+case("dealer.extend_turn", lambda seed: Dealer(1, 2, rng=SplitMix64(seed)))(
+    lambda dealer: dealer.extend_turn()
+)
+case("dealer.use_items", lambda seed: Dealer(1, 2, rng=SplitMix64(seed)))(
+    lambda dealer: dealer.use_items(ItemType.BEER)
+)
+
+case("player.get_items_emoji", player_with_items)(lambda player: player.get_items_emoji())
+
+case("packed.pack_scene", started_scene)(pack_scene)
+case("packed.unpack_scene", lambda seed: (pack_scene(started_scene(seed)), started_scene(seed + 1)))(
+    lambda args: unpack_scene(*args)
+)
+case("packed.hash", lambda seed: pack_scene(started_scene(seed)))(hash)
+case("snapshot.dump_scene", started_scene)(dump_scene)
+case("snapshot.load_scene", lambda seed: dump_scene(started_scene(seed)))(load_scene)
+
+case("knowledge.eject", seen_loadout)(lambda knowledge: knowledge.eject(True))
+case("knowledge.invert", seen_loadout)(lambda knowledge: knowledge.invert())
+case("knowledge.live_chance", seen_loadout)(lambda knowledge: knowledge.live_chance(3))
+case("knowledge.live_chances", seen_loadout)(lambda knowledge: knowledge.live_chances())
+
+case("turn_result.empty", lambda seed: None)(lambda _: TurnResult())
+case("turn_result.full", lambda seed: None)(
+    lambda _: TurnResult(
+        first_player_hp="first : ⚡️⚡️⚡️\n",
+        second_player_hp="second : ⚡️⚡️\n",
+        first_player_items=["🍺x1", "🔍x2"],
+        second_player_items=["🚬x1"],
+        rounds="Loadout: 💥, 💥, 🫧",
+        active_player_action_result="You shot with a 💥",
+        passive_player_action_result="first shot with a 💥 to you",
+        give_turn=True,
+        next_turn=1,
+    )
+)
+
+
+def measure(
+    setup: Callable[[int], Any],
+    operation: Callable[[Any], Any],
+    number: int,
+    seed: int,
+) -> float:
+    """
+    Times `operation` on `number` fresh states.
+
+    Returns:
+    - float: Nanoseconds per operation.
+    """
+    states = [setup(derive_seed(seed, i)) for i in range(number)]
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter_ns()
+        for state in states:
+            operation(state)
+        elapsed = time.perf_counter_ns() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return elapsed / number
+
+
+def calibrate() -> float:
+    """
+    Nanoseconds per iteration of a fixed pure-Python loop, the speed of the host at the time.
+    """
+    start = time.perf_counter_ns()
+    total = 0
+    for i in range(200_000):
+        total += i & 7
+    return (time.perf_counter_ns() - start) / 200_000
+
+
+def run(pattern: Optional[str], number: int, repeat: int, seed: int) -> Dict[str, Any]:
+    """
+    Runs the cases whose name matches `pattern` and prints a line per case.
+    Repetitions are interleaved across cases, so a slow spell of the host spreads over
+    all of them instead of hitting a few.
+
+    Returns:
+    - Dict[str, Any]: The results, in the format of the baseline files.
+    """
+    cases = [(name, case) for name, case in CASES.items() if not pattern or re.search(pattern, name)]
+    times: Dict[str, List[float]] = {name: [] for name, _ in cases}
+    calibration = []
+    for round_ in range(repeat):
+        calibration.append(calibrate())
+        for name, (setup, operation) in cases:
+            times[name].append(measure(setup, operation, number, derive_seed(seed, round_)))
+
+    results = {}
+    for name, _ in cases:
+        best, median = min(times[name]), statistics.median(times[name])
+        results[name] = {"best_ns": best, "median_ns": median}
+        print(f"{name:<36} {best:>10.0f} ns  (median {median:.0f} ns)")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "calibration_ns": min(calibration),
+            "number": number,
+            "repeat": repeat,
+            "seed": seed,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def save(report: Dict[str, Any], path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Saved {len(report['results'])} results to {path}")
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float,
+    normalize: bool = True,
+) -> List[str]:
+    """
+    Compares the best times of two reports and prints a line per common case.
+    With `normalize`, the current times are first scaled by the calibration of both
+    reports, which cancels a host running faster or slower as a whole.
+
+    Returns:
+    - List[str]: The cases slower than the baseline by more than `threshold`.
+    """
+    regressions = []
+    base, now = baseline["results"], current["results"]
+    # Times are compared relative to the speed of the host when they were taken
+    scale = 1.0
+    if normalize and baseline["meta"].get("calibration_ns") and current["meta"].get("calibration_ns"):
+        scale = baseline["meta"]["calibration_ns"] / current["meta"]["calibration_ns"]
+        print(f"Host speed relative to the baseline: {scale:.2f}x")
+    for name in sorted(base.keys() & now.keys()):
+        ratio = now[name]["best_ns"] * scale / base[name]["best_ns"]
+        if ratio > 1 + threshold:
+            verdict = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            verdict = "faster"
+        else:
+            verdict = ""
+        print(
+            f"{name:<36} {base[name]['best_ns']:>10.0f} -> {now[name]['best_ns']:>10.0f} ns "
+            f"{ratio - 1:>+7.1%}  {verdict}"
+        )
+    for name in sorted(base.keys() - now.keys()):
+        print(f"{name:<36} missing from the current results")
+    for name in sorted(now.keys() - base.keys()):
+        print(f"{name:<36} not in the baseline")
+    if baseline["meta"].get("python") != current["meta"].get("python"):
+        print(
+            f"Note: baseline on Python {baseline['meta'].get('python')}, "
+            f"current on {current['meta'].get('python')}"
+        )
+    return regressions
+
+
+def merge_best(report: Dict[str, Any], again: Dict[str, Any]):
+    """
+    Keeps in `report` the better time of every case measured again, at the host speed of `report`.
+    """
+    scale = report["meta"]["calibration_ns"] / again["meta"]["calibration_ns"]
+    for name, result in again["results"].items():
+        previous = report["results"][name]
+        if result["best_ns"] * scale < previous["best_ns"]:
+            previous["best_ns"] = result["best_ns"] * scale
+            previous["median_ns"] = result["median_ns"] * scale
+
+
+def merge_into(baseline: Dict[str, Any], report: Dict[str, Any]):
+    """
+    Adds the cases of `report` to `baseline`, or replaces them, at the host speed of `baseline`.
+    """
+    scale = baseline["meta"]["calibration_ns"] / report["meta"]["calibration_ns"]
+    for name, result in report["results"].items():
+        baseline["results"][name] = dict(
+            result, best_ns=result["best_ns"] * scale, median_ns=result["median_ns"] * scale
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the engine")
+    parser.add_argument("command", choices=["run", "save", "compare"])
+    parser.add_argument("--filter", help="Only the cases matching this regular expression")
+    parser.add_argument("--number", type=int, default=1000, help="Operations per repetition")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Where `run` writes its results")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--current", help="Results to compare instead of running now")
+    parser.add_argument("--raw", action="store_true", help="Compare without the calibration")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Tolerated slowdown, 0.15 is 15%%")
+    parser.add_argument("--strict", action="store_true", help="Cases without a baseline fail the comparison")
+    args = parser.parse_args()
+
+    if args.command == "compare" and args.current:
+        current = load(args.current)
+    else:
+        current = run(args.filter, args.number, args.repeat, args.seed)
+
+    if args.command == "run" and args.save:
+        save(current, args.save)
+    elif args.command == "save":
+        if args.filter and os.path.exists(args.baseline):
+            # Only the filtered cases were measured, the others keep their baseline
+            baseline = load(args.baseline)
+            merge_into(baseline, current)
+            current = baseline
+        save(current, args.baseline)
+    elif args.command == "compare":
+        baseline = load(args.baseline)
+        print()
+        regressions = compare(baseline, current, args.threshold, not args.raw)
+        if regressions and not args.current:
+            # On a shared host a regression is often a slow spell: measure the suspects again
+            print(f"\nMeasuring {len(regressions)} cases again")
+            pattern = "^(" + "|".join(re.escape(name) for name in regressions) + ")$"
+            merge_best(current, run(pattern, args.number, args.repeat, args.seed + 1))
+            print()
+            regressions = compare(baseline, current, args.threshold, not args.raw)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        missing = sorted(current["results"].keys() - baseline["results"].keys())
+        if missing and args.strict:
+            print(f"{len(missing)} cases not in the baseline: {', '.join(missing)}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Import-time benchmark of the bot and of the engine alone, with budgets.
+
+Every target is imported in a fresh interpreter, `--repeat` times, and the best wall
+time of the import is compared to its budget; the first runs also warm the disk cache.
+The engine target is what a rooms or simulation worker loads: it must not pull in the
+modules of the bot at all. With `--top`, the slowest modules are listed from one more
+run under `python -X importtime`, by their own import time.
+
+The budgets were agreed on a single-vCPU host, where aiogram alone takes most of the
+bot's time: its types are pydantic models built on import.
+
+Run from the `app` directory:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --target engine --top 15
+    python -m benchmarks.startup --scale 2       # budgets doubled, for a slow host
+
+Exits with status 1 if a target is over its budget or loads a forbidden module.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Target(NamedTuple):
+    # Modules imported, as in an import statement
+    modules: str
+    # Seconds of the best run
+    budget: float
+    # Modules that must not be loaded by the import
+    forbidden: Tuple[str, ...] = ()
+
+
+TARGETS: Dict[str, Target] = {
+    "bot": Target("application", 4.5),
+    # A spawned rooms worker imports `main` again before running `core.sharding`
+    "engine": Target(
+        "main, core.room_manager, core.sharding, core.simulation",
+        0.4,
+        forbidden=("aiogram", "aiohttp", "pydantic_settings", "numpy", "config", "handlers"),
+    ),
+}
+
+SCRIPT = """
+import sys, time, json
+started = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def measure(target: Target, importtime: bool = False) -> Tuple[dict, str]:
+    """
+    Imports `target` in a new interpreter.
+
+    Returns:
+    - Tuple[dict, str]: The seconds and the forbidden modules loaded, and the
+      `-X importtime` report if asked for.
+    """
+    env = dict(os.environ)
+    # The configuration is read on import, any token will do
+    env.setdefault("bot_token", "1:startup")
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", SCRIPT.format(modules=target.modules, forbidden=target.forbidden)]
+    result = subprocess.run(command, cwd=APP, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest(report: str, top: int) -> List[Tuple[int, int, str]]:
+    """
+    The `top` modules with the longest own import time in an `-X importtime` report.
+
+    Returns:
+    - List[Tuple[int, int, str]]: Own and cumulative microseconds and the module name.
+    """
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        modules.append((int(own), int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import time of the bot and the engine")
+    parser.add_argument("--target", choices=sorted(TARGETS), action="append")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the budgets")
+    parser.add_argument("--top", type=int, default=0, help="List the slowest modules")
+    args = parser.parse_args()
+
+    failures = []
+    for name in args.target or sorted(TARGETS):
+        target = TARGETS[name]
+        budget = target.budget * args.scale
+        times, loaded = [], []
+        for _ in range(args.repeat):
+            result, _ = measure(target)
+            times.append(result["seconds"])
+            loaded = result["loaded"]
+        best = min(times)
+        verdict = "ok" if best <= budget else "OVER BUDGET"
+        print(
+            f"{name:<8} {best * 1e3:>8.0f} ms  (median {statistics.median(times) * 1e3:.0f} ms, "
+            f"budget {budget * 1e3:.0f} ms)  {verdict}"
+        )
+        if best > budget:
+            failures.append(name)
+        if loaded:
+            print(f"{name:<8} loads {', '.join(loaded)}")
+            failures.append(name)
+        if args.top:
+            # Measured apart, -X importtime slows the import down
+            _, report = measure(target, importtime=True)
+            for own, cumulative, module in slowest(report, args.top):
+                print(f"    {own / 1e3:>8.1f} ms  {cumulative / 1e3:>8.1f} ms  {module}")
+
+    if failures:
+        print(f"Failed: {', '.join(sorted(set(failures)))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import SecretStr
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -7,6 +8,60 @@ load_dotenv()
 
 class Settings(BaseSettings):
     bot_token: SecretStr
+    # Root of all per-room random streams. Random on every start if not set
+    root_seed: Optional[int] = None
+    # Binary game log used for replays, disabled if not set. Buffered records are
+    # written to the file at the end of every game and at least once per interval
+    game_log_path: Optional[str] = None
+    game_log_flush_interval: float = 1.0
+    # SQLite file persisting FSM states and rooms across restarts, in memory if not set
+    storage_path: Optional[str] = None
+    storage_flush_interval: float = 1.0
+    # Number of worker processes running the rooms, 0 keeps the rooms in the bot process.
+    # Persistent rooms are only supported in the bot process
+    shards: int = 0
+    # Rooms without activity for this many seconds are closed
+    room_idle_timeout: float = 3600.0
+    reaper_interval: float = 60.0
+    # Players looking for a game are paired every interval and give up after the timeout
+    matchmaking_interval: float = 0.5
+    matchmaking_timeout: float = 300.0
+    # Outgoing messages per second per chat (with bursts) and for the whole bot
+    send_rate_per_chat: float = 1.0
+    send_burst_per_chat: float = 3.0
+    send_rate_global: float = 30.0
+    # Bot API server, e.g. a local stand-in for load tests. The official one if not set
+    api_base_url: Optional[str] = None
+    # Public URL Telegram posts updates to. Long polling is used if not set
+    webhook_url: Optional[str] = None
+    webhook_path: str = "/webhook"
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    # Token Telegram sends with every update, random on every start if not set
+    webhook_secret: Optional[SecretStr] = None
+    # Updates processed at the same time in webhook mode. Updates of one room always
+    # run one by one, see middlewares.room_order
+    webhook_max_concurrency: int = 1024
+    # Seconds to finish the updates in flight on shutdown
+    webhook_drain_timeout: float = 30.0
+    # Updates of one room waiting their turn, more are dropped
+    room_queue_size: int = 16
+    # The same text from a chat within this many seconds, while the first one is not
+    # answered yet, is a double tap and is dropped
+    duplicate_tap_window: float = 0.5
+    # Prometheus metrics on http://metrics_host:metrics_port/metrics, off if no port
+    metrics_host: str = "127.0.0.1"
+    metrics_port: Optional[int] = 9464
+    loop_lag_interval: float = 0.5
+    # Updates slower than this many seconds are logged with their engine and send time
+    slow_update_threshold: float = 0.5
+    # Processes searching the moves of /solo dealers, and the seconds each move may take
+    solo_workers: int = 1
+    solo_move_budget: float = 0.2
+    # Log records waiting for the writer thread, more are dropped
+    log_queue_size: int = 10000
+    # Only one in this many per-update and unhandled-message records is logged
+    log_sample_every: int = 100
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,258 @@
+"""
+Consistency checks over seeded random games.
+
+The engine, the game log and the players' knowledge each mirror the scene's rules on
+their own, so a change to one of them can silently drift from the others. Every check
+plays random games and raises `CheckFailed` on the first mismatch:
+
+- replay: scenes are recorded into a `GameLogWriter` and every game of the file is
+  replayed with the headless engine, down to the final HP and the winner.
+- snapshot: every game is saved with `dump_scene` at a random turn and the restored
+  scene plays the rest of it next to the original, which it must match move by move:
+  same messages and same packed state.
+- knowledge: what every player knows of the shells, followed by `Knowledge` from the
+  engine events of random games and by `RoomsManager` through scene games, is checked
+  after every move against the shells actually loaded: counts, seen shells and the
+  chance of every shell to be live.
+
+Run from the `app` directory:
+    python -m core.checks                      # every check
+    python -m core.checks replay --games 3000
+    python -m core.checks snapshot
+    python -m core.checks knowledge --games 3000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from core.engine import legal_actions, new_game, step
+from core.game_log import GameLogWriter, ReplayMismatch, read_games, replay
+from core.knowledge import Knowledge
+from core.models.ammo import AmmoType
+from core.models.items import ItemType
+from core.models.player_model import PlayerModel
+from core.packed import pack_scene
+from core.rng import SplitMix64, derive_seed
+from core.room_manager import RoomsManager
+from core.scene import Scene
+from core.snapshot import dump_scene, load_scene
+
+ITEMS = list(ItemType)
+
+
+class CheckFailed(Exception):
+    """
+    Raised when a check finds a mismatch.
+    """
+
+
+def new_scene(seed: int, log: Optional[GameLogWriter] = None) -> Scene:
+    scene = Scene(seed=seed, log=log)
+    scene.add_player(PlayerModel(name="first", chat_id=1, hp=1, max_hp=1), player_seat=0)
+    scene.add_player(PlayerModel(name="second", chat_id=2, hp=1, max_hp=1), player_seat=1)
+    scene.start()
+    return scene
+
+
+def random_action(rng: SplitMix64):
+    """
+    A shot half of the time, an item otherwise, whether the player has it or not.
+    """
+    if rng.random() < 0.5:
+        return rng.choice(["me", "him"])
+    return rng.choice(ITEMS)
+
+
+def play_random(scene: Scene, rng: SplitMix64):
+    """
+    Plays the game of a started scene to its end with random actions.
+    """
+    while not scene.game_ended:
+        scene.make_turn(random_action(rng), scene.dealer.player_id)
+
+
+def check_replay(games: int, seed: int):
+    """
+    Records random scene games and replays every one of them from the log.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "games.bin")
+        log = GameLogWriter(path)
+        final_hp: Dict[int, list] = {}
+        for game in range(games):
+            scene = new_scene(derive_seed(seed, game), log)
+            play_random(scene, SplitMix64(derive_seed(seed + 1, game)))
+            final_hp[scene.recorder.game_id] = [
+                scene.first_player.data.hp,
+                scene.second_player.data.hp,
+            ]
+        log.close()
+
+        recorded = read_games(path)
+        if recorded.keys() != final_hp.keys():
+            raise CheckFailed(f"{len(final_hp)} games played, {len(recorded)} in the log")
+        for game_id, records in recorded.items():
+            state = None
+            try:
+                for _, state, _ in replay(records):
+                    pass
+            except ReplayMismatch as e:
+                raise CheckFailed(str(e)) from e
+            if state.hp != final_hp[game_id]:
+                raise CheckFailed(
+                    f"Game {game_id} ends with {state.hp} HP, the scene with {final_hp[game_id]}"
+                )
+            if state.winner != (0 if final_hp[game_id][0] else 1):
+                raise CheckFailed(f"Game {game_id}: seat {state.winner} wins the replay")
+
+
+def check_snapshot(games: int, seed: int):
+    """
+    Restores random scene games from a snapshot taken mid-game and plays both copies on.
+    """
+    for game in range(games):
+        scene = new_scene(derive_seed(seed, game))
+        rng = SplitMix64(derive_seed(seed + 1, game))
+        while not scene.game_ended and rng.random() < 0.9:
+            scene.make_turn(random_action(rng), scene.dealer.player_id)
+        data = dump_scene(scene)
+        restored = load_scene(data)
+        if dump_scene(restored) != data:
+            raise CheckFailed(f"Game {game}: the restored scene does not dump the same")
+        moves = 0
+        while not scene.game_ended:
+            action = random_action(rng)
+            expected = scene.make_turn(action, scene.dealer.player_id)
+            if restored.game_ended:
+                raise CheckFailed(f"Game {game}: the restored scene has ended {moves} moves early")
+            result = restored.make_turn(action, restored.dealer.player_id)
+            moves += 1
+            if (
+                result.active_player_action_result != expected.active_player_action_result
+                or result.passive_player_action_result != expected.passive_player_action_result
+                # Whole snapshots differ by the wall-clock end of the adrenaline effect
+                or pack_scene(restored) != pack_scene(scene)
+            ):
+                raise CheckFailed(f"Game {game}: the restored scene diverges after {moves} moves")
+        if not restored.game_ended:
+            raise CheckFailed(f"Game {game}: the restored scene goes on after the end")
+
+
+def _check_knowledge(knowledge: Knowledge, rounds: List[bool], where: str):
+    """
+    Checks a player's knowledge against the loaded shells, True for live, next shell last.
+    """
+    live = sum(rounds)
+    blank = len(rounds) - live
+    if (knowledge.length, knowledge.live, knowledge.blank) != (len(rounds), live, blank):
+        raise CheckFailed(
+            f"{where}: {knowledge.live} live and {knowledge.blank} blank known, "
+            f"{live} and {blank} loaded"
+        )
+    known = knowledge.known()
+    if any(rounds[index] != shell for index, shell in known):
+        raise CheckFailed(f"{where}: seen shells {known}, loaded {rounds}")
+    seen_live = sum(1 for _, shell in known if shell)
+    if (knowledge.seen_live, knowledge.seen_blank) != (seen_live, len(known) - seen_live):
+        raise CheckFailed(f"{where}: seen counts do not match the seen shells {known}")
+
+    unseen = len(rounds) - len(known)
+    share = (live - seen_live) / unseen if unseen else 0.0
+    chances = knowledge.live_chances()
+    seen = dict(known)
+    for position, chance in enumerate(chances):
+        index = len(rounds) - 1 - position
+        expected = float(seen[index]) if index in seen else share
+        if abs(chance - expected) > 1e-9 or abs(knowledge.live_chance(position) - expected) > 1e-9:
+            raise CheckFailed(f"{where}: shell {position} is live with {chance}, not {expected}")
+    if len(chances) != len(rounds) or abs(sum(chances) - live) > 1e-9:
+        raise CheckFailed(f"{where}: the chances {chances} do not add up to {live} live shells")
+
+
+def check_knowledge(games: int, seed: int):
+    """
+    Follows the knowledge of both players in random engine games and scene games.
+    """
+    for game in range(games):
+        rng = SplitMix64(derive_seed(seed + 1, game))
+        state, events = new_game(derive_seed(seed, game))
+        knowledge = [Knowledge(), Knowledge()]
+        moves = 0
+        while True:
+            for seat in (0, 1):
+                knowledge[seat].apply(events, seat)
+                if not state.is_over:
+                    _check_knowledge(
+                        knowledge[seat], state.rounds, f"Engine game {game}, move {moves}"
+                    )
+            if state.is_over:
+                break
+            state, events = step(state, rng.choice(legal_actions(state)))
+            moves += 1
+
+    manager = RoomsManager(root_seed=seed)
+    for game in range(games):
+        rng = SplitMix64(derive_seed(seed + 2, game))
+        room_id = manager.new_room_id()
+        manager.join_room(room_id, "first", 1)
+        manager.join_room(room_id, "second", 2)
+        room = manager.get_room(room_id)
+        moves = 0
+        while True:
+            outcome = manager.play_turn(room.dealer.player_id, random_action(rng))
+            moves += 1
+            if outcome.winner_id is not None:
+                break
+            rounds = [shell == AmmoType.LIVE for shell in room.shotgun.rounds]
+            for chat_id in (1, 2):
+                _check_knowledge(
+                    manager.knowledge[chat_id], rounds, f"Scene game {game}, move {moves}"
+                )
+
+
+# name -> check(games, seed), with the default number of games
+CHECKS: Dict[str, Callable[[int, int], None]] = {
+    "replay": check_replay,
+    "snapshot": check_snapshot,
+    "knowledge": check_knowledge,
+}
+DEFAULT_GAMES = {
+    "replay": 3000,
+    "snapshot": 1000,
+    "knowledge": 1000,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Consistency checks over seeded random games")
+    parser.add_argument(
+        "checks", nargs="*", help=f"Any of {', '.join(CHECKS)}, all of them if none"
+    )
+    parser.add_argument("--games", type=int, help="Games per check, overrides the defaults")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    unknown = set(args.checks) - CHECKS.keys()
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+
+    failed = 0
+    for name in args.checks or sorted(CHECKS):
+        games = args.games or DEFAULT_GAMES[name]
+        started = time.perf_counter()
+        try:
+            CHECKS[name](games, args.seed)
+        except CheckFailed as e:
+            failed += 1
+            print(f"{name:<10} FAILED: {e}")
+            continue
+        print(f"{name:<10} ok, {games} games in {time.perf_counter() - started:.1f}s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+Headless game engine.
+
+A string-free re-implementation of the rules played by `Scene`, `Shotgun`,
+`Player`, `Dealer` and `use_item`, designed for bulk simulation and bot training.
+The game is a plain `GameState` value and `step(state, action)` is a pure reducer
+returning the next state together with a list of compact `(EventType, seat, value)`
+events. Randomness comes from a `SplitMix64` stream stored inside the state, so
+a game is fully determined by its seed and the actions played.
+
+Differences from the interactive `Scene`:
+- There is no wall clock, so the 5 second adrenaline window is not enforced.
+- HP never drops below zero.
+"""
+
+from enum import IntEnum
+from typing import List, Tuple, Union
+
+from core.models.items import ITEM_INDEX, N_ITEMS, ItemType
+from core.rng import SplitMix64
+
+ITEMS = tuple(ItemType)
+MAX_ITEMS = 8
+
+HANDSAW = ITEM_INDEX[ItemType.HANDSAW]
+BEER = ITEM_INDEX[ItemType.BEER]
+SMOKE = ITEM_INDEX[ItemType.SMOKE]
+HANDCUFF = ITEM_INDEX[ItemType.HANDCUFF]
+GLASS = ITEM_INDEX[ItemType.GLASS]
+PHONE = ITEM_INDEX[ItemType.PHONE]
+PILLS = ITEM_INDEX[ItemType.PILLS]
+ADRENALINE = ITEM_INDEX[ItemType.ADRENALINE]
+INVERTER = ITEM_INDEX[ItemType.INVERTER]
+
+# Same order as Scene.ITEMS, so equal random streams draw equal items
+ITEM_POOL = (HANDSAW, BEER, PILLS, PHONE, ADRENALINE, HANDCUFF, SMOKE, GLASS, INVERTER)
+ITEM_DRAWS_ON_START = (1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 3, 4)
+ITEM_DRAWS_ON_RECHARGE = (1, 1, 1, 1, 2, 2, 2, 3, 3, 4)
+PILLS_OUTCOMES = (1, 1, 2, 2, 2)
+
+
+class Action(IntEnum):
+    """
+    Actions available to the active player. Item actions follow the `ItemType` order.
+    """
+
+    SHOOT_OPPONENT = 0
+    SHOOT_SELF = 1
+    HANDSAW = 2
+    BEER = 3
+    SMOKE = 4
+    HANDCUFF = 5
+    GLASS = 6
+    PHONE = 7
+    PILLS = 8
+    ADRENALINE = 9
+    INVERTER = 10
+
+
+ITEM_ACTION_OFFSET = Action.HANDSAW
+N_ACTIONS = len(Action)
+
+# Flag OR-ed into an item action when the 5 second adrenaline window of an
+# interactive game ran out before the item was picked. Used to replay recorded games.
+ADRENALINE_EXPIRED = 1 << 7
+
+
+class EventType(IntEnum):
+    """
+    Kinds of events emitted by the engine. Every event is a `(kind, seat, value)` tuple.
+
+    - GAME_START: seat is the starting player, value is the starting HP.
+    - LOADOUT: seat is -1, value is `live << 4 | blank`.
+    - ITEM_DRAWN: value is the item index.
+    - SHOT_SELF / SHOT_OPPONENT: seat is the shooter, value is the damage dealt (0 for a blank).
+    - ITEM_USED / ITEM_REJECTED: value is the item index.
+    - SHELL_EJECTED: value is 1 for a live shell, 0 for a blank.
+    - SHELL_REVEALED: value is `position << 1 | live`, position 0 being the next shell.
+    - HP_CHANGED: value is the new HP of the seat.
+    - GAME_END: seat is the winner.
+    """
+
+    GAME_START = 0
+    LOADOUT = 1
+    ITEM_DRAWN = 2
+    SHOT_SELF = 3
+    SHOT_OPPONENT = 4
+    ITEM_USED = 5
+    ITEM_REJECTED = 6
+    SHELL_EJECTED = 7
+    SHELL_REVEALED = 8
+    HP_CHANGED = 9
+    GAME_END = 10
+
+
+Event = Tuple[int, int, int]
+
+
+class GameState:
+    """
+    Complete state of one game.
+
+    Attributes:
+    - hp (List[int]): Current HP of both seats.
+    - max_hp (int): Maximum HP, equal for both seats.
+    - inventory (List[List[int]]): Item counts of both seats, indexed by item index.
+    - rounds (List[bool]): Loaded shells, True for live. The next shell is the last one.
+    - damage (int): Damage of the next shot.
+    - turn (int): The seat to move.
+    - extra_turns (int): Turns the active seat gets before the opponent moves again.
+    - item_used (bool): Whether a non-adrenaline item was used during the current turn.
+    - tied (List[int]): Handcuff counters of both seats.
+    - adrenaline (List[bool]): Whether a seat is under the adrenaline effect.
+    - rng (SplitMix64): The random stream of the game.
+    - winner (int): The winning seat, -1 while the game is running.
+    - turns (int): The number of finished turns.
+    """
+
+    __slots__ = (
+        "hp",
+        "max_hp",
+        "inventory",
+        "rounds",
+        "damage",
+        "turn",
+        "extra_turns",
+        "item_used",
+        "tied",
+        "adrenaline",
+        "rng",
+        "winner",
+        "turns",
+    )
+
+    def __init__(self, hp: int, turn: int, rng: SplitMix64) -> None:
+        self.hp = [hp, hp]
+        self.max_hp = hp
+        self.inventory = [[0] * N_ITEMS, [0] * N_ITEMS]
+        self.rounds: List[bool] = []
+        self.damage = 1
+        self.turn = turn
+        self.extra_turns = 0
+        self.item_used = False
+        self.tied = [0, 0]
+        self.adrenaline = [False, False]
+        self.rng = rng
+        self.winner = -1
+        self.turns = 0
+
+    def copy(self) -> "GameState":
+        """
+        Returns an independent copy of the state.
+        """
+        new = GameState.__new__(GameState)
+        new.hp = self.hp[:]
+        new.max_hp = self.max_hp
+        new.inventory = [self.inventory[0][:], self.inventory[1][:]]
+        new.rounds = self.rounds[:]
+        new.damage = self.damage
+        new.turn = self.turn
+        new.extra_turns = self.extra_turns
+        new.item_used = self.item_used
+        new.tied = self.tied[:]
+        new.adrenaline = self.adrenaline[:]
+        new.rng = self.rng.copy()
+        new.winner = self.winner
+        new.turns = self.turns
+        return new
+
+    @property
+    def is_over(self) -> bool:
+        return self.winner >= 0
+
+    def live_shells(self) -> int:
+        """
+        Returns the number of live shells left. This is public knowledge: the loadout
+        is announced on recharge and every fired or ejected shell is shown to both players.
+        """
+        return sum(self.rounds)
+
+
+def action_from_scene(action: Union[ItemType, str]) -> Action:
+    """
+    Converts a `Scene.make_turn` action ("me", "him" or an ItemType) to an engine Action.
+    """
+    if action == "him":
+        return Action.SHOOT_OPPONENT
+    if action == "me":
+        return Action.SHOOT_SELF
+    if type(action) is ItemType:
+        return Action(ITEM_INDEX[action] + ITEM_ACTION_OFFSET)
+    raise ValueError("This is not an action or a valid item.")
+
+
+def action_to_scene(action: int) -> Union[ItemType, str]:
+    """
+    Converts an engine Action back to a `Scene.make_turn` action.
+    """
+    if action == Action.SHOOT_OPPONENT:
+        return "him"
+    if action == Action.SHOOT_SELF:
+        return "me"
+    return ITEMS[action - ITEM_ACTION_OFFSET]
+
+
+def new_game(seed: int) -> Tuple[GameState, List[Event]]:
+    """
+    Starts a new game, mirroring `Scene.start`.
+
+    Args:
+    - seed (int): The seed of the game's random stream.
+
+    Returns:
+    - Tuple[GameState, List[Event]]: The initial state and the setup events.
+    """
+    rng = SplitMix64(seed)
+    first = rng.choice((0, 1))
+    hp = rng.randint(3, 6)
+    state = GameState(hp, first, rng)
+    events: List[Event] = [(EventType.GAME_START, first, hp)]
+    _reload(state, ITEM_DRAWS_ON_START, events)
+    return state, events
+
+
+def step(state: GameState, action: int) -> Tuple[GameState, List[Event]]:
+    """
+    Pure reducer: applies the action of the active player to a copy of the state.
+
+    Args:
+    - state (GameState): The current state. It is not modified.
+    - action (int): An `Action` of the active player.
+
+    Returns:
+    - Tuple[GameState, List[Event]]: The next state and the events of the step.
+    """
+    new_state = state.copy()
+    return new_state, apply_action(new_state, action)
+
+
+def apply_action(state: GameState, action: int) -> List[Event]:
+    """
+    In-place counterpart of `step`, for callers that do not need the previous state.
+
+    Args:
+    - state (GameState): The state to advance.
+    - action (int): An `Action` of the active player.
+
+    Returns:
+    - List[Event]: The events of the step.
+    """
+    if state.winner >= 0:
+        raise ValueError("The game is already over")
+
+    events: List[Event] = []
+    seat = state.turn
+    action = int(action)
+    expired = bool(action & ADRENALINE_EXPIRED)
+    action &= ~ADRENALINE_EXPIRED
+
+    if action == Action.SHOOT_SELF:
+        if _shoot(state, seat, seat, EventType.SHOT_SELF, events):
+            state.tied[0] -= 1
+            state.tied[1] -= 1
+        else:
+            state.extra_turns += 1
+        state.adrenaline[seat] = False
+        _end_turn(state)
+    elif action == Action.SHOOT_OPPONENT:
+        _shoot(state, seat, 1 - seat, EventType.SHOT_OPPONENT, events)
+        _end_turn(state)
+        state.tied[0] -= 1
+        state.tied[1] -= 1
+        state.adrenaline[seat] = False
+    elif ITEM_ACTION_OFFSET <= action < N_ACTIONS:
+        _use_item(state, seat, action - ITEM_ACTION_OFFSET, expired, events)
+    else:
+        raise ValueError("This is not an action or a valid item.")
+
+    if state.hp[0] <= 0:
+        _finish(state, 1, events)
+    elif state.hp[1] <= 0:
+        _finish(state, 0, events)
+    elif not state.rounds:
+        _reload(state, ITEM_DRAWS_ON_RECHARGE, events)
+        state.tied[0] = 0
+        state.tied[1] = 0
+    return events
+
+
+def legal_actions(state: GameState) -> List[int]:
+    """
+    Returns the actions of the active player that will not be rejected.
+    """
+    seat = state.turn
+    other = 1 - seat
+    actions = [Action.SHOOT_OPPONENT, Action.SHOOT_SELF]
+    if state.item_used:
+        return actions
+
+    under_adrenaline = state.adrenaline[seat]
+    inventory = state.inventory[other if under_adrenaline else seat]
+    for item, count in enumerate(inventory):
+        if count <= 0:
+            continue
+        if item == HANDCUFF and state.tied[other] > 0:
+            continue
+        if item == ADRENALINE and under_adrenaline:
+            continue
+        actions.append(item + ITEM_ACTION_OFFSET)
+    return actions
+
+
+def _shoot(state: GameState, seat: int, target: int, kind: int, events: List[Event]) -> bool:
+    live = state.rounds.pop() if state.rounds else False
+    dealt = 0
+    if live:
+        dealt = state.damage
+        state.hp[target] = max(0, state.hp[target] - dealt)
+    state.damage = 1
+    events.append((kind, seat, dealt))
+    return live
+
+
+def _end_turn(state: GameState):
+    if state.extra_turns:
+        state.extra_turns -= 1
+    else:
+        state.turn ^= 1
+    state.item_used = False
+    state.turns += 1
+
+
+def _use_item(state: GameState, seat: int, item: int, expired: bool, events: List[Event]):
+    other = 1 - seat
+    under_adrenaline = state.adrenaline[seat]
+    # Under adrenaline the player spends the opponent's items
+    inventory = state.inventory[other if under_adrenaline else seat]
+
+    rejected = inventory[item] <= 0 or state.item_used
+    if not rejected:
+        if item != ADRENALINE:
+            state.item_used = True
+        rejected = (
+            (under_adrenaline and expired)
+            or (item == HANDCUFF and state.tied[other] > 0)
+            or (item == ADRENALINE and under_adrenaline)
+        )
+    # Any item attempt ends the adrenaline effect
+    state.adrenaline[seat] = False
+
+    if rejected:
+        events.append((EventType.ITEM_REJECTED, seat, item))
+        return
+
+    inventory[item] -= 1
+    events.append((EventType.ITEM_USED, seat, item))
+
+    if item == HANDSAW:
+        state.damage *= 2
+    elif item == BEER:
+        events.append((EventType.SHELL_EJECTED, seat, int(state.rounds.pop())))
+    elif item == SMOKE:
+        _heal(state, seat, 1, events)
+    elif item == HANDCUFF:
+        state.tied[other] = 3
+        state.extra_turns += 1
+    elif item == GLASS:
+        events.append((EventType.SHELL_REVEALED, seat, int(state.rounds[-1])))
+    elif item == PHONE:
+        pos = state.rng.randint(0, len(state.rounds) - 1)
+        live = state.rounds[-1 - pos]
+        events.append((EventType.SHELL_REVEALED, seat, pos << 1 | live))
+    elif item == PILLS:
+        if state.rng.choice(PILLS_OUTCOMES) == 1:
+            _heal(state, seat, 2, events)
+        else:
+            state.hp[seat] = max(0, state.hp[seat] - 1)
+            events.append((EventType.HP_CHANGED, seat, state.hp[seat]))
+    elif item == INVERTER:
+        state.rounds = [not r for r in state.rounds]
+    elif item == ADRENALINE:
+        state.adrenaline[seat] = True
+
+
+def _heal(state: GameState, seat: int, hp: int, events: List[Event]):
+    state.hp[seat] = min(state.hp[seat] + hp, state.max_hp)
+    events.append((EventType.HP_CHANGED, seat, state.hp[seat]))
+
+
+def _reload(state: GameState, draws: Tuple[int, ...], events: List[Event]):
+    # Mirrors Shotgun.recharge + Shotgun.generate_normal_distribution
+    rng = state.rng
+    n = max(2, min(7, round(rng.normalvariate(5, 1))))
+    live = n / 2 + n / 2 * rng.uniform(-0.2, 0.3)
+    blank = n - live
+    live, blank = max(1, round(live)), max(1, round(blank))
+    rounds = [True] * live + [False] * blank
+    rng.shuffle(rounds)
+    state.rounds = rounds
+    events.append((EventType.LOADOUT, -1, live << 4 | blank))
+
+    n = rng.choice(draws)
+    _distribute(state, 0, n, events)
+    _distribute(state, 1, n, events)
+
+
+def _distribute(state: GameState, seat: int, n: int, events: List[Event]):
+    # Mirrors Scene.distribute_items: all items are drawn first, overflow is dropped
+    drawn = [state.rng.choice(ITEM_POOL) for _ in range(n)]
+    inventory = state.inventory[seat]
+    for item in drawn:
+        if sum(inventory) >= MAX_ITEMS:
+            continue
+        inventory[item] += 1
+        events.append((EventType.ITEM_DRAWN, seat, item))
+
+
+def _finish(state: GameState, winner: int, events: List[Event]):
+    state.winner = winner
+    events.append((EventType.GAME_END, winner, 0))
+
@@ -0,0 +1,229 @@
+"""
+Append-only binary game log.
+
+Every record is a fixed-width 12 byte `(game_id, kind, seat, value)` struct. The game
+id is the state of the scene's random stream when the game started, so a game can be
+rebuilt turn by turn with `core.engine.new_game(game_id)` and the recorded actions.
+
+Replay a recorded game from the `app` directory:
+    python -m core.game_log log/games.bin            # list the games
+    python -m core.game_log log/games.bin --game ID  # replay one game
+"""
+
+import argparse
+import mmap
+import os
+import struct
+from collections import defaultdict
+from enum import IntEnum
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.engine import (
+    ADRENALINE_EXPIRED,
+    Action,
+    EventType,
+    GameState,
+    new_game,
+    step,
+)
+
+RECORD = struct.Struct("<QBbh")
+
+Record = Tuple[int, int, int, int]
+
+
+class RecordType(IntEnum):
+    """
+    Kinds of log records.
+
+    - START: seat is the starting player, value is the starting HP.
+    - LOADOUT: value is `live << 4 | blank`.
+    - ITEM_DRAWN: value is the index of an item added to the seat's inventory.
+    - ACTION: value is the `core.engine.Action` played by the seat.
+    - HP: value is the HP of the seat after an action changed it.
+    - GAME_END: seat is the winner.
+    """
+
+    START = 0
+    LOADOUT = 1
+    ITEM_DRAWN = 2
+    ACTION = 3
+    HP = 4
+    GAME_END = 5
+
+
+class GameLogWriter:
+    """
+    Buffered writer of log records. Records are packed into a preallocated buffer
+    which is written to the file when full, at the end of every game, on `flush` and
+    on `close`. The owner of the writer calls `flush` periodically as well, so that the
+    records of games still running reach the file within its flush interval.
+    """
+
+    def __init__(self, path: str, buffer_records: int = 4096) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = open(path, "ab", buffering=0)
+        self._buffer = bytearray(RECORD.size * buffer_records)
+        self._offset = 0
+
+    def write(self, game_id: int, kind: int, seat: int, value: int):
+        """
+        Appends one record.
+        """
+        RECORD.pack_into(self._buffer, self._offset, game_id, kind, seat, value)
+        self._offset += RECORD.size
+        if self._offset == len(self._buffer) or kind == RecordType.GAME_END:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to the file.
+        """
+        if self._offset:
+            self._file.write(memoryview(self._buffer)[: self._offset])
+            self._offset = 0
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class GameRecorder:
+    """
+    Writes the records of one game.
+    """
+
+    __slots__ = ("writer", "game_id")
+
+    def __init__(self, writer: GameLogWriter, game_id: int) -> None:
+        self.writer = writer
+        self.game_id = game_id
+
+    def record(self, kind: int, seat: int = -1, value: int = 0):
+        self.writer.write(self.game_id, kind, seat, value)
+
+
+def iter_records(path: str) -> Iterator[Record]:
+    """
+    Iterates over all records of a log file through a memory map.
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            size = len(view) - len(view) % RECORD.size
+            try:
+                yield from RECORD.iter_unpack(view[:size])
+            finally:
+                view.release()
+
+
+def read_games(path: str) -> Dict[int, List[Record]]:
+    """
+    Groups the records of a log file by game id, in file order.
+    """
+    games: Dict[int, List[Record]] = defaultdict(list)
+    for record in iter_records(path):
+        games[record[0]].append(record)
+    return games
+
+
+class ReplayMismatch(Exception):
+    """
+    Raised when a recorded game does not match its replay.
+    """
+
+
+# Engine events mirrored by log records
+_MIRRORED = {
+    EventType.GAME_START: RecordType.START,
+    EventType.LOADOUT: RecordType.LOADOUT,
+    EventType.ITEM_DRAWN: RecordType.ITEM_DRAWN,
+    EventType.GAME_END: RecordType.GAME_END,
+}
+
+
+def _expected(events, state: GameState, hp_before: Optional[List[int]]) -> List[Tuple[int, int, int]]:
+    expected = []
+    if hp_before is not None:
+        expected += [
+            (RecordType.HP, seat, state.hp[seat])
+            for seat in (0, 1)
+            if state.hp[seat] != hp_before[seat]
+        ]
+    for kind, seat, value in events:
+        if kind in _MIRRORED:
+            expected.append((_MIRRORED[kind], seat, 0 if kind == EventType.GAME_END else value))
+    return sorted(expected)
+
+
+def replay(records: List[Record]) -> Iterator[Tuple[Optional[Record], GameState, list]]:
+    """
+    Rebuilds a recorded game turn by turn with the headless engine, checking every
+    recorded loadout, item draw, HP change and the winner against the replay.
+
+    Args:
+    - records (List[Record]): The records of one game, in file order.
+
+    Yields:
+    - Tuple[Optional[Record], GameState, list]: The action record (None for the setup),
+      the state after it and the engine events it produced.
+    """
+    if not records:
+        return
+    game_id = records[0][0]
+    state, events = new_game(game_id)
+    hp_before = None
+    action = None
+    logged: List[Tuple[int, int, int]] = []
+
+    def check():
+        if sorted(logged) != _expected(events, state, hp_before):
+            raise ReplayMismatch(f"Game {game_id} diverges after {action}")
+
+    for record in records:
+        _, kind, seat, value = record
+        if kind != RecordType.ACTION:
+            logged.append((kind, seat, value))
+            continue
+        check()
+        yield action, state, events
+        if seat != state.turn:
+            raise ReplayMismatch(f"Game {game_id}: seat {seat} played out of turn")
+        hp_before = state.hp[:]
+        action = record
+        state, events = step(state, value)
+        logged = []
+    check()
+    yield action, state, events
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and replay a binary game log")
+    parser.add_argument("path")
+    parser.add_argument("--game", type=int, help="Replay the game with this id")
+    args = parser.parse_args()
+
+    games = read_games(args.path)
+    if args.game is None:
+        for game_id, records in games.items():
+            actions = sum(1 for record in records if record[1] == RecordType.ACTION)
+            print(f"{game_id}: {actions} actions")
+        return
+
+    for action, state, events in replay(games[args.game]):
+        if action is not None:
+            flags = " (adrenaline expired)" if action[3] & ADRENALINE_EXPIRED else ""
+            print(f"seat {action[2]} plays {Action(action[3] & ~ADRENALINE_EXPIRED).name}{flags}")
+        print(f"  hp={state.hp} shells={[int(r) for r in state.rounds]} items={state.inventory}")
+        for event in events:
+            print(f"  {EventType(event[0]).name} seat={event[1]} value={event[2]}")
+    print(f"winner: seat {state.winner}")
+
+
+if __name__ == "__main__":
+    main()
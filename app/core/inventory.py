@@ -1,6 +1,70 @@
-from .models.inventory import InventoryModel
+from __future__ import annotations
+from typing import TYPE_CHECKING, List
+from .models.items import ITEM_INDEX, N_ITEMS, ItemType
+
+if TYPE_CHECKING:
+    from .models.inventory import InventoryModel
 
 
 class Inventory:
-    def __init__(self, model: InventoryModel) -> None:
-        self.data = model
+    """
+    Item counters of a player, stored in a fixed-size list indexed by ItemType.
+
+    The total is kept up to date, so counting items is O(1). Nothing is validated here:
+    use `from_model`/`to_model` to import or export a validated InventoryModel.
+    """
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * N_ITEMS
+        self.total = 0
+
+    def count_items(self) -> int:
+        """
+        Returns the total number of items in the inventory.
+        """
+        return self.total
+
+    def count(self, item: ItemType) -> int:
+        """
+        Returns the quantity of a specific item.
+        """
+        return self.counts[ITEM_INDEX[item]]
+
+    def add(self, item: ItemType):
+        """
+        Adds one item to the inventory.
+        """
+        self.counts[ITEM_INDEX[item]] += 1
+        self.total += 1
+
+    def remove(self, item: ItemType):
+        """
+        Removes one item from the inventory. The count cannot go below zero.
+        """
+        index = ITEM_INDEX[item]
+        if self.counts[index] > 0:
+            self.counts[index] -= 1
+            self.total -= 1
+
+    @classmethod
+    def from_model(cls, model: InventoryModel) -> Inventory:
+        """
+        Builds an inventory from a validated InventoryModel.
+        """
+        inventory = cls()
+        for item in ItemType:
+            inventory.counts[ITEM_INDEX[item]] = getattr(model, item.value)
+        inventory.total = sum(inventory.counts)
+        return inventory
+
+    def to_model(self) -> InventoryModel:
+        """
+        Exports the inventory as an InventoryModel.
+        """
+        from .models.inventory import InventoryModel
+
+        return InventoryModel(
+            **{item.value: self.counts[ITEM_INDEX[item]] for item in ItemType}
+        )
@@ -0,0 +1,156 @@
+"""
+What a player knows of the loaded shells, kept up to date move by move.
+
+Everyone is told how many live and blank shells are loaded at every recharge, and sees
+the type of every shell that leaves the gun, fired or ejected by a beer. A magnifying
+glass or a phone shows one shell to its user alone, and an inverter flips all of them.
+Nothing else is known, so every shell not seen is equally likely to be any of the shells
+not seen: the chance that it is live is the share of live shells among them. `Knowledge`
+keeps the counts and the seen shells so that every update and every query of a shell is
+O(1), without enumerating the orders of the loadout.
+
+Shells are addressed either by index, as in `Shotgun.rounds` and `GameState.rounds` where
+the next shell is the last one, or by position, 0 being the next shell, as in the phone
+and in engine events.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .engine import INVERTER, Event, EventType
+
+
+class Knowledge:
+    """
+    The shells one player knows of.
+
+    Attributes:
+    - live (int): Live shells left.
+    - blank (int): Blank shells left.
+    - seen_live (int): Live shells left that the player has seen.
+    - seen_blank (int): Blank shells left that the player has seen.
+    """
+
+    __slots__ = ("live", "blank", "seen_live", "seen_blank", "_inverted", "_seen")
+
+    def __init__(self, live: int = 0, blank: int = 0) -> None:
+        self.loadout(live, blank)
+
+    @property
+    def length(self) -> int:
+        """
+        The number of shells left.
+        """
+        return self.live + self.blank
+
+    def loadout(self, live: int, blank: int):
+        """
+        A recharge: nothing is known of the new shells but their numbers.
+        """
+        self.live = live
+        self.blank = blank
+        self.seen_live = 0
+        self.seen_blank = 0
+        # Seen shells are stored as they were before the inverters used since
+        self._inverted = False
+        self._seen: Dict[int, bool] = {}
+
+    def reveal(self, index: int, live: bool):
+        """
+        The player has seen the shell at `index`.
+        """
+        if index in self._seen or not 0 <= index < self.length:
+            return
+        self._seen[index] = live != self._inverted
+        if live:
+            self.seen_live += 1
+        else:
+            self.seen_blank += 1
+
+    def reveal_position(self, position: int, live: bool):
+        """
+        The player has seen the shell at `position` from the next one.
+        """
+        self.reveal(self.length - 1 - position, live)
+
+    def eject(self, live: bool):
+        """
+        The next shell left the gun, fired or ejected, and everyone saw its type.
+        """
+        if not self.length:
+            raise Exception("No shell left to eject")
+        seen = self._seen.pop(self.length - 1, None)
+        if live:
+            self.live -= 1
+        else:
+            self.blank -= 1
+        if seen is not None:
+            if live:
+                self.seen_live -= 1
+            else:
+                self.seen_blank -= 1
+
+    def invert(self):
+        """
+        An inverter flipped every shell left.
+        """
+        self.live, self.blank = self.blank, self.live
+        self.seen_live, self.seen_blank = self.seen_blank, self.seen_live
+        self._inverted = not self._inverted
+
+    def shell(self, index: int) -> Optional[bool]:
+        """
+        The type of the shell at `index` if the player has seen it, None otherwise.
+        """
+        seen = self._seen.get(index)
+        return None if seen is None else seen != self._inverted
+
+    def live_chance(self, position: int = 0) -> float:
+        """
+        The probability that the shell at `position` from the next one is live.
+
+        Returns:
+        - float: 1.0 or 0.0 for a shell seen, the share of live shells among the shells
+          not seen otherwise, 0.0 if there is no such shell.
+        """
+        index = self.length - 1 - position
+        if not 0 <= index < self.length:
+            return 0.0
+        seen = self.shell(index)
+        if seen is not None:
+            return 1.0 if seen else 0.0
+        unseen = self.length - self.seen_live - self.seen_blank
+        return (self.live - self.seen_live) / unseen
+
+    def live_chances(self) -> List[float]:
+        """
+        The probability that each shell left is live, by position from the next one.
+        """
+        unseen = self.length - self.seen_live - self.seen_blank
+        chance = (self.live - self.seen_live) / unseen if unseen else 0.0
+        chances = [chance] * self.length
+        for index, seen in self._seen.items():
+            chances[self.length - 1 - index] = 1.0 if seen != self._inverted else 0.0
+        return chances
+
+    def known(self) -> Tuple[Tuple[int, bool], ...]:
+        """
+        `(index, live)` of the shells seen, by index.
+        """
+        return tuple((index, seen != self._inverted) for index, seen in sorted(self._seen.items()))
+
+    def apply(self, events: Iterable[Event], seat: int):
+        """
+        Follows the events of an engine step as the player in `seat` sees them.
+        """
+        for kind, by, value in events:
+            if kind == EventType.LOADOUT:
+                self.loadout(value >> 4, value & 0xF)
+            elif kind == EventType.SHOT_SELF or kind == EventType.SHOT_OPPONENT:
+                # Only live shells deal damage
+                self.eject(value > 0)
+            elif kind == EventType.SHELL_EJECTED:
+                self.eject(bool(value))
+            elif kind == EventType.SHELL_REVEALED and by == seat:
+                self.reveal_position(value >> 1, bool(value & 1))
+            elif kind == EventType.ITEM_USED and value == INVERTER:
+                self.invert()
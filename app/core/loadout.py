@@ -0,0 +1,110 @@
+"""
+Vectorized loadout and item draws for bulk simulation.
+
+The batch functions draw thousands of loadouts at once from a NumPy `Generator`
+with the same distribution as `Shotgun.recharge` + `Shotgun.generate_normal_distribution`
+and `Scene.distribute_items`. `LoadoutDispenser` hands the pre-generated values out
+one by one, so `Shotgun` and `Scene` can consume them instead of calling `random`
+per event.
+"""
+
+from typing import List, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+from .models.ammo import AmmoType
+from .models.items import N_ITEMS, ItemType
+
+T = TypeVar("T")
+
+# Upper bound of the number of shells in one loadout
+MAX_SHELLS = 8
+
+ITEMS = tuple(ItemType)
+
+
+def generate_loadouts(
+    rng: np.random.Generator, size: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Generates a batch of shuffled loadouts.
+
+    Args:
+    - rng (np.random.Generator): The random generator.
+    - size (int): The number of loadouts.
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        - live (size,): The number of live shells of every loadout.
+        - blank (size,): The number of blank shells of every loadout.
+        - shells (size, MAX_SHELLS): True for live shells, in `Shotgun.rounds` order
+          (the last shell is fired first). Positions past live + blank are False.
+    """
+    # Shotgun.generate_normal_distribution(mean=5, std_deviation=1, lower_bound=2, upper_bound=7).
+    # np.rint rounds half to even, like Python's round.
+    rounds = np.clip(np.rint(rng.normal(5.0, 1.0, size)), 2, 7)
+    live = rounds / 2 + rounds / 2 * rng.uniform(-0.2, 0.3, size)
+    blank = rounds - live
+    live = np.maximum(1, np.rint(live)).astype(np.int8)
+    blank = np.maximum(1, np.rint(blank)).astype(np.int8)
+    length = live + blank
+
+    # A random permutation of the first `length` positions of every row:
+    # padding gets infinite keys so it sorts to the end.
+    keys = rng.random((size, MAX_SHELLS))
+    keys[np.arange(MAX_SHELLS) >= length[:, None]] = np.inf
+    order = np.argsort(keys, axis=1)
+    shells = (order < live[:, None]) & (np.arange(MAX_SHELLS) < length[:, None])
+    return live, blank, shells
+
+
+def generate_item_draws(rng: np.random.Generator, size: int) -> np.ndarray:
+    """
+    Generates a batch of uniformly drawn items, as indexes into ItemType order.
+    """
+    return rng.integers(0, N_ITEMS, size, dtype=np.int8)
+
+
+class LoadoutDispenser:
+    """
+    Hands out pre-generated loadouts, item draws and random choices one by one,
+    refilling them from a seeded NumPy Generator in batches.
+    """
+
+    def __init__(self, seed: Optional[int] = None, batch_size: int = 4096) -> None:
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self._loadouts: List[List[AmmoType]] = []
+        self._items: List[int] = []
+        self._uniforms: List[float] = []
+
+    def next_rounds(self) -> List[AmmoType]:
+        """
+        Returns the next shuffled loadout, in `Shotgun.rounds` order.
+        """
+        if not self._loadouts:
+            live, blank, shells = generate_loadouts(self.rng, self.batch_size)
+            length = (live + blank).tolist()
+            self._loadouts = [
+                [AmmoType.LIVE if shell else AmmoType.BLANK for shell in row[:n]]
+                for row, n in zip(shells.tolist(), length)
+            ]
+        return self._loadouts.pop()
+
+    def next_items(self, n: int) -> List[ItemType]:
+        """
+        Returns n uniformly drawn items.
+        """
+        if len(self._items) < n:
+            self._items.extend(generate_item_draws(self.rng, self.batch_size + n).tolist())
+        drawn = self._items[-n:] if n else []
+        del self._items[len(self._items) - n :]
+        return [ITEMS[i] for i in drawn]
+
+    def choice(self, seq: Sequence[T]) -> T:
+        """
+        Returns a uniformly chosen element of a non-empty sequence.
+        """
+        if not self._uniforms:
+            self._uniforms = self.rng.random(self.batch_size).tolist()
+        return seq[int(self._uniforms.pop() * len(seq))]
@@ -0,0 +1,202 @@
+"""
+Matchmaking of the players looking for a game with /find.
+
+Requests are queued in O(1) and paired in batches on every `Matchmaker.tick`.
+Players are grouped in rating buckets, paired first-come first-served inside a
+bucket, and the bucket distance a player accepts widens the longer they wait.
+Without ratings everybody shares one bucket, which is a plain FIFO queue.
+"""
+
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+class Ticket:
+    """
+    A player waiting for a game.
+    """
+
+    __slots__ = ("user_id", "payload", "bucket", "since", "deadline", "active")
+
+    def __init__(self, user_id: int, payload: Any, bucket: int, since: float, deadline: float) -> None:
+        self.user_id = user_id
+        self.payload = payload
+        self.bucket = bucket
+        self.since = since
+        self.deadline = deadline
+        self.active = True
+
+
+class Matchmaker:
+    """
+    Batched matchmaking queue.
+
+    Attributes:
+    - timeout (float): Seconds a ticket waits for an opponent before it expires.
+    - bucket_width (int): Rating points per bucket.
+    - widen_every (float): Seconds of waiting after which a ticket accepts opponents
+      one more bucket away.
+    - matched (int): Number of matched tickets.
+    - expired (int): Number of expired tickets.
+    - cancelled (int): Number of cancelled tickets.
+    - total_wait (float): Total waiting time of the matched tickets.
+    """
+
+    def __init__(self, timeout: float = 300.0, bucket_width: int = 100, widen_every: float = 10.0) -> None:
+        self.timeout = timeout
+        self.bucket_width = bucket_width
+        self.widen_every = widen_every
+        self._tickets: Dict[int, Ticket] = {}
+        # New tickets wait here until the next tick
+        self._incoming: Deque[Ticket] = deque()
+        # Tickets of every bucket in arrival order, cancelled ones are skipped lazily
+        self._buckets: Dict[int, Deque[Ticket]] = {}
+        self._deadlines: List[Tuple[float, int, Ticket]] = []
+        self._order = itertools.count()
+        self.matched = 0
+        self.expired = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._tickets
+
+    def enqueue(
+        self,
+        user_id: int,
+        payload: Any = None,
+        rating: Optional[int] = None,
+        now: Optional[float] = None,
+    ) -> bool:
+        """
+        Adds a player to the queue.
+
+        Args:
+        - user_id (int): The player.
+        - payload (Any): Data returned with the match, e.g. the /find message.
+        - rating (Optional[int]): The rating of the player, None to match with anybody.
+        - now (Optional[float]): The current `time.monotonic()` time.
+
+        Returns:
+        - bool: False if the player is already waiting.
+        """
+        if user_id in self._tickets:
+            return False
+        now = time.monotonic() if now is None else now
+        bucket = 0 if rating is None else rating // self.bucket_width
+        ticket = Ticket(user_id, payload, bucket, now, now + self.timeout)
+        self._tickets[user_id] = ticket
+        self._incoming.append(ticket)
+        heapq.heappush(self._deadlines, (ticket.deadline, next(self._order), ticket))
+        return True
+
+    def cancel(self, user_id: int) -> bool:
+        """
+        Removes a player from the queue.
+
+        Returns:
+        - bool: False if the player was not waiting.
+        """
+        ticket = self._tickets.pop(user_id, None)
+        if ticket is None:
+            return False
+        ticket.active = False
+        self.cancelled += 1
+        return True
+
+    def _window(self, ticket: Ticket, now: float) -> int:
+        return int((now - ticket.since) / self.widen_every)
+
+    def _pop_active(self, queue: Deque[Ticket]) -> Optional[Ticket]:
+        while queue:
+            ticket = queue.popleft()
+            if ticket.active:
+                return ticket
+        return None
+
+    def _pair(self, first: Ticket, second: Ticket, now: float, matches: List[Tuple[Ticket, Ticket]]):
+        for ticket in (first, second):
+            ticket.active = False
+            del self._tickets[ticket.user_id]
+            self.total_wait += now - ticket.since
+        self.matched += 2
+        matches.append((first, second))
+
+    def tick(self, now: Optional[float] = None) -> Tuple[List[Tuple[Ticket, Ticket]], List[Ticket]]:
+        """
+        Expires the tickets past their deadline and pairs the waiting ones.
+
+        Args:
+        - now (Optional[float]): The current `time.monotonic()` time.
+
+        Returns:
+        - Tuple[List[Tuple[Ticket, Ticket]], List[Ticket]]: The matched pairs, the older
+          ticket first, and the expired tickets.
+        """
+        now = time.monotonic() if now is None else now
+
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            ticket = heapq.heappop(self._deadlines)[2]
+            if ticket.active:
+                ticket.active = False
+                del self._tickets[ticket.user_id]
+                expired.append(ticket)
+        self.expired += len(expired)
+
+        while self._incoming:
+            ticket = self._incoming.popleft()
+            if ticket.active:
+                self._buckets.setdefault(ticket.bucket, deque()).append(ticket)
+
+        # Pair inside every bucket, oldest first, leaving at most one ticket per bucket
+        matches: List[Tuple[Ticket, Ticket]] = []
+        leftovers: List[Ticket] = []
+        for bucket in sorted(self._buckets):
+            queue = self._buckets[bucket]
+            while True:
+                first = self._pop_active(queue)
+                if first is None:
+                    break
+                second = self._pop_active(queue)
+                if second is None:
+                    leftovers.append(first)
+                    break
+                self._pair(first, second, now, matches)
+            del self._buckets[bucket]
+
+        # Pair neighbouring buckets when the older ticket has waited long enough
+        i = 0
+        while i < len(leftovers):
+            ticket = leftovers[i]
+            if i + 1 < len(leftovers):
+                other = leftovers[i + 1]
+                older = ticket if ticket.since <= other.since else other
+                if other.bucket - ticket.bucket <= self._window(older, now):
+                    if older is ticket:
+                        self._pair(ticket, other, now, matches)
+                    else:
+                        self._pair(other, ticket, now, matches)
+                    i += 2
+                    continue
+            self._buckets[ticket.bucket] = deque((ticket,))
+            i += 1
+        return matches, expired
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the queue counters.
+        """
+        return {
+            "waiting": len(self._tickets),
+            "matched": self.matched,
+            "expired": self.expired,
+            "cancelled": self.cancelled,
+            "avg_wait": self.total_wait / self.matched if self.matched else 0.0,
+        }
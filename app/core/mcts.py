@@ -0,0 +1,421 @@
+"""
+Monte Carlo tree search for the dealer of a `/solo` game.
+
+The dealer only knows what a player in its seat knows: HP, both inventories, how many
+live and blank shells are left and the shells it has seen itself through the magnifying
+glass or the phone. Every iteration samples a loadout consistent with that knowledge (a
+determinization) and walks a tree whose edges are the actions legal in it, each counting
+how often it was available (information set MCTS). Below an edge, the tree branches on
+what both players see happen, so an action may depend on what a GLASS has shown; shells
+revealed to the opponent stay hidden. The game is then played out with a cheap policy.
+
+The search stops at a deadline and answers the most visited action: it can be cut short
+at any time. `SearchPool` runs it in worker processes, away from the event loop.
+
+Run from the `app` directory:
+    python -m core.mcts --games 200 --budget 0.2     # against the counting policy
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+from core.engine import (
+    Action,
+    Event,
+    EventType,
+    GameState,
+    apply_action,
+    legal_actions,
+    new_game,
+)
+from core.knowledge import Knowledge
+from core.models.ammo import AmmoType
+from core.models.items import ItemType
+from core.rng import SplitMix64, StreamSpawner, derive_seed
+
+if TYPE_CHECKING:
+    from core.scene import Scene
+
+# Exploration constant of UCB1
+EXPLORATION = 0.7
+# Play-outs longer than this many actions count as a draw
+MAX_ROLLOUT_STEPS = 200
+
+
+class Observation(NamedTuple):
+    """
+    A game as seen by the seat to move.
+
+    Attributes:
+    - seat (int): The seat to move, whose knowledge this is.
+    - hp (Tuple[int, int]): HP of both seats.
+    - max_hp (int): Maximum HP.
+    - inventory (Tuple[Tuple[int, ...], Tuple[int, ...]]): Own item counts of both seats.
+    - live (int): Live shells left.
+    - blank (int): Blank shells left.
+    - known (Tuple[Tuple[int, bool], ...]): `(index, live)` of the shells the seat has
+      seen, indexed as `GameState.rounds`: the next shell is the last one.
+    - damage (int): Damage of the next shot.
+    - extra_turns (int): Turns the seat gets before the opponent moves again.
+    - item_used (bool): Whether an item was already used this turn.
+    - tied (Tuple[int, int]): Handcuff counters of both seats.
+    - adrenaline (Tuple[bool, bool]): Whether a seat is under the adrenaline effect.
+    """
+
+    seat: int
+    hp: Tuple[int, int]
+    max_hp: int
+    inventory: Tuple[Tuple[int, ...], Tuple[int, ...]]
+    live: int
+    blank: int
+    known: Tuple[Tuple[int, bool], ...]
+    damage: int
+    extra_turns: int
+    item_used: bool
+    tied: Tuple[int, int]
+    adrenaline: Tuple[bool, bool]
+
+
+class Move(NamedTuple):
+    """
+    The answer of a search.
+
+    Attributes:
+    - action (int): The `Action` to play.
+    - iterations (int): Iterations run before the deadline.
+    - win_rate (float): Estimated chance of winning after the action.
+    """
+
+    action: int
+    iterations: int
+    win_rate: float
+
+
+def observe(state: GameState, knowledge: Optional[Knowledge] = None) -> Observation:
+    """
+    The observation of the seat to move of an engine state.
+
+    Args:
+    - state (GameState): A running game.
+    - knowledge (Optional[Knowledge]): What the seat knows of the shells, nothing if None.
+
+    Returns:
+    - Observation: What the seat knows.
+    """
+    live = state.live_shells()
+    return Observation(
+        state.turn,
+        (state.hp[0], state.hp[1]),
+        state.max_hp,
+        (tuple(state.inventory[0]), tuple(state.inventory[1])),
+        live,
+        len(state.rounds) - live,
+        _known(knowledge, len(state.rounds)),
+        state.damage,
+        state.extra_turns,
+        state.item_used,
+        (state.tied[0], state.tied[1]),
+        (state.adrenaline[0], state.adrenaline[1]),
+    )
+
+
+def observe_scene(scene: Scene, knowledge: Optional[Knowledge] = None) -> Observation:
+    """
+    The observation of the player to move of a running `Scene`.
+
+    Args:
+    - scene (Scene): A started game.
+    - knowledge (Optional[Knowledge]): What the player knows of the shells, nothing if None.
+
+    Returns:
+    - Observation: What the player knows.
+    """
+    players = (scene.first_player, scene.second_player)
+    # Under adrenaline a player holds the opponent's inventory
+    inventory = tuple(
+        tuple((p.adrenaline_inventory if p.adrenaline else p.inventory).counts) for p in players
+    )
+    rounds = scene.shotgun.rounds
+    live = sum(1 for r in rounds if r == AmmoType.LIVE)
+    dealer = scene.dealer
+    return Observation(
+        dealer.turn_int,
+        (players[0].data.hp, players[1].data.hp),
+        players[0].data.max_hp,
+        inventory,
+        live,
+        len(rounds) - live,
+        _known(knowledge, len(rounds)),
+        scene.shotgun.damage,
+        dealer.extra_turns,
+        any(item != ItemType.ADRENALINE for item in dealer.current.used_items),
+        (players[0].tied, players[1].tied),
+        (players[0].adrenaline, players[1].adrenaline),
+    )
+
+
+def _known(knowledge: Optional[Knowledge], length: int) -> Tuple[Tuple[int, bool], ...]:
+    # A tracker that missed a move, as in a restored room, knows nothing of this loadout
+    if knowledge is None or knowledge.length != length:
+        return ()
+    return knowledge.known()
+
+
+def determinize(observation: Observation, rng: SplitMix64) -> GameState:
+    """
+    An engine state consistent with the observation: the shells not seen are shuffled.
+
+    Args:
+    - observation (Observation): What the seat to move knows.
+    - rng (SplitMix64): The stream shuffling the shells, also given to the state.
+
+    Returns:
+    - GameState: A possible game.
+    """
+    state = GameState(observation.max_hp, observation.seat, rng)
+    state.hp = list(observation.hp)
+    state.inventory = [list(observation.inventory[0]), list(observation.inventory[1])]
+    live, blank = observation.live, observation.blank
+    rounds: List[Optional[bool]] = [None] * (live + blank)
+    for index, shell in observation.known:
+        rounds[index] = shell
+        if shell:
+            live -= 1
+        else:
+            blank -= 1
+    hidden = [True] * live + [False] * blank
+    rng.shuffle(hidden)
+    state.rounds = [hidden.pop() if shell is None else shell for shell in rounds]
+    state.damage = observation.damage
+    state.extra_turns = observation.extra_turns
+    state.item_used = observation.item_used
+    state.tied = list(observation.tied)
+    state.adrenaline = list(observation.adrenaline)
+    return state
+
+
+def fallback_action(observation: Observation) -> int:
+    """
+    The move played when there is no time to search: shoots where the next shell more
+    likely goes off.
+    """
+    rounds = observation.live + observation.blank
+    for index, live in observation.known:
+        if index == rounds - 1:
+            return Action.SHOOT_OPPONENT if live else Action.SHOOT_SELF
+    if observation.live * 2 >= rounds:
+        return Action.SHOOT_OPPONENT
+    return Action.SHOOT_SELF
+
+
+def _rollout_action(state: GameState, rng: SplitMix64) -> int:
+    # Items at random half of the time, then shots by the count of live shells
+    actions = legal_actions(state)
+    if len(actions) > 2 and rng.random() < 0.5:
+        return actions[2 + rng.randbelow(len(actions) - 2)]
+    if state.live_shells() * 2 >= len(state.rounds):
+        return Action.SHOOT_OPPONENT
+    return Action.SHOOT_SELF
+
+
+def _outcome(action: int, events: List[Event], seat: int) -> Tuple[int, ...]:
+    # What the searching seat sees of a step: everything but the opponent's reveals
+    seen = [action]
+    for kind, by, value in events:
+        if kind == EventType.SHELL_REVEALED and by != seat:
+            value = 0xFF
+        seen.append(kind << 8 | value)
+    return tuple(seen)
+
+
+class _Edge:
+    __slots__ = ("visits", "wins", "available", "children")
+
+    def __init__(self) -> None:
+        self.visits = 0
+        self.wins = 0.0
+        self.available = 0
+        # What was seen after the action -> the node of the next decision
+        self.children: Dict[Tuple[int, ...], Dict[int, _Edge]] = {}
+
+
+def search(
+    observation: Observation,
+    deadline: float,
+    seed: int,
+    max_iterations: Optional[int] = None,
+) -> Move:
+    """
+    Searches the best move of the seat to move until the deadline.
+
+    Args:
+    - observation (Observation): What the seat to move knows.
+    - deadline (float): `time.time()` at which the search stops. It is a wall clock
+      time, so the deadline can be set by another process.
+    - seed (int): The seed of the search.
+    - max_iterations (Optional[int]): Stops earlier after this many iterations.
+
+    Returns:
+    - Move: The most visited action, `fallback_action` if no iteration finished.
+    """
+    rng = SplitMix64(seed)
+    seat = observation.seat
+    root: Dict[int, _Edge] = {}
+    iterations = 0
+    while time.time() < deadline and (max_iterations is None or iterations < max_iterations):
+        state = determinize(observation, SplitMix64(rng.next_u64()))
+        node = root
+        path: List[Tuple[_Edge, int]] = []
+        # Selection and expansion
+        while state.winner < 0:
+            actions = legal_actions(state)
+            untried = []
+            for action in actions:
+                edge = node.get(action)
+                if edge is None:
+                    edge = node[action] = _Edge()
+                edge.available += 1
+                if not edge.visits:
+                    untried.append(action)
+            if untried:
+                action = untried[rng.randbelow(len(untried))]
+            else:
+                action = max(actions, key=lambda a: _ucb(node[a]))
+            edge = node[action]
+            mover = state.turn
+            events = apply_action(state, action)
+            path.append((edge, mover))
+            key = _outcome(action, events, seat)
+            child = edge.children.get(key)
+            if child is None:
+                edge.children[key] = {}
+                break
+            node = child
+        # Play-out
+        for _ in range(MAX_ROLLOUT_STEPS):
+            if state.winner >= 0:
+                break
+            apply_action(state, _rollout_action(state, rng))
+        # Back-propagation, a win for the seat that chose the action
+        for edge, mover in path:
+            edge.visits += 1
+            if state.winner < 0:
+                edge.wins += 0.5
+            elif state.winner == mover:
+                edge.wins += 1.0
+        iterations += 1
+
+    if not root:
+        return Move(fallback_action(observation), 0, 0.5)
+    action, edge = max(root.items(), key=lambda item: item[1].visits)
+    return Move(action, iterations, edge.wins / edge.visits if edge.visits else 0.5)
+
+
+def _ucb(edge: _Edge) -> float:
+    return edge.wins / edge.visits + EXPLORATION * math.sqrt(
+        math.log(edge.available) / edge.visits
+    )
+
+
+class SearchPool:
+    """
+    Searches moves in worker processes, each within a hard time budget.
+
+    The search answers at its deadline. If the pool is too busy to answer in time, the
+    caller gets `fallback_action` instead, so a move never takes much longer than the
+    budget and the event loop only awaits.
+
+    Args:
+    - workers (int): Number of worker processes, started on the first search.
+    - budget (float): Seconds per move.
+    - root_seed (Optional[int]): Root of the seeds of the searches.
+    """
+
+    def __init__(self, workers: int = 1, budget: float = 0.2, root_seed: Optional[int] = None):
+        self.workers = workers
+        self.budget = budget
+        self.seeds = StreamSpawner(root_seed)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """
+        Starts the workers ahead of the first search, which would otherwise spend its
+        budget waiting for them.
+        """
+        if self._pool is None:
+            # Spawned, not forked: the bot process runs threads and an event loop
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            for _ in range(self.workers):
+                self._pool.submit(time.time)
+
+    async def best_move(self, observation: Observation) -> int:
+        """
+        The move of the seat to move.
+
+        Returns:
+        - int: An `Action`.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + self.budget
+        future = loop.run_in_executor(
+            self._pool, search, observation, deadline, self.seeds.spawn_seed()
+        )
+        try:
+            # The grace covers the transfer and one last iteration
+            move = await asyncio.wait_for(future, self.budget * 1.5 + 0.05)
+        except asyncio.TimeoutError:
+            return fallback_action(observation)
+        return move.action
+
+    async def close(self):
+        if self._pool is not None:
+            await asyncio.to_thread(self._pool.shutdown, True, cancel_futures=True)
+            self._pool = None
+
+
+def _play(seed: int, budget: float, mcts_seat: int) -> int:
+    # One game of the search against the counting policy, returns the winner
+    state, events = new_game(seed)
+    rng = SplitMix64(derive_seed(seed, 1))
+    knowledge = Knowledge()
+    knowledge.apply(events, mcts_seat)
+    for _ in range(10_000):
+        if state.winner >= 0:
+            break
+        if state.turn == mcts_seat:
+            move = search(observe(state, knowledge), time.time() + budget, rng.next_u64())
+            action = move.action
+        elif state.live_shells() * 2 >= len(state.rounds):
+            action = Action.SHOOT_OPPONENT
+        else:
+            action = Action.SHOOT_SELF
+        knowledge.apply(apply_action(state, action), mcts_seat)
+    return state.winner
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Play the search against the counting policy")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--budget", type=float, default=0.2, help="Seconds per move")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    wins = 0
+    for index in range(args.games):
+        mcts_seat = index % 2
+        wins += _play(derive_seed(args.seed, index), args.budget, mcts_seat) == mcts_seat
+    print(f"search won {wins} of {args.games} games ({wins / args.games:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,3 +11,8 @@ class ItemType(Enum):
     PILLS = "pills"
     ADRENALINE = "adrenaline"
     INVERTER = "inverter"
+
+
+# Position of every item in fixed-size item arrays
+ITEM_INDEX = {item: i for i, item in enumerate(ItemType)}
+N_ITEMS = len(ITEM_INDEX)
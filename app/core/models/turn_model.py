@@ -1,7 +1,8 @@
 from core.models.items import ItemType
+from core.rng import SplitMix64
 from pydantic import BaseModel
-from typing import Literal, Optional, List
-from copy import deepcopy
+from typing import Deque, Literal, Optional, List
+from collections import deque
 import random
 
 
@@ -44,37 +45,51 @@ class Dealer:
     """
     Manages the turns and actions in the game.
 
+    Whose turn it is is computed on demand: the turns alternate unless the active
+    player was granted extra turns. Only the last `history_size` finished turns are kept.
+
     Attributes:
     - max_items_per_turn (int): The maximum number of items allowed to be used per turn.
     - first_player (int): The ID of the first player.
     - second_player (int): The ID of the second player.
     - move_counter (int): Counter to keep track of the current turn.
-    - queue (List[Turn]): List of turns in the game.
+    - rng: The random stream of the game, the global `random` module if none was given.
+    - extra_turns (int): Number of extra turns granted to the active player.
+    - current (Turn): The turn being played.
+    - history (Deque[Turn]): The most recent finished turns.
 
     Methods:
     - end(result: str): Ends the current turn by assigning the result.
-    - extend_turn(): Extends the current turn by creating a new turn with cleared used items.
+    - extend_turn(): Grants the active player one more turn after the current one.
+    - skip_turn(): Makes the opponent skip their next turn.
     - use_items(item: str) -> bool: Records the usage of an item during the turn.
     - turn_int() -> int: Returns the turn number.
     - player_id() -> int: Returns the player ID of the current turn.
     """
 
     def __init__(
-        self, first_player: int, second_player: int, max_items_per_turn=1
+        self,
+        first_player: int,
+        second_player: int,
+        max_items_per_turn=1,
+        history_size: int = 16,
+        rng: Optional[SplitMix64] = None,
     ) -> None:
         """
         Initializes the Dealer with player IDs and maximum items allowed per turn.
         """
+        self.rng = rng or random
         self.max_items_per_turn = max_items_per_turn
         self.first_player = first_player
         self.second_player = second_player
         self.move_counter = 0
-        list2 = [Turn(1, second_player) for _ in range(100)]
-        list1 = [Turn(0, first_player) for _ in range(100)]
-        if random.choice([0, 1]) == 0:
-            self.queue = [item for pair in zip(list1, list2) for item in pair]
-        else:
-            self.queue = [item for pair in zip(list2, list1) for item in pair]
+        self.extra_turns = 0
+        self.history: Deque[Turn] = deque(maxlen=history_size)
+        self.current = self._new_turn(self.rng.choice([0, 1]))
+
+    def _new_turn(self, turn_number: Literal[1, 0]) -> "Turn":
+        player_id = self.first_player if turn_number == 0 else self.second_player
+        return Turn(turn_number, player_id)
 
     def end(self, result: str):
         """
@@ -83,18 +98,29 @@ class Dealer:
         Args:
         - result (str): The result of the current turn.
         """
-        turn = self.queue[self.move_counter]
+        turn = self.current
         turn.turn_result = result
+        self.history.append(turn)
         self.move_counter += 1
 
+        if self.extra_turns:
+            self.extra_turns -= 1
+            self.current = self._new_turn(turn.turn_number)
+        else:
+            self.current = self._new_turn(1 - turn.turn_number)
+
     def extend_turn(self):
         """
-        Extends the current turn by creating a new turn with cleared used items.
+        Grants the active player one more turn, with cleared used items, after the current one.
         """
-        turn = self.queue[self.move_counter]
-        new_turn = deepcopy(turn)
-        new_turn.used_items = []
-        self.queue.insert(self.move_counter + 1, new_turn)
+        self.extra_turns += 1
+
+    def skip_turn(self):
+        """
+        Makes the opponent skip their next turn.
+        With two players this is the same as an extra turn for the active player.
+        """
+        self.extend_turn()
 
     def use_items(self, item: ItemType) -> bool:
         """
@@ -106,7 +132,7 @@ class Dealer:
         Returns:
         - bool: True if the item usage is successful, False otherwise.
         """
-        items = self.queue[self.move_counter].used_items
+        items = self.current.used_items
         if sum(1 for item in items if item != ItemType.ADRENALINE) > 0:
             return False
         items.append(item)
@@ -120,7 +146,7 @@ class Dealer:
         Returns:
         - int: The current turn number.
         """
-        return self.queue[self.move_counter].turn_number
+        return self.current.turn_number
 
     @property
     def player_id(self) -> int:
@@ -130,7 +156,7 @@ class Dealer:
         Returns:
         - int: The player ID of the current turn.
         """
-        return self.queue[self.move_counter].player_id
+        return self.current.player_id
 
 
 class Turn:
@@ -147,6 +173,8 @@ class Turn:
     Create an instance of Turn to represent a single turn in the game.
     """
 
+    __slots__ = ("player_id", "turn_number", "used_items", "turn_result")
+
     def __init__(self, turn_number: Literal[1, 0], player_id: int) -> None:
         """
         Initializes a Turn with a turn number and player ID.
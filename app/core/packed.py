@@ -0,0 +1,348 @@
+"""
+Bit-packed game state shared by scenes, the engine and snapshots.
+
+A `PackedState` is a tuple of five integers:
+- `shells`: the loaded shells, bit `i` set if `rounds[i]` is live. The next shell is the
+  last one, bit `length - 1`.
+- `length`: the number of loaded shells.
+- `inventories`: the item counters of both seats, 4 bits per item in `ItemType` order,
+  seat 0 in the low 36 bits. The counters are the players' own items, also while one of
+  them holds the opponent's inventory under adrenaline.
+- `vitals`: HP, handcuffs, adrenaline, saw and turn as bitfields, see the `*_SHIFT` constants.
+- `rng`: the state of the game's random stream.
+
+It is immutable, so a copy is the value itself, and hashing it costs five integer
+hashes. Handcuff counters below zero behave as zero and are stored so. Scenes also
+record which item was used this turn; the engine only knows that one was.
+
+`to_bytes` writes it in `SIZE` bytes.
+"""
+
+from __future__ import annotations
+
+import struct
+from collections import deque
+from typing import TYPE_CHECKING, List, NamedTuple, Optional
+
+from .engine import GameState
+from .models.ammo import AmmoType
+from .models.items import ITEM_INDEX, N_ITEMS, ItemType
+from .rng import SplitMix64
+
+if TYPE_CHECKING:
+    from .player import Player
+    from .scene import Scene
+
+ITEMS = tuple(ItemType)
+ITEM_BITS = 4
+SEAT_BITS = ITEM_BITS * N_ITEMS
+ITEM_MASK = (1 << ITEM_BITS) - 1
+
+# Fields of `vitals`: shift and width
+HP_SHIFT = (0, 4)
+HP_BITS = 4
+MAX_HP_SHIFT = 8
+TIED_SHIFT = (12, 14)
+TIED_BITS = 2
+ADRENALINE_SHIFT = (16, 17)
+# Saws on the barrel: the next shot deals `1 << saws` damage
+SAW_SHIFT = 18
+SAW_BITS = 2
+TURN_SHIFT = 20
+EXTRA_TURNS_SHIFT = 21
+EXTRA_TURNS_BITS = 3
+# An item other than adrenaline was used this turn, which one in USED_ITEM_SHIFT
+ITEM_USED_SHIFT = 24
+USED_ITEM_SHIFT = 25
+USED_ITEM_BITS = 4
+STARTED_SHIFT = 29
+ENDED_SHIFT = 30
+
+# shells, length, inventories (72 bits), vitals, rng
+FORMAT = struct.Struct("<BB9sIQ")
+SIZE = FORMAT.size
+
+
+def _field(value: int, shift: int, bits: int) -> int:
+    return (value >> shift) & ((1 << bits) - 1)
+
+
+def pack_inventory(counts: List[int]) -> int:
+    """
+    Packs the item counters of one seat, 4 bits per item.
+    """
+    packed = 0
+    for index, count in enumerate(counts):
+        packed |= count << (index * ITEM_BITS)
+    return packed
+
+
+def unpack_inventory(packed: int) -> List[int]:
+    """
+    The item counters of one seat packed by `pack_inventory`.
+    """
+    return [(packed >> (index * ITEM_BITS)) & ITEM_MASK for index in range(N_ITEMS)]
+
+
+class PackedState(NamedTuple):
+    """
+    One game in five integers, see the module documentation for the layout.
+    """
+
+    shells: int
+    length: int
+    inventories: int
+    vitals: int
+    rng: int
+
+    def hp(self, seat: int) -> int:
+        return _field(self.vitals, HP_SHIFT[seat], HP_BITS)
+
+    @property
+    def max_hp(self) -> int:
+        return _field(self.vitals, MAX_HP_SHIFT, HP_BITS)
+
+    def tied(self, seat: int) -> int:
+        return _field(self.vitals, TIED_SHIFT[seat], TIED_BITS)
+
+    def adrenaline(self, seat: int) -> bool:
+        return bool(self.vitals >> ADRENALINE_SHIFT[seat] & 1)
+
+    @property
+    def damage(self) -> int:
+        return 1 << _field(self.vitals, SAW_SHIFT, SAW_BITS)
+
+    @property
+    def turn(self) -> int:
+        return self.vitals >> TURN_SHIFT & 1
+
+    @property
+    def extra_turns(self) -> int:
+        return _field(self.vitals, EXTRA_TURNS_SHIFT, EXTRA_TURNS_BITS)
+
+    @property
+    def item_used(self) -> bool:
+        return bool(self.vitals >> ITEM_USED_SHIFT & 1)
+
+    @property
+    def started(self) -> bool:
+        return bool(self.vitals >> STARTED_SHIFT & 1)
+
+    @property
+    def ended(self) -> bool:
+        return bool(self.vitals >> ENDED_SHIFT & 1)
+
+    @property
+    def live(self) -> int:
+        """
+        The number of live shells left.
+        """
+        return self.shells.bit_count()
+
+    def rounds(self) -> List[bool]:
+        """
+        The loaded shells, True for live, in `GameState.rounds` order.
+        """
+        return [bool(self.shells >> i & 1) for i in range(self.length)]
+
+    def inventory(self, seat: int) -> List[int]:
+        """
+        The item counters of a seat, indexed by item index.
+        """
+        return unpack_inventory(self.inventories >> (seat * SEAT_BITS))
+
+    def to_bytes(self) -> bytes:
+        return FORMAT.pack(
+            self.shells, self.length, self.inventories.to_bytes(9, "little"), self.vitals, self.rng
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes, offset: int = 0) -> PackedState:
+        shells, length, inventories, vitals, rng = FORMAT.unpack_from(data, offset)
+        return cls(shells, length, int.from_bytes(inventories, "little"), vitals, rng)
+
+
+def _vitals(
+    hp: List[int],
+    max_hp: int,
+    tied: List[int],
+    adrenaline: List[bool],
+    damage: int,
+    turn: int,
+    extra_turns: int,
+    item_used: bool,
+    used_item: int,
+    started: bool,
+    ended: bool,
+) -> int:
+    return (
+        hp[0] << HP_SHIFT[0]
+        | hp[1] << HP_SHIFT[1]
+        | max_hp << MAX_HP_SHIFT
+        | max(0, tied[0]) << TIED_SHIFT[0]
+        | max(0, tied[1]) << TIED_SHIFT[1]
+        | adrenaline[0] << ADRENALINE_SHIFT[0]
+        | adrenaline[1] << ADRENALINE_SHIFT[1]
+        | (damage.bit_length() - 1) << SAW_SHIFT
+        | turn << TURN_SHIFT
+        | extra_turns << EXTRA_TURNS_SHIFT
+        | item_used << ITEM_USED_SHIFT
+        | used_item << USED_ITEM_SHIFT
+        | started << STARTED_SHIFT
+        | ended << ENDED_SHIFT
+    )
+
+
+def _own_counts(player: Optional[Player]) -> List[int]:
+    if player is None:
+        return [0] * N_ITEMS
+    return (player.adrenaline_inventory if player.adrenaline else player.inventory).counts
+
+
+def pack_scene(scene: Scene) -> PackedState:
+    """
+    Packs the game of a scene.
+
+    Args:
+    - scene (Scene): The scene, started or not. An empty seat is packed as a player
+      without HP nor items.
+
+    Returns:
+    - PackedState: Its game. Names, chat ids and the adrenaline deadlines are not part of it.
+    """
+    players = (scene.first_player, scene.second_player)
+    shells = 0
+    for index, shell in enumerate(scene.shotgun.rounds):
+        if shell == AmmoType.LIVE:
+            shells |= 1 << index
+    dealer = getattr(scene, "dealer", None)
+    used = []
+    if dealer is not None:
+        used = [item for item in dealer.current.used_items if item != ItemType.ADRENALINE]
+    seated = [player for player in players if player is not None]
+    return PackedState(
+        shells,
+        len(scene.shotgun.rounds),
+        pack_inventory(_own_counts(players[0]))
+        | pack_inventory(_own_counts(players[1])) << SEAT_BITS,
+        _vitals(
+            [player.data.hp if player else 0 for player in players],
+            seated[0].data.max_hp if seated else 0,
+            [player.tied if player else 0 for player in players],
+            [player.adrenaline if player else False for player in players],
+            scene.shotgun.damage,
+            dealer.turn_int if dealer else 0,
+            dealer.extra_turns if dealer else 0,
+            bool(used),
+            ITEM_INDEX[used[0]] if used else 0,
+            dealer is not None,
+            scene.game_ended,
+        ),
+        scene.rng.state,
+    )
+
+
+def unpack_scene(packed: PackedState, scene: Scene) -> Scene:
+    """
+    Writes a packed game into the seated players of a scene, the counterpart of `pack_scene`.
+
+    The dealer of a started game is rebuilt for the seated players, without turn history.
+    Players under adrenaline keep their adrenaline deadline.
+
+    Returns:
+    - Scene: The scene.
+    """
+    # Scenes pull in pydantic, the engine and solvers do without
+    from .inventory import Inventory
+    from .models.turn_model import Dealer, Turn
+
+    scene.rng.state = packed.rng
+    scene.game_ended = packed.ended
+    rounds = packed.rounds()
+    scene.shotgun.rounds = [AmmoType.LIVE if live else AmmoType.BLANK for live in rounds]
+    scene.shotgun.damage = packed.damage
+
+    players = (scene.first_player, scene.second_player)
+    for seat, player in enumerate(players):
+        if player is None:
+            continue
+        player.data.hp = packed.hp(seat)
+        player.data.max_hp = packed.max_hp
+        player.tied = packed.tied(seat)
+        player.adrenaline = packed.adrenaline(seat)
+        inventory = Inventory()
+        inventory.counts = packed.inventory(seat)
+        inventory.total = sum(inventory.counts)
+        player.inventory = inventory
+    # Under adrenaline the active player holds the opponent's inventory
+    for player, other in (players, players[::-1]):
+        if player is not None and other is not None and player.adrenaline:
+            player.adrenaline_inventory = player.inventory
+            player.inventory = other.inventory
+
+    if not packed.started:
+        return scene
+    dealer = getattr(scene, "dealer", None)
+    if dealer is None:
+        dealer = Dealer.__new__(Dealer)
+        dealer.max_items_per_turn = 1
+        dealer.first_player = players[0].data.chat_id
+        dealer.second_player = players[1].data.chat_id
+        dealer.move_counter = 0
+        dealer.history = deque(maxlen=16)
+        scene.dealer = dealer
+    dealer.rng = scene.rng
+    dealer.extra_turns = packed.extra_turns
+    turn = packed.turn
+    dealer.current = Turn(turn, dealer.first_player if turn == 0 else dealer.second_player)
+    if packed.item_used:
+        dealer.current.used_items.append(ITEMS[_field(packed.vitals, USED_ITEM_SHIFT, USED_ITEM_BITS)])
+    return scene
+
+
+def pack_game(state: GameState) -> PackedState:
+    """
+    Packs an engine state. Its finished turns are not part of the packed state.
+    """
+    shells = 0
+    for index, live in enumerate(state.rounds):
+        if live:
+            shells |= 1 << index
+    return PackedState(
+        shells,
+        len(state.rounds),
+        pack_inventory(state.inventory[0]) | pack_inventory(state.inventory[1]) << SEAT_BITS,
+        _vitals(
+            state.hp,
+            state.max_hp,
+            state.tied,
+            state.adrenaline,
+            state.damage,
+            state.turn,
+            state.extra_turns,
+            state.item_used,
+            0,
+            True,
+            state.winner >= 0,
+        ),
+        state.rng.state,
+    )
+
+
+def unpack_game(packed: PackedState) -> GameState:
+    """
+    The engine state of a packed game. The winner of an ended game is the seat left with HP.
+    """
+    state = GameState(packed.max_hp, packed.turn, SplitMix64())
+    state.rng.state = packed.rng
+    state.hp = [packed.hp(0), packed.hp(1)]
+    state.inventory = [packed.inventory(0), packed.inventory(1)]
+    state.rounds = packed.rounds()
+    state.damage = packed.damage
+    state.extra_turns = packed.extra_turns
+    state.item_used = packed.item_used
+    state.tied = [packed.tied(0), packed.tied(1)]
+    state.adrenaline = [packed.adrenaline(0), packed.adrenaline(1)]
+    if packed.ended:
+        state.winner = 0 if state.hp[0] > 0 else 1
+    return state
@@ -1,9 +1,47 @@
 from __future__ import annotations
+from typing import TYPE_CHECKING
 from .models.items import ItemType
-from .models.player_model import PlayerModel
-from .models.inventory import InventoryModel
+from .inventory import Inventory
 import time
 
+if TYPE_CHECKING:
+    from .models.player_model import PlayerModel
+
+# Emoji of every item, in ItemType order
+ITEM_EMOJI = ("🪚", "🍺", "🚬", "🔗", "🔍", "📞", "💊", "💉", "🔀")
+
+
+class PlayerData:
+    """
+    Plain, unvalidated player vitals used during the game.
+    Validation happens once, when the PlayerModel it is built from is created.
+    """
+
+    __slots__ = ("name", "chat_id", "hp", "max_hp")
+
+    def __init__(self, name: str, chat_id: int, hp: int, max_hp: int) -> None:
+        self.name = name
+        self.chat_id = chat_id
+        self.hp = hp
+        self.max_hp = max_hp
+
+    @classmethod
+    def from_model(cls, model: PlayerModel) -> PlayerData:
+        """
+        Builds player vitals from a validated PlayerModel.
+        """
+        return cls(model.name, model.chat_id, model.hp, model.max_hp)
+
+    def to_model(self) -> PlayerModel:
+        """
+        Exports the player vitals as a PlayerModel.
+        """
+        from .models.player_model import PlayerModel
+
+        return PlayerModel(
+            name=self.name, chat_id=self.chat_id, hp=self.hp, max_hp=self.max_hp
+        )
+
 
 class Player:
     """
@@ -13,14 +51,14 @@ class Player:
     tied = 0
     adrenaline = False
     under_adrenaline_before = 0
-    adrenaline_inventory: InventoryModel
+    adrenaline_inventory: Inventory
 
     def __init__(self, model: PlayerModel) -> None:
         """
-        Initializes a Player with a PlayerModel instance and a new InventoryModel.
+        Initializes a Player with the vitals of a PlayerModel instance and a new Inventory.
         """
-        self.data = model
-        self.inventory = InventoryModel()
+        self.data = PlayerData.from_model(model)
+        self.inventory = Inventory()
     
     def still_under_adrenaline(self) -> bool:
         return self.adrenaline
@@ -42,9 +80,9 @@ class Player:
 
     def flush_inventory(self):
         """
-        Resets the player's inventory by creating a new InventoryModel instance.
+        Resets the player's inventory by creating a new Inventory instance.
         """
-        self.inventory = InventoryModel()
+        self.inventory = Inventory()
 
     def smoke(self, hp=1):
         """
@@ -72,13 +110,8 @@ class Player:
         """
         if self.inventory.count_items() >= 8:
             return
-        
-        item_attr = item.value
-        
-        if hasattr(self.inventory, item_attr):
-            current_count = getattr(self.inventory, item_attr)
-            new_count = current_count + 1
-            setattr(self.inventory, item_attr, new_count)
+
+        self.inventory.add(item)
 
     def delete_item(
         self, item: ItemType
@@ -89,14 +122,8 @@ class Player:
         Args:
         - item (ItemType): The item to be removed.
         """
-        item_attr = item.value
-
-        # Check if the item exists in the inventory and reduce its count.
-        if hasattr(self.inventory, item_attr):
-            current_count = getattr(self.inventory, item_attr)
-            # Ensure the item count cannot go below zero.
-            new_count = max(0, current_count - 1)
-            setattr(self.inventory, item_attr, new_count)
+        # The item count cannot go below zero.
+        self.inventory.remove(item)
 
     def get_number_of_item(
         self, item: ItemType
@@ -110,7 +137,7 @@ class Player:
         Returns:
         - int: The quantity of the specified item in the player's inventory.
         """
-        return self.inventory.__getattribute__(item.value)
+        return self.inventory.count(item)
 
     def get_items_emoji(self) -> list:
         """
@@ -119,49 +146,20 @@ class Player:
         Returns:
         - list: A list of emoji representations for the items in the player's inventory.
         """
-        return self._emoji_builder(self.inventory.model_dump())
-
-    def _emoji_builder(self, blackbox: dict):
-        """
-        Builds a list of emoji representations for the items in the player's inventory.
-
-        Args:
-        - blackbox (dict): The player's inventory as a dictionary.
-
-        Returns:
-        - list: A list of emoji representations for the items in the player's inventory.
-        """
-        emoji_mapping = {
-            "handsaw": "🪚",
-            "beer": "🍺",
-            "smoke": "🚬",
-            "handcuff": "🔗",
-            "magnifying_glass": "🔍",
-            "adrenaline": "💉",
-            "inverter": "🔀",
-            "phone": "📞",
-            "pills": "💊"
-            
-        }
-
-        result = []
-        for item, count in blackbox.items():
-            if count > 0:
-                emoji = emoji_mapping.get(item, None)
-                if not emoji:
-                    raise ValueError(f"An unexpected item was given: {item}")
-                result.append(f"{emoji}x{count}")
-
-        return result
+        return [
+            f"{emoji}x{count}"
+            for emoji, count in zip(ITEM_EMOJI, self.inventory.counts)
+            if count > 0
+        ]
 
     def take_damage(self, damage: int):
         """
-        Reduces the player's HP by the specified amount of damage.
+        Reduces the player's HP by the specified amount of damage. HP cannot go below zero.
 
         Args:
         - damage (int): The amount of damage to be applied.
         """
-        self.data.hp -= damage
+        self.data.hp = max(0, self.data.hp - damage)
 
     def still_alive(self) -> bool:
         """
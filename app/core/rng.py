@@ -0,0 +1,103 @@
+import math
+import secrets
+from typing import MutableSequence, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+
+def derive_seed(root: int, index: int) -> int:
+    """
+    Derives an independent 64-bit seed for the index-th stream of a root seed.
+
+    Args:
+    - root (int): The root seed.
+    - index (int): The index of the derived stream.
+
+    Returns:
+    - int: A well-mixed 64-bit seed.
+    """
+    return SplitMix64((root + index * _GOLDEN_GAMMA) & _MASK64).next_u64()
+
+
+class SplitMix64:
+    """
+    A tiny SplitMix64 pseudo-random stream.
+
+    The whole generator state is one 64-bit integer, so copying it is as cheap as
+    copying an int. The method names follow the subset of the `random.Random` API
+    used by the game, so it can be passed wherever the rules expect a generator.
+    """
+
+    __slots__ = ("state",)
+
+    def __init__(self, seed: int = 0) -> None:
+        self.state = seed & _MASK64
+
+    def next_u64(self) -> int:
+        """Advances the stream and returns the next 64-bit output."""
+        self.state = z = (self.state + _GOLDEN_GAMMA) & _MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return z ^ (z >> 31)
+
+    def random(self) -> float:
+        """Returns a float uniformly distributed in [0, 1)."""
+        return (self.next_u64() >> 11) * (1.0 / (1 << 53))
+
+    def randbelow(self, n: int) -> int:
+        """Returns an int uniformly distributed in [0, n)."""
+        return (self.next_u64() * n) >> 64
+
+    def randint(self, a: int, b: int) -> int:
+        """Returns an int uniformly distributed in [a, b], both ends included."""
+        return a + self.randbelow(b - a + 1)
+
+    def choice(self, seq: Sequence[T]) -> T:
+        """Returns a uniformly chosen element of a non-empty sequence."""
+        return seq[self.randbelow(len(seq))]
+
+    def uniform(self, a: float, b: float) -> float:
+        """Returns a float uniformly distributed between a and b."""
+        return a + (b - a) * self.random()
+
+    def normalvariate(self, mu: float = 0.0, sigma: float = 1.0) -> float:
+        """Returns a normally distributed float (Box-Muller transform)."""
+        u1 = 1.0 - self.random()
+        u2 = self.random()
+        return mu + sigma * math.sqrt(-2.0 * math.log(u1)) * math.cos(2.0 * math.pi * u2)
+
+    def shuffle(self, x: MutableSequence) -> None:
+        """Shuffles a mutable sequence in place (Fisher-Yates)."""
+        for i in range(len(x) - 1, 0, -1):
+            j = self.randbelow(i + 1)
+            x[i], x[j] = x[j], x[i]
+
+    def copy(self) -> "SplitMix64":
+        """Returns an independent copy of the stream at its current position."""
+        return SplitMix64(self.state)
+
+
+class StreamSpawner:
+    """
+    Spawns independent SplitMix64 streams from one root seed.
+
+    The n-th spawned stream is always seeded with `derive_seed(root, n)`, so a whole
+    process (or a simulation worker given its own root) can be replayed from its root seed.
+    """
+
+    def __init__(self, root: Optional[int] = None) -> None:
+        self.root = secrets.randbits(64) if root is None else root & _MASK64
+        self.spawned = 0
+
+    def spawn_seed(self) -> int:
+        """Returns the seed of the next stream."""
+        seed = derive_seed(self.root, self.spawned)
+        self.spawned += 1
+        return seed
+
+    def spawn(self) -> SplitMix64:
+        """Returns the next stream."""
+        return SplitMix64(self.spawn_seed())
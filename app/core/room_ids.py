@@ -0,0 +1,131 @@
+"""
+Allocation of six-digit room codes.
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from .rng import SplitMix64, derive_seed
+
+LOWEST_ID = 100000
+HIGHEST_ID = 999999
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def shard_of(room_id: int, shards: int) -> int:
+    """
+    Returns the worker owning a room. Room ids are mixed first, so consecutive ids spread evenly.
+    """
+    return derive_seed(room_id, 0) % shards
+
+
+def _shards_of(room_ids: np.ndarray, shards: int) -> np.ndarray:
+    # `shard_of` over an array: the first SplitMix64 output, uint64 arithmetic wraps around
+    import numpy as np
+
+    z = room_ids.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return (z ^ (z >> np.uint64(31))) % np.uint64(shards)
+
+
+def _to_array(values: np.ndarray) -> array:
+    # Copies the buffer, much faster than going through a list of ints
+    result = array("l")
+    result.frombytes(values.astype(f"i{result.itemsize}").tobytes())
+    return result
+
+
+class RoomIdAllocator:
+    """
+    Hands out unused room codes in random order, in O(1).
+
+    The codes are kept in one array split in two parts: free codes first, used codes
+    after them. Allocating swaps a random free code to the end of the free part,
+    releasing swaps it back, and a second array keeps the position of every code,
+    so any code can be reserved or released in place. Memory is fixed at start.
+
+    Attributes:
+    - free (int): Number of free codes.
+    """
+
+    def __init__(self, rng: SplitMix64, shard: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Args:
+        - rng (SplitMix64): The stream codes are drawn from.
+        - shard (Optional[Tuple[int, int]]): `(shard, shards)` to only hand out the codes
+          owned by one worker, see `shard_of`.
+        """
+        # NumPy only builds the tables, importing the engine does not load it
+        import numpy as np
+
+        self.rng = rng
+        codes = np.arange(LOWEST_ID, HIGHEST_ID + 1)
+        if shard is not None:
+            index, shards = shard
+            codes = codes[_shards_of(codes, shards) == index]
+        positions = np.full(HIGHEST_ID - LOWEST_ID + 1, -1)
+        positions[codes - LOWEST_ID] = np.arange(len(codes))
+        self._codes = _to_array(codes)
+        self._positions = _to_array(positions)
+        self.free = len(self._codes)
+
+    def __len__(self) -> int:
+        """Number of used codes."""
+        return len(self._codes) - self.free
+
+    def _position(self, code: int) -> int:
+        if not LOWEST_ID <= code <= HIGHEST_ID:
+            return -1
+        return self._positions[code - LOWEST_ID]
+
+    def _swap(self, i: int, j: int):
+        codes, positions = self._codes, self._positions
+        a, b = codes[i], codes[j]
+        codes[i], codes[j] = b, a
+        positions[a - LOWEST_ID], positions[b - LOWEST_ID] = j, i
+
+    def is_used(self, code: int) -> bool:
+        position = self._position(code)
+        return position >= self.free
+
+    def allocate(self) -> int:
+        """
+        Takes a random free code.
+
+        Returns:
+        - int: The code.
+        """
+        if not self.free:
+            raise Exception("No free room ids left")
+        self.free -= 1
+        self._swap(self.rng.randbelow(self.free + 1), self.free)
+        return self._codes[self.free]
+
+    def reserve(self, code: int) -> bool:
+        """
+        Marks a chosen code as used.
+
+        Returns:
+        - bool: False if the code is already used or not handed out by this allocator.
+        """
+        position = self._position(code)
+        if position < 0 or position >= self.free:
+            return False
+        self.free -= 1
+        self._swap(position, self.free)
+        return True
+
+    def release(self, code: int):
+        """
+        Returns a code to the free part. Unknown and free codes are ignored.
+        """
+        position = self._position(code)
+        if position < self.free:
+            return
+        self._swap(position, self.free)
+        self.free += 1
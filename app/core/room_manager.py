@@ -1,26 +1,145 @@
-from re import L
-from typing import Any
+import time
+from typing import Any, Dict, List, Literal, MutableMapping, NamedTuple, Optional, Tuple, Union
+from .knowledge import Knowledge
+from .mcts import Observation, observe_scene
+from .models.ammo import AmmoType
+from .models.items import ItemType
 from .models.player_model import PlayerModel
+from .models.turn_model import TurnResult
+from .game_log import GameLogWriter
+from .rng import StreamSpawner
+from .room_ids import RoomIdAllocator
+from .timing_wheel import Timer, TimingWheel
 from .scene import Scene
-from aiogram.types import Message
+
+# Chat ids of /solo dealers, far below the ids of Telegram chats
+SOLO_DEALER_BASE = -(1 << 60)
+
+
+def solo_dealer_id(room_id: int) -> int:
+    """
+    The chat id of the dealer seated in a /solo room.
+    """
+    return SOLO_DEALER_BASE - room_id
+
+
+def is_solo_dealer(chat_id: Optional[int]) -> bool:
+    return chat_id is not None and chat_id <= SOLO_DEALER_BASE
+
+
+class TurnOutcome(NamedTuple):
+    """
+    Result of a move requested by a player.
+
+    Attributes:
+    - your_turn (bool): False if it was not the player's turn. Nothing was played then.
+    - active_id (int): Chat id of the player whose turn it was.
+    - passive_id (int): Chat id of the other player.
+    - turn_result (Optional[TurnResult]): The result of the turn, None if nothing was played.
+    - winner_id (Optional[int]): Chat id of the winner if the game has ended.
+    - loser_id (Optional[int]): Chat id of the loser if the game has ended.
+    - adrenaline_left (Optional[float]): Seconds left to use a stolen item, if the move
+      put the player under adrenaline.
+    - turn_seconds (Optional[float]): Time spent in `Scene.make_turn`, None if nothing was played.
+    """
+
+    your_turn: bool
+    active_id: int
+    passive_id: int
+    turn_result: Optional[TurnResult] = None
+    winner_id: Optional[int] = None
+    loser_id: Optional[int] = None
+    adrenaline_left: Optional[float] = None
+    turn_seconds: Optional[float] = None
+
+
+class JoinResult(NamedTuple):
+    """
+    Result of `RoomsManager.join_room`.
+
+    Attributes:
+    - turn_result (Optional[TurnResult]): The start of the game, None while the room waits
+      for a second player.
+    - replaced (Optional[int]): Chat id of the player who lost the second seat, if any.
+    """
+
+    turn_result: Optional[TurnResult]
+    replaced: Optional[int]
 
 
 class RoomsManager:
-    search_lobby: dict[int, dict[str, Any]]
-    ROOMS: dict[int, Scene]
+    """
+    Registry of the rooms and their players.
+
+    `PLAYERS_TO_ROOMS` and `ROOMS_TO_PLAYERS` always describe the same seating: a room
+    is closed with all its players. Every room and every handed out room id has a last
+    activity time, and `reap` closes those idle for longer than `idle_timeout`.
+
+    `knowledge` follows what every seated player knows of the loaded shells, which is
+    all `observe` tells a /solo dealer about the loadout.
+    """
+
+    ROOMS: MutableMapping[int, Scene]
     PLAYERS_TO_ROOMS: dict[int, int]
+    ROOMS_TO_PLAYERS: dict[int, List[int]]
+
+    def __init__(
+        self,
+        root_seed: Optional[int] = None,
+        log: Optional[GameLogWriter] = None,
+        rooms: Optional[MutableMapping[int, Scene]] = None,
+        players_to_rooms: Optional[dict[int, int]] = None,
+        idle_timeout: float = 3600.0,
+        shard: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        self.ROOMS = rooms if rooms is not None else {}
+        self.PLAYERS_TO_ROOMS = dict(players_to_rooms or {})
+        self.ROOMS_TO_PLAYERS = {room_id: [] for room_id in self.ROOMS}
+        for player_id, room_id in self.PLAYERS_TO_ROOMS.items():
+            self.ROOMS_TO_PLAYERS.setdefault(room_id, []).append(player_id)
+        # Every room gets its own stream spawned from the root seed
+        self.seeds = StreamSpawner(root_seed)
+        self.rng = self.seeds.spawn()
+        self.log = log
+        self.room_ids = RoomIdAllocator(self.rng, shard)
+
+        self.idle_timeout = idle_timeout
+        self.last_activity: Dict[int, float] = {}
+        # One idle timer per room, pushed back lazily when it fires after newer activity
+        self._idle_wheel = TimingWheel(resolution=1.0, now=time.monotonic())
+        self._idle_timers: Dict[int, Timer] = {}
+        self.rooms_created = 0
+        self.rooms_closed = 0
+        self.rooms_evicted = 0
+        self.knowledge: Dict[int, Knowledge] = {}
 
-    def __init__(self) -> None:
-        self.search_lobby = {}
-        self.ROOMS = {}
-        self.PLAYERS_TO_ROOMS = {}
+        for room_id in self.ROOMS_TO_PLAYERS:
+            self.room_ids.reserve(room_id)
+            self._touch(room_id)
+
+    def _touch(self, room_id: int, now: Optional[float] = None):
+        self.last_activity[room_id] = time.monotonic() if now is None else now
+        if room_id not in self._idle_timers:
+            self._idle_timers[room_id] = self._idle_wheel.schedule(
+                self.last_activity[room_id] + self.idle_timeout, room_id
+            )
+
+    def new_room_id(self) -> int:
+        room_id = self.room_ids.allocate()
+        # An id handed out but never used for a room is released by the reaper
+        self._touch(room_id)
+        return room_id
 
     def create_room(self, room_id: int):
 
         if self.ROOMS.get(room_id, None):
             return
 
-        self.ROOMS[room_id] = Scene()
+        self.room_ids.reserve(room_id)
+        self.ROOMS[room_id] = Scene(seed=self.seeds.spawn_seed(), log=self.log)
+        self.ROOMS_TO_PLAYERS[room_id] = []
+        self.rooms_created += 1
+        self._touch(room_id)
 
     def get_room(self, room_id: int) -> Scene:
         room = self.ROOMS.get(room_id, None)
@@ -32,9 +151,15 @@ class RoomsManager:
         room = self.ROOMS.get(room_id, None)
         return room
 
-    def reg_player_in_room(self, player_name: str, player_id: int, room_id: int):
+    def reg_player_in_room(self, player_name: str, player_id: int, room_id: int) -> Optional[int]:
+        """
+        Seats a player in a room, the first free seat or the second one.
 
+        Returns:
+        - Optional[int]: The chat id of the player who lost the second seat, if any.
+        """
         self.del_player_from_rooms(player_id)
+        replaced = None
 
         room = self.get_room(room_id)
 
@@ -42,19 +167,107 @@ class RoomsManager:
             player_seat = 0
         else:
             player_seat = 1
+            if room.second_player is not None:
+                # The newcomer takes the seat, the previous player is no longer in the room
+                replaced = room.second_player.data.chat_id
+                self.PLAYERS_TO_ROOMS.pop(replaced, None)
+                self.ROOMS_TO_PLAYERS[room_id].remove(replaced)
+                self.knowledge.pop(replaced, None)
 
         room.add_player(
             PlayerModel(name=player_name, chat_id=player_id, hp=1, max_hp=1),
             player_seat=player_seat,
         )
         self.PLAYERS_TO_ROOMS[player_id] = room_id
+        self.ROOMS_TO_PLAYERS.setdefault(room_id, []).append(player_id)
+        self.knowledge[player_id] = Knowledge()
+        self._touch(room_id)
+        return replaced
+
+    def join_room(self, room_id: int, player_name: str, player_id: int) -> JoinResult:
+        """
+        Seats a player in a room in one step: creates the room if there is none, and
+        starts the game once both seats are taken. Concurrent joins of one room are
+        ordered by the caller, so exactly one of them starts the game.
+
+        Returns:
+        - JoinResult: The start of the game, None while waiting for an opponent, and the
+          player who lost the second seat, if any.
+        """
+        if self.PLAYERS_TO_ROOMS.get(player_id) == room_id:
+            return JoinResult(None, None)
+        self.create_room(room_id)
+        replaced = self.reg_player_in_room(player_name, player_id, room_id)
+        room = self.get_room(room_id)
+        if room.first_player is None or room.second_player is None:
+            return JoinResult(None, replaced)
+        return JoinResult(self.start_game(room_id), replaced)
 
-    def del_player_from_rooms(self, player_id: int):
+    def del_player_from_rooms(self, player_id: int) -> List[int]:
+        """
+        Closes the room of a player, which removes the opponent from it as well.
 
+        Returns:
+        - List[int]: The chat ids of the players who were in the room.
+        """
         room = self.PLAYERS_TO_ROOMS.get(player_id, None)
-        if room:
-            self.ROOMS.pop(room, None)
+        players = []
+        if room is not None:
+            players = self._close_room(room)
+            self.rooms_closed += 1
         self.PLAYERS_TO_ROOMS.pop(player_id, None)
+        return players
+
+    def _close_room(self, room_id: int) -> List[int]:
+        self.ROOMS.pop(room_id, None)
+        players = self.ROOMS_TO_PLAYERS.pop(room_id, [])
+        for player_id in players:
+            if self.PLAYERS_TO_ROOMS.get(player_id) == room_id:
+                del self.PLAYERS_TO_ROOMS[player_id]
+            self.knowledge.pop(player_id, None)
+        self.last_activity.pop(room_id, None)
+        timer = self._idle_timers.pop(room_id, None)
+        if timer is not None:
+            self._idle_wheel.cancel(timer)
+        self.room_ids.release(room_id)
+        return players
+
+    def reap(self, now: Optional[float] = None) -> List[int]:
+        """
+        Closes the rooms idle for longer than `idle_timeout`.
+
+        Args:
+        - now (Optional[float]): The current `time.monotonic()` time.
+
+        Returns:
+        - List[int]: The chat ids of the evicted players.
+        """
+        now = time.monotonic() if now is None else now
+        evicted = []
+        for timer in self._idle_wheel.advance(now):
+            room_id = timer.payload
+            del self._idle_timers[room_id]
+            last_activity = self.last_activity[room_id]
+            if last_activity + self.idle_timeout > now:
+                self._touch(room_id, last_activity)
+                continue
+            if room_id in self.ROOMS_TO_PLAYERS:
+                self.rooms_evicted += 1
+            evicted += self._close_room(room_id)
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the room counters.
+        """
+        return {
+            "live_rooms": len(self.ROOMS_TO_PLAYERS),
+            "seated_players": len(self.PLAYERS_TO_ROOMS),
+            "rooms_created": self.rooms_created,
+            "rooms_closed": self.rooms_closed,
+            "rooms_evicted": self.rooms_evicted,
+            "free_room_ids": self.room_ids.free,
+        }
 
     def get_room_id_by_player(self, chat_id: int):
         room_id = self.PLAYERS_TO_ROOMS.get(chat_id, None)
@@ -70,3 +283,137 @@ class RoomsManager:
         first_player = room.first_player.data.chat_id
         second_player = room.second_player.data.chat_id
         return first_player, second_player
+
+    def start_game(self, room_id: int) -> TurnResult:
+        """
+        Starts the game of a full room.
+        """
+        room = self.get_room(room_id)
+        self._touch(room_id)
+        turn_result = room.start()
+        live, blank = self._loadout(room)
+        for player_id in self.ROOMS_TO_PLAYERS.get(room_id, ()):
+            self.knowledge.setdefault(player_id, Knowledge()).loadout(live, blank)
+        return turn_result
+
+    def observe(self, chat_id: int) -> Optional[Observation]:
+        """
+        What a player knows of their game, for a /solo dealer to search its move.
+
+        Returns:
+        - Optional[Observation]: None if it is not the player's turn.
+        """
+        room = self.get_room(self.get_room_id_by_player(chat_id))
+        if room.game_ended or room.dealer.player_id != chat_id:
+            return None
+        return observe_scene(room, self.knowledge.get(chat_id))
+
+    def play_turn(
+        self,
+        chat_id: int,
+        action: Optional[Union[ItemType, Literal["me", "him"]]],
+    ) -> TurnOutcome:
+        """
+        Plays a move of a player. Both players leave their room when the game ends.
+
+        Args:
+        - chat_id (int): The chat id of the player.
+        - action (Optional[Union[ItemType, Literal["me", "him"]]]): The move, None if the
+          player sent something that is not a move.
+
+        Returns:
+        - TurnOutcome: The outcome of the move.
+        """
+        room_id = self.get_room_id_by_player(chat_id)
+        room = self.get_room(room_id)
+        self._touch(room_id)
+        active_user, passive_user = room.solve_players()
+        active_id, passive_id = active_user.data.chat_id, passive_user.data.chat_id
+
+        if chat_id != active_id:
+            return TurnOutcome(False, active_id, passive_id)
+        if action is None:
+            return TurnOutcome(True, active_id, passive_id)
+
+        rounds = room.shotgun.rounds
+        loaded = len(rounds)
+        next_live = bool(rounds) and rounds[-1] == AmmoType.LIVE
+        seen = self._peek(room, action)
+        items_before = self._count_items(room, action)
+
+        started = time.perf_counter()
+        turn_result = room.make_turn(action, chat_id)
+        turn_seconds = time.perf_counter() - started
+
+        item_used = self._count_items(room, action) < items_before
+        rounds = room.shotgun.rounds
+        for player_id in self.ROOMS_TO_PLAYERS.get(room_id, ()):
+            knowledge = self.knowledge.get(player_id)
+            if knowledge is None:
+                # Players of restored rooms are followed from their next move
+                knowledge = self.knowledge[player_id] = Knowledge()
+            if turn_result.rounds or knowledge.length != loaded:
+                # A recharge shows the new loadout; a tracker that missed moves, as in a
+                # restored room, starts over from the shells left
+                knowledge.loadout(*self._loadout(room))
+            elif len(rounds) < loaded:
+                # Fired or ejected, everyone sees the shell
+                knowledge.eject(next_live)
+            elif item_used and action == ItemType.INVERTER:
+                knowledge.invert()
+            elif item_used and seen is not None and player_id == chat_id:
+                knowledge.reveal(seen, rounds[seen] == AmmoType.LIVE)
+        if not turn_result.is_game_ended:
+            adrenaline_left = (
+                active_user.still_under_adrenaline_time() if active_user.adrenaline else None
+            )
+            return TurnOutcome(
+                True,
+                active_id,
+                passive_id,
+                turn_result,
+                adrenaline_left=adrenaline_left,
+                turn_seconds=turn_seconds,
+            )
+
+        if passive_user.data.hp < 1:
+            winner_id, loser_id = active_id, passive_id
+        else:
+            winner_id, loser_id = passive_id, active_id
+        self.del_player_from_rooms(loser_id)
+        self.del_player_from_rooms(winner_id)
+        return TurnOutcome(
+            True, active_id, passive_id, turn_result, winner_id, loser_id, turn_seconds=turn_seconds
+        )
+
+    @staticmethod
+    def _loadout(room: Scene) -> Tuple[int, int]:
+        """
+        The live and blank shells loaded in a room.
+        """
+        live = sum(1 for shell in room.shotgun.rounds if shell == AmmoType.LIVE)
+        return live, len(room.shotgun.rounds) - live
+
+    @staticmethod
+    def _peek(room: Scene, action) -> Optional[int]:
+        """
+        The index of the shell a GLASS or a PHONE is about to show.
+        """
+        rounds = room.shotgun.rounds
+        if not rounds:
+            return None
+        if action == ItemType.GLASS:
+            return len(rounds) - 1
+        if action == ItemType.PHONE:
+            # The phone draws its position from the scene's stream, see use_item
+            return len(rounds) - 1 - room.rng.copy().randint(0, len(rounds) - 1)
+        return None
+
+    @staticmethod
+    def _count_items(room: Scene, item) -> int:
+        if type(item) is not ItemType:
+            return 0
+        return sum(
+            (p.adrenaline_inventory if p.adrenaline else p.inventory).count(item)
+            for p in (room.first_player, room.second_player)
+        )
@@ -1,4 +1,5 @@
-from typing import List, Literal, Tuple, Union
+from __future__ import annotations
+from typing import TYPE_CHECKING, List, Literal, Optional, Tuple, Union
 
 
 from .models.turn_model import TurnResult, Dealer
@@ -6,12 +7,18 @@ from .models.player_model import PlayerModel
 from .player import Player
 from .shotgun import Shotgun
 from .use_item import use_item
-import random
+from .rng import SplitMix64
+from .engine import ADRENALINE_EXPIRED, action_from_scene
+from .game_log import GameLogWriter, GameRecorder, RecordType
+import secrets
 
 
-from core.models.items import ItemType
+from core.models.items import ITEM_INDEX, ItemType
 from core.models.ammo import AmmoType
 
+if TYPE_CHECKING:
+    from .loadout import LoadoutDispenser
+
 
 class Scene:
     """
@@ -25,6 +32,12 @@ class Scene:
     - games (int): Number of games to play. #WIP
     - game_ended (bool): Indicates whether the current game has ended.
     - score (int): Current score of the game. #WIP
+    - source (Optional[LoadoutDispenser]): Pre-generated loadouts and item draws, used instead of the rng.
+    - seed (int): The seed of the scene's random stream. Replaying the same actions
+      on a Scene created with the same seed reproduces the game exactly.
+    - rng (SplitMix64): The random stream of the scene.
+    - log (Optional[GameLogWriter]): Binary game log the scene records its games to.
+      Recorded games can only be replayed if the scene has no source.
     """
 
     first_player: Player
@@ -47,9 +60,20 @@ class Scene:
         ItemType.INVERTER,
     ]
 
-    def __init__(self, games: int = 3) -> None:
+    def __init__(
+        self,
+        games: int = 3,
+        source: Optional[LoadoutDispenser] = None,
+        seed: Optional[int] = None,
+        log: Optional[GameLogWriter] = None,
+    ) -> None:
         self.games = games
-        self.shotgun = Shotgun()
+        self.log = log
+        self.recorder: Optional[GameRecorder] = None
+        self.source = source
+        self.seed = secrets.randbits(64) if seed is None else seed
+        self.rng = SplitMix64(self.seed)
+        self.shotgun = Shotgun(source=source, rng=self.rng)
         self.game_ended = True
         self.first_player = None
         self.second_player = None
@@ -75,16 +99,23 @@ class Scene:
         - TurnResult: The result of the initial game setup.
         """
 
+        # The game is identified by the position of the random stream it starts from
+        if self.log is not None:
+            self.recorder = GameRecorder(self.log, self.rng.state)
+
         # Create game logic manager to control the game
         self.dealer = Dealer(
-            self.first_player.data.chat_id, self.second_player.data.chat_id
+            self.first_player.data.chat_id,
+            self.second_player.data.chat_id,
+            rng=self.rng,
         )
         turn_result = TurnResult()
 
         # Set random HP for players
-        hp = random.randint(3, 6)
+        hp = self.rng.randint(3, 6)
         self.first_player.set_hp(hp)
         self.second_player.set_hp(hp)
+        self._record(RecordType.START, self.dealer.turn_int, hp)
 
         # Flush player inventories
         self.first_player.flush_inventory()
@@ -106,9 +137,10 @@ class Scene:
 
         # Recharge shotgun
         self.shotgun.recharge()
+        self._record_loadout()
 
         # Set a number of items to distribute
-        n = random.choice([1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 3, 4])
+        n = self._choice([1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 3, 4])
 
         # Distribute items to players
         self.distribute_items(self.first_player, n)
@@ -157,6 +189,10 @@ class Scene:
         # Determine the active and passive players for the current turn
         player, target = self.solve_players()
 
+        if self.recorder is not None:
+            self._record_action(action, player, turn_con)
+        hp_before = (self.first_player.data.hp, self.second_player.data.hp)
+
         # Process the chosen action based on the provided action string
         if action == "me":
             # Handle action when player chooses to perform an action on themselves
@@ -191,6 +227,11 @@ class Scene:
         else:
             raise ValueError("This is not an action or a valid item.")
 
+        if self.recorder is not None:
+            for seat, player_ in enumerate((self.first_player, self.second_player)):
+                if player_.data.hp != hp_before[seat]:
+                    self._record(RecordType.HP, seat, player_.data.hp)
+
         # Check game state and update TurnResult accordingly
         if not self.first_player.still_alive():
             self.handle_game_end(self.second_player, turn_result)
@@ -219,6 +260,7 @@ class Scene:
 
         # Set the game as ended
         self.game_ended = True
+        self._record(RecordType.GAME_END, 0 if winner_player == self.first_player else 1)
 
         # Prepare the action results message
         action_results = f"{winner_player.data.name} has won!\n"
@@ -246,9 +288,10 @@ class Scene:
         # Reload shotgun rounds and get the updated rounds in TurnResult
 
         turn_result.rounds = "Loadout: " + self.shotgun.recharge()
+        self._record_loadout()
 
         # Determine the number of items to distribute randomly
-        n = random.choice([1, 1, 1, 1, 2, 2, 2, 3, 3, 4])
+        n = self._choice([1, 1, 1, 1, 2, 2, 2, 3, 3, 4])
 
         # Distribute items to the first player and update TurnResult
         blackbox_one = self.distribute_items(self.first_player, n)
@@ -331,16 +374,52 @@ class Scene:
         If the inventory is overflowing, the distribution stops.
         """
         # Create a list of randomly selected items for distribution
-        blackbox = [random.choice(self.ITEMS) for _ in range(desired_length)]
+        if self.source is not None:
+            blackbox = self.source.next_items(desired_length)
+        else:
+            blackbox = [self.rng.choice(self.ITEMS) for _ in range(desired_length)]
 
         # Distribute the items to the player, updating their inventory
         for item in blackbox:
+            added = player.inventory.count_items() < 8
             player.add_item(item)
+            if added:
+                self._record(
+                    RecordType.ITEM_DRAWN,
+                    0 if player == self.first_player else 1,
+                    ITEM_INDEX[item],
+                )
 
 
         # Return emoji representations of the distributed items
         return player.get_items_emoji()
 
+    def _record(self, kind: RecordType, seat: int = -1, value: int = 0):
+        if self.recorder is not None:
+            self.recorder.record(kind, seat, value)
+
+    def _record_loadout(self):
+        if self.recorder is not None:
+            live = sum(1 for r in self.shotgun.rounds if r == AmmoType.LIVE)
+            blank = len(self.shotgun.rounds) - live
+            self.recorder.record(RecordType.LOADOUT, -1, live << 4 | blank)
+
+    def _record_action(self, action, player: Player, seat: int):
+        code = action_from_scene(action)
+        # Replays need to know whether the adrenaline window had already run out
+        if (
+            type(action) is ItemType
+            and player.still_under_adrenaline()
+            and player.still_under_adrenaline_time() <= 0
+        ):
+            code |= ADRENALINE_EXPIRED
+        self.recorder.record(RecordType.ACTION, seat, code)
+
+    def _choice(self, seq: list):
+        if self.source is not None:
+            return self.source.choice(seq)
+        return self.rng.choice(seq)
+
     def get_current_username(self) -> str:
         """
         Retrieves the name of the current active player.
@@ -0,0 +1,353 @@
+"""
+Async access to the rooms, either in-process or sharded across worker processes.
+
+`LocalRooms` wraps one `RoomsManager` in the current process. `ShardedRooms` runs one
+`RoomsManager` per worker process and routes every room to the worker owning
+`shard_of(room_id)`. A player's commands go to the worker owning their room. Every
+worker handles its commands one by one, so each room stays single-threaded and ordered,
+while different rooms run on different cores.
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import time
+from multiprocessing.connection import Connection
+from typing import Dict, List, Literal, Optional, Tuple, Union
+
+from .engine import action_from_scene, action_to_scene
+from .game_log import GameLogWriter
+from .mcts import Observation
+from .models.items import ItemType
+from .models.turn_model import TurnResult
+from .rng import StreamSpawner
+from .room_ids import shard_of
+from .room_manager import RoomsManager, TurnOutcome
+
+logger = logging.getLogger()
+
+Action = Optional[Union[ItemType, Literal["me", "him"]]]
+
+
+class LocalRooms:
+    """
+    Async facade over a RoomsManager living in the current process.
+
+    Rooms kept in a store that reads from disk, such as `PersistentRooms`, are loaded
+    through its `preload` before the manager touches them, so the read does not run on
+    the event loop.
+    """
+
+    def __init__(self, manager: RoomsManager) -> None:
+        self.manager = manager
+        self._preload = getattr(manager.ROOMS, "preload", None)
+
+    async def _load(self, room_id: Optional[int]):
+        if room_id is not None and self._preload is not None:
+            await self._preload(room_id)
+
+    async def _load_player(self, chat_id: int):
+        await self._load(self.manager.PLAYERS_TO_ROOMS.get(chat_id))
+
+    def room_of(self, chat_id: int) -> Optional[int]:
+        return self.manager.PLAYERS_TO_ROOMS.get(chat_id)
+
+    async def new_room_id(self) -> int:
+        return self.manager.new_room_id()
+
+    async def check_room(self, room_id: int) -> bool:
+        await self._load(room_id)
+        return self.manager.check_room(room_id) is not None
+
+    async def create_room(self, room_id: int):
+        await self._load(room_id)
+        self.manager.create_room(room_id)
+
+    async def reg_player_in_room(self, player_name: str, player_id: int, room_id: int):
+        await self._load_player(player_id)
+        await self._load(room_id)
+        self.manager.reg_player_in_room(player_name, player_id, room_id)
+
+    async def join_room(
+        self, room_id: int, player_name: str, player_id: int
+    ) -> Optional[TurnResult]:
+        await self._load_player(player_id)
+        await self._load(room_id)
+        return self.manager.join_room(room_id, player_name, player_id).turn_result
+
+    async def del_player_from_rooms(self, player_id: int):
+        await self._load_player(player_id)
+        self.manager.del_player_from_rooms(player_id)
+
+    async def get_players_chatid(self, chat_id: int) -> Tuple[int, int]:
+        await self._load_player(chat_id)
+        return self.manager.get_players_chatid(chat_id)
+
+    async def start_game(self, room_id: int) -> TurnResult:
+        await self._load(room_id)
+        return self.manager.start_game(room_id)
+
+    async def play_turn(self, chat_id: int, action: Action) -> TurnOutcome:
+        await self._load_player(chat_id)
+        return self.manager.play_turn(chat_id, action)
+
+    async def observe(self, chat_id: int) -> Optional[Observation]:
+        await self._load_player(chat_id)
+        return self.manager.observe(chat_id)
+
+    async def reap(self) -> List[int]:
+        return self.manager.reap()
+
+    async def stats(self) -> Dict[str, int]:
+        return self.manager.stats()
+
+    async def close(self):
+        pass
+
+
+def _worker_main(
+    conn: Connection,
+    root_seed: int,
+    log_path: Optional[str],
+    idle_timeout: float,
+    shard: Tuple[int, int],
+    log_flush_interval: float = 1.0,
+):
+    """
+    Worker loop: executes `(request_id, method, args)` commands on a local RoomsManager
+    and answers `(request_id, ok, result)`. The worker only hands out the room ids it owns.
+    The game log is flushed whenever no command arrives for `log_flush_interval` seconds,
+    and at least once per interval while commands keep coming.
+    """
+    log = GameLogWriter(log_path) if log_path else None
+    manager = RoomsManager(root_seed=root_seed, log=log, idle_timeout=idle_timeout, shard=shard)
+    flushed_at = time.monotonic()
+    try:
+        while True:
+            if log is not None:
+                now = time.monotonic()
+                if now - flushed_at >= log_flush_interval or not conn.poll(log_flush_interval):
+                    log.flush()
+                    flushed_at = time.monotonic()
+                    continue
+            try:
+                request_id, method, args = conn.recv()
+            except EOFError:
+                break
+            try:
+                if method == "play_turn":
+                    chat_id, code = args
+                    args = (chat_id, None if code < 0 else action_to_scene(code))
+                result = getattr(manager, method)(*args)
+                if method == "check_room":
+                    result = result is not None
+                conn.send((request_id, True, result))
+            except Exception as e:
+                conn.send((request_id, False, e))
+    finally:
+        if log is not None:
+            log.close()
+
+
+class ShardedRooms:
+    """
+    Rooms spread over worker processes by the hash of their room id. A worker that dies
+    is started again: the requests waiting on it fail, and its rooms are lost with it.
+
+    Attributes:
+    - shards (int): Number of worker processes.
+    - chat_rooms (Dict[int, int]): The room of every seated player, its worker is `shard_of(room)`.
+    """
+
+    def __init__(
+        self,
+        shards: int,
+        root_seed: Optional[int] = None,
+        log_path: Optional[str] = None,
+        idle_timeout: float = 3600.0,
+        log_flush_interval: float = 1.0,
+    ) -> None:
+        self.shards = shards
+        self.chat_rooms: Dict[int, int] = {}
+        self.seeds = StreamSpawner(root_seed)
+        self.rng = self.seeds.spawn()
+        self.log_path = log_path
+        self.log_flush_interval = log_flush_interval
+        self.idle_timeout = idle_timeout
+
+        self._conns: List[Connection] = []
+        self._processes = []
+        self._request_ids = itertools.count()
+        # Requests waiting for an answer, by shard
+        self._pending: List[Dict[int, asyncio.Future]] = [{} for _ in range(shards)]
+        self._started = False
+
+    def _start(self):
+        # Workers are started from the running loop, not on import: spawned workers
+        # import the main module again, which must not start workers of its own
+        for shard in range(self.shards):
+            self._conns.append(None)
+            self._processes.append(None)
+            self._start_worker(shard)
+        self._started = True
+
+    def _start_worker(self, shard: int):
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=_worker_main,
+            args=(
+                child_conn,
+                self.seeds.spawn_seed(),
+                f"{self.log_path}.{shard}" if self.log_path else None,
+                self.idle_timeout,
+                (shard, self.shards),
+                self.log_flush_interval,
+            ),
+            name=f"rooms-shard-{shard}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), self._on_readable, shard)
+        self._conns[shard] = parent_conn
+        self._processes[shard] = process
+
+    def _on_readable(self, shard: int):
+        conn = self._conns[shard]
+        pending = self._pending[shard]
+        while conn.poll():
+            try:
+                request_id, ok, result = conn.recv()
+            except (EOFError, OSError):
+                self._on_worker_lost(shard)
+                return
+            future = pending.pop(request_id, None)
+            if future is None or future.done():
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def _on_worker_lost(self, shard: int):
+        """
+        Fails the requests waiting on a dead worker, unseats the players of its rooms,
+        which died with it, and starts a new worker for the shard.
+        """
+        conn = self._conns[shard]
+        asyncio.get_running_loop().remove_reader(conn.fileno())
+        conn.close()
+        logger.error("Rooms worker %d has stopped, restarting it", shard)
+        error = Exception("The rooms worker has stopped")
+        for future in self._pending[shard].values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending[shard].clear()
+        for chat_id, room_id in list(self.chat_rooms.items()):
+            if shard_of(room_id, self.shards) == shard:
+                del self.chat_rooms[chat_id]
+        self._start_worker(shard)
+
+    def _call(self, shard: int, method: str, *args) -> "asyncio.Future":
+        if not self._started:
+            self._start()
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._conns[shard].send((request_id, method, args))
+        except OSError:
+            # The worker died before its end of the pipe was read
+            self._on_worker_lost(shard)
+            raise Exception("The rooms worker has stopped")
+        self._pending[shard][request_id] = future
+        return future
+
+    def _player_shard(self, chat_id: int) -> int:
+        room_id = self.chat_rooms.get(chat_id)
+        if room_id is None:
+            raise Exception("You are not in a room")
+        return shard_of(room_id, self.shards)
+
+    def room_of(self, chat_id: int) -> Optional[int]:
+        return self.chat_rooms.get(chat_id)
+
+    async def new_room_id(self) -> int:
+        return await self._call(self.rng.randbelow(self.shards), "new_room_id")
+
+    async def check_room(self, room_id: int) -> bool:
+        return await self._call(shard_of(room_id, self.shards), "check_room", room_id)
+
+    async def create_room(self, room_id: int):
+        await self._call(shard_of(room_id, self.shards), "create_room", room_id)
+
+    async def reg_player_in_room(self, player_name: str, player_id: int, room_id: int):
+        shard = shard_of(room_id, self.shards)
+        await self.del_player_from_rooms(player_id)
+        replaced = await self._call(shard, "reg_player_in_room", player_name, player_id, room_id)
+        self.chat_rooms[player_id] = room_id
+        if replaced is not None:
+            self.chat_rooms.pop(replaced, None)
+
+    async def join_room(
+        self, room_id: int, player_name: str, player_id: int
+    ) -> Optional[TurnResult]:
+        # One command on the owning worker, so that concurrent joins cannot both wait
+        shard = shard_of(room_id, self.shards)
+        if self.chat_rooms.get(player_id) != room_id:
+            await self.del_player_from_rooms(player_id)
+        result = await self._call(shard, "join_room", room_id, player_name, player_id)
+        self.chat_rooms[player_id] = room_id
+        if result.replaced is not None:
+            self.chat_rooms.pop(result.replaced, None)
+        return result.turn_result
+
+    async def del_player_from_rooms(self, player_id: int):
+        room_id = self.chat_rooms.pop(player_id, None)
+        if room_id is not None:
+            shard = shard_of(room_id, self.shards)
+            for chat_id in await self._call(shard, "del_player_from_rooms", player_id):
+                self.chat_rooms.pop(chat_id, None)
+
+    async def get_players_chatid(self, chat_id: int) -> Tuple[int, int]:
+        return await self._call(self._player_shard(chat_id), "get_players_chatid", chat_id)
+
+    async def start_game(self, room_id: int) -> TurnResult:
+        return await self._call(shard_of(room_id, self.shards), "start_game", room_id)
+
+    async def play_turn(self, chat_id: int, action: Action) -> TurnOutcome:
+        # Moves travel as engine Action codes, -1 for "not a move"
+        code = -1 if action is None else int(action_from_scene(action))
+        outcome = await self._call(self._player_shard(chat_id), "play_turn", chat_id, code)
+        if outcome.winner_id is not None:
+            self.chat_rooms.pop(outcome.winner_id, None)
+            self.chat_rooms.pop(outcome.loser_id, None)
+        return outcome
+
+    async def observe(self, chat_id: int) -> Optional[Observation]:
+        return await self._call(self._player_shard(chat_id), "observe", chat_id)
+
+    async def reap(self) -> List[int]:
+        evicted = []
+        for shard in range(self.shards):
+            evicted += await self._call(shard, "reap")
+        for chat_id in evicted:
+            self.chat_rooms.pop(chat_id, None)
+        return evicted
+
+    async def stats(self) -> Dict[str, int]:
+        total: Dict[str, int] = {}
+        for shard in range(self.shards):
+            for name, value in (await self._call(shard, "stats")).items():
+                total[name] = total.get(name, 0) + value
+        return total
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        for conn in self._conns:
+            if not conn.closed:
+                loop.remove_reader(conn.fileno())
+                conn.close()
+        for process in self._processes:
+            await asyncio.to_thread(process.join, 5)
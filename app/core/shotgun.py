@@ -1,10 +1,14 @@
+from __future__ import annotations
 import random
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
 
-import random
 from .player import Player
 from .models.ammo import AmmoType
 
+if TYPE_CHECKING:
+    from .loadout import LoadoutDispenser
+    from .rng import SplitMix64
+
 
 class Shotgun:
     """Class representing a shotgun."""
@@ -16,9 +20,17 @@ class Shotgun:
         std_dev_num_rounds: float = 1.5,
         mean_live_ratio: float = 0.5,
         std_dev_live_ratio: float = 0.2,
+        source: Optional[LoadoutDispenser] = None,
+        rng: Optional[SplitMix64] = None,
     ) -> None:
-        """Initialize a Shotgun instance with optional parameters."""
+        """
+        Initialize a Shotgun instance with optional parameters.
+        If a source is given, loadouts are taken from it instead of being drawn from the rng.
+        Without an rng the global `random` module is used.
+        """
         self.rounds: List[AmmoType] = []
+        self.source = source
+        self.rng = rng or random
         self.damage = damage
         self.mean_num_rounds = mean_num_rounds
         self.std_dev_num_rounds = std_dev_num_rounds
@@ -31,14 +43,18 @@ class Shotgun:
 
     def recharge(self) -> str:
         """Recharge the shotgun with random rounds."""
+        if self.source is not None:
+            self.rounds = self.source.next_rounds()
+            return self.get_ammo_sorted()
+
         rounds = self.generate_normal_distribution()
 
-        live = rounds / 2 + rounds / 2 * random.uniform(-0.2, 0.3)
+        live = rounds / 2 + rounds / 2 * self.rng.uniform(-0.2, 0.3)
         blank = rounds - live
         live, blank = max(1, round(live)), max(1, round(blank))
         rounds = [AmmoType.LIVE] * live + [AmmoType.BLANK] * blank
 
-        random.shuffle(rounds)
+        self.rng.shuffle(rounds)
         self.rounds = rounds
         res = [r.value for r in rounds]
         res.sort()
@@ -63,7 +79,7 @@ class Shotgun:
         Returns:
         int: A rounded and bounded random number between the specified lower and upper bounds.
         """
-        generated_number = random.normalvariate(mean, std_deviation)
+        generated_number = self.rng.normalvariate(mean, std_deviation)
         generated_number = max(lower_bound, min(upper_bound, round(generated_number)))
         return generated_number
 
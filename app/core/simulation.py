@@ -0,0 +1,196 @@
+"""
+Batch simulation on top of the headless engine.
+
+Run from the `app` directory:
+    python -m core.simulation --games 100000 --workers 8 --a counting --b random
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from core.engine import Action, GameState, apply_action, legal_actions, new_game
+from core.rng import SplitMix64, derive_seed
+
+# A policy picks an action for the active seat. Policies see the whole state and
+# must only read public information from it (HP, inventories, the number of live shells).
+Policy = Callable[[GameState, SplitMix64], int]
+
+
+def random_policy(state: GameState, rng: SplitMix64) -> int:
+    """Plays a uniformly random legal action."""
+    return rng.choice(legal_actions(state))
+
+
+def shoot_opponent_policy(state: GameState, rng: SplitMix64) -> int:
+    """Always shoots the opponent."""
+    return Action.SHOOT_OPPONENT
+
+
+def counting_policy(state: GameState, rng: SplitMix64) -> int:
+    """Shoots the opponent when at least half of the remaining shells are live, itself otherwise."""
+    if state.live_shells() * 2 >= len(state.rounds):
+        return Action.SHOOT_OPPONENT
+    return Action.SHOOT_SELF
+
+
+POLICIES = {
+    "random": random_policy,
+    "shoot": shoot_opponent_policy,
+    "counting": counting_policy,
+}
+
+
+@dataclass
+class SimulationStats:
+    """
+    Aggregated results of a batch of games. Policy A plays seat 0, policy B seat 1.
+
+    Attributes:
+    - games (int): Number of games played.
+    - wins_a (int): Games won by policy A.
+    - wins_b (int): Games won by policy B.
+    - draws (int): Games stopped by the step limit.
+    - first_mover_wins (int): Games won by the seat that moved first.
+    - turns (int): Total number of finished turns.
+    - max_turns (int): The longest game in turns.
+    """
+
+    games: int = 0
+    wins_a: int = 0
+    wins_b: int = 0
+    draws: int = 0
+    first_mover_wins: int = 0
+    turns: int = 0
+    max_turns: int = 0
+
+    def merge(self, other: "SimulationStats") -> "SimulationStats":
+        self.games += other.games
+        self.wins_a += other.wins_a
+        self.wins_b += other.wins_b
+        self.draws += other.draws
+        self.first_mover_wins += other.first_mover_wins
+        self.turns += other.turns
+        self.max_turns = max(self.max_turns, other.max_turns)
+        return self
+
+    @property
+    def win_rate_a(self) -> float:
+        return self.wins_a / self.games if self.games else 0.0
+
+    @property
+    def avg_turns(self) -> float:
+        return self.turns / self.games if self.games else 0.0
+
+
+def play_game(seed: int, policy_a: Policy, policy_b: Policy, max_steps: int = 10_000) -> GameState:
+    """
+    Plays one game to the end.
+
+    Args:
+    - seed (int): The seed of the game.
+    - policy_a (Policy): The policy of seat 0.
+    - policy_b (Policy): The policy of seat 1.
+    - max_steps (int): Safety limit on the number of actions.
+
+    Returns:
+    - GameState: The final state. `winner` is -1 if the step limit was hit.
+    """
+    state, _ = new_game(seed)
+    _play_out(state, seed, policy_a, policy_b, max_steps)
+    return state
+
+
+def _play_out(state: GameState, seed: int, policy_a: Policy, policy_b: Policy, max_steps: int):
+    policies = (policy_a, policy_b)
+    rng = SplitMix64(derive_seed(seed, 1))
+    for _ in range(max_steps):
+        apply_action(state, policies[state.turn](state, rng))
+        if state.winner >= 0:
+            break
+
+
+def _play_range(
+    start: int, stop: int, seed: int, policy_a: Policy, policy_b: Policy, max_steps: int
+) -> SimulationStats:
+    stats = SimulationStats()
+    for index in range(start, stop):
+        game_seed = derive_seed(seed, index)
+        state, _ = new_game(game_seed)
+        first = state.turn
+        _play_out(state, game_seed, policy_a, policy_b, max_steps)
+        stats.games += 1
+        stats.turns += state.turns
+        stats.max_turns = max(stats.max_turns, state.turns)
+        if state.winner == 0:
+            stats.wins_a += 1
+        elif state.winner == 1:
+            stats.wins_b += 1
+        else:
+            stats.draws += 1
+        if state.winner == first:
+            stats.first_mover_wins += 1
+    return stats
+
+
+def simulate(
+    n_games: int,
+    policy_a: Policy,
+    policy_b: Policy,
+    workers: int = 1,
+    seed: int = 0,
+    max_steps: int = 10_000,
+) -> SimulationStats:
+    """
+    Plays n_games between two policies, spreading them over a process pool.
+
+    Game i always uses the seed `derive_seed(seed, i)`, so the result does not depend
+    on the number of workers. Policies must be picklable (module level functions).
+
+    Args:
+    - n_games (int): Number of games to play.
+    - policy_a (Policy): The policy of seat 0.
+    - policy_b (Policy): The policy of seat 1.
+    - workers (int): Number of worker processes, 1 runs in the current process.
+    - seed (int): The root seed of the batch.
+    - max_steps (int): Safety limit on the number of actions per game.
+
+    Returns:
+    - SimulationStats: Aggregated results.
+    """
+    if workers <= 1:
+        return _play_range(0, n_games, seed, policy_a, policy_b, max_steps)
+
+    # Several chunks per worker keep the pool busy when games differ in length
+    chunks = workers * 4
+    bounds = [n_games * i // chunks for i in range(chunks + 1)]
+    stats = SimulationStats()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_play_range, start, stop, seed, policy_a, policy_b, max_steps)
+            for start, stop in zip(bounds, bounds[1:])
+            if stop > start
+        ]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulate Buckshot Roulette games")
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--a", choices=POLICIES, default="counting")
+    parser.add_argument("--b", choices=POLICIES, default="random")
+    args = parser.parse_args()
+
+    stats = simulate(args.games, POLICIES[args.a], POLICIES[args.b], args.workers, args.seed)
+    print(stats)
+    print(f"win rate A: {stats.win_rate_a:.4f}, avg turns: {stats.avg_turns:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Compact serialization of a `Scene`, used to persist rooms across restarts.
+
+A snapshot is the game as a `PackedState` followed by what it leaves out: the seed,
+the players' names and chat ids, their adrenaline deadlines and the dealer's counters.
+Snapshots start with their format version. The first snapshots were JSON objects and
+are still read.
+"""
+
+import json
+import struct
+from collections import deque
+from typing import Optional
+
+from .game_log import GameLogWriter, GameRecorder
+from .inventory import Inventory
+from .models.ammo import AmmoType
+from .models.items import ItemType
+from .models.turn_model import Dealer, Turn
+from .packed import SIZE, PackedState, pack_scene, unpack_scene
+from .player import Player, PlayerData
+from .scene import Scene
+from .shotgun import Shotgun
+
+VERSION = 2
+# version, flags, seed, game id, games, score, dealer's move counter
+HEADER = struct.Struct("<BBQQiiI")
+# Chat ids the dealer was started with
+DEALER = struct.Struct("<qq")
+# chat id, adrenaline deadline, length of the UTF-8 name that follows
+SEAT = struct.Struct("<qdH")
+
+HAS_GAME_ID = 1
+HAS_DEALER = 2
+HAS_SEAT = (4, 8)
+
+
+def _load_player(dump: Optional[list]) -> Optional[Player]:
+    if dump is None:
+        return None
+    name, chat_id, hp, max_hp, counts, tied, adrenaline, under_adrenaline_before = dump
+    player = Player.__new__(Player)
+    player.data = PlayerData(name, chat_id, hp, max_hp)
+    player.inventory = Inventory()
+    player.inventory.counts = counts
+    player.inventory.total = sum(counts)
+    player.tied = tied
+    player.adrenaline = adrenaline
+    player.under_adrenaline_before = under_adrenaline_before
+    return player
+
+
+def dump_scene(scene: Scene) -> bytes:
+    """
+    Serializes a scene without a loadout source.
+
+    Args:
+    - scene (Scene): The scene to serialize.
+
+    Returns:
+    - bytes: The snapshot.
+    """
+    dealer = getattr(scene, "dealer", None)
+    players = (scene.first_player, scene.second_player)
+    flags = 0
+    if scene.recorder is not None:
+        flags |= HAS_GAME_ID
+    if dealer is not None:
+        flags |= HAS_DEALER
+    for seat, player in enumerate(players):
+        if player is not None:
+            flags |= HAS_SEAT[seat]
+
+    parts = [
+        HEADER.pack(
+            VERSION,
+            flags,
+            scene.seed,
+            scene.recorder.game_id if scene.recorder is not None else 0,
+            scene.games,
+            scene.score,
+            dealer.move_counter if dealer is not None else 0,
+        ),
+        pack_scene(scene).to_bytes(),
+    ]
+    if dealer is not None:
+        parts.append(DEALER.pack(dealer.first_player, dealer.second_player))
+    for player in players:
+        if player is not None:
+            name = player.data.name.encode()
+            parts.append(SEAT.pack(player.data.chat_id, player.under_adrenaline_before, len(name)))
+            parts.append(name)
+    return b"".join(parts)
+
+
+def load_scene(data: bytes, log: Optional[GameLogWriter] = None) -> Scene:
+    """
+    Rebuilds a scene from a snapshot made by `dump_scene`, or from a JSON snapshot.
+
+    Args:
+    - data (bytes): The snapshot.
+    - log (Optional[GameLogWriter]): The game log the scene records to.
+
+    Returns:
+    - Scene: The restored scene. The dealer's turn history is not restored.
+    """
+    if data[:1] == b"{":
+        return _load_json(data, log)
+    version, flags, seed, game_id, games, score, move_counter = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise Exception(f"Unknown snapshot version {version}")
+    offset = HEADER.size
+    packed = PackedState.from_bytes(data, offset)
+    offset += SIZE
+
+    scene = Scene(games=games, seed=seed, log=log)
+    scene.score = score
+    if flags & HAS_DEALER:
+        first_id, second_id = DEALER.unpack_from(data, offset)
+        offset += DEALER.size
+    for seat in (0, 1):
+        if not flags & HAS_SEAT[seat]:
+            continue
+        chat_id, deadline, length = SEAT.unpack_from(data, offset)
+        offset += SEAT.size
+        name = data[offset : offset + length].decode()
+        offset += length
+        # HP, items and effects come from the packed state
+        player = Player.__new__(Player)
+        player.data = PlayerData(name, chat_id, 1, 1)
+        player.inventory = Inventory()
+        player.under_adrenaline_before = deadline
+        if seat == 0:
+            scene.first_player = player
+        else:
+            scene.second_player = player
+
+    if flags & HAS_DEALER:
+        dealer = Dealer.__new__(Dealer)
+        dealer.max_items_per_turn = 1
+        dealer.first_player = first_id
+        dealer.second_player = second_id
+        dealer.move_counter = move_counter
+        dealer.history = deque(maxlen=16)
+        scene.dealer = dealer
+    unpack_scene(packed, scene)
+
+    if log is not None and flags & HAS_GAME_ID:
+        scene.recorder = GameRecorder(log, game_id)
+    return scene
+
+
+def _load_json(data: bytes, log: Optional[GameLogWriter]) -> Scene:
+    snapshot = json.loads(data)
+    scene = Scene(games=snapshot["g"], seed=snapshot["s"], log=log)
+    scene.rng.state = snapshot["r"]
+    scene.game_ended = snapshot["e"]
+    scene.score = snapshot["c"]
+
+    first, second = (_load_player(dump) for dump in snapshot["p"])
+    # Under adrenaline the active player holds the opponent's inventory
+    for player, other in ((first, second), (second, first)):
+        if player is not None and other is not None and player.adrenaline:
+            player.adrenaline_inventory = player.inventory
+            player.inventory = other.inventory
+    scene.first_player = first
+    scene.second_player = second
+
+    scene.shotgun = Shotgun(rng=scene.rng)
+    scene.shotgun.rounds = [AmmoType.LIVE if r == "1" else AmmoType.BLANK for r in snapshot["a"]]
+    scene.shotgun.damage = snapshot["d"]
+
+    if log is not None and snapshot["id"] is not None:
+        scene.recorder = GameRecorder(log, snapshot["id"])
+
+    if "t" in snapshot:
+        first_id, second_id, move_counter, extra_turns, turn_number, used_items = snapshot["t"]
+        dealer = Dealer.__new__(Dealer)
+        dealer.max_items_per_turn = 1
+        dealer.first_player = first_id
+        dealer.second_player = second_id
+        dealer.move_counter = move_counter
+        dealer.extra_turns = extra_turns
+        dealer.history = deque(maxlen=16)
+        dealer.rng = scene.rng
+        dealer.current = Turn(turn_number, first_id if turn_number == 0 else second_id)
+        dealer.current.used_items = [ItemType(item) for item in used_items]
+        scene.dealer = dealer
+    return scene
+
+
+def scene_players(scene: Scene):
+    """
+    Returns the chat ids of both seats, None for an empty seat.
+    """
+    return tuple(
+        player.data.chat_id if player is not None else None
+        for player in (scene.first_player, scene.second_player)
+    )
@@ -0,0 +1,556 @@
+"""
+Exact expectimax solver of the engine's game and a memory-mapped table of its answers.
+
+The solver plays the rules of `core.engine` from the point of view of the seat to move.
+A `Position` only keeps what a player can know, which is also a symmetry reduction:
+- Shells are counted, not ordered. The order is never public and every order of the
+  same counts is equally likely, so all of them share one position.
+- Seats are relative: "me" is the seat to move. A position and its mirror image with
+  the seats swapped are the same entry.
+- Knowing the next shell (GLASS, or PHONE landing on it) is part of the position. That
+  knowledge is always used up by the next shot, before the opponent moves again, so the
+  opponent never has to guess what the mover knows.
+- Handcuff counters below zero behave as zero and are stored as zero.
+
+Two things are simplified, and the values are exact for this model:
+- PHONE reveals a later shell to the mover only. That knowledge is dropped, which the
+  mover may do anyway, so the value is a lower bound for the phone's user.
+- Items drawn at a recharge are not modeled, the items in hand are carried over. Every
+  magazine then either uses an item or costs HP, so the game is finite and is solved
+  to the end without a depth limit. New draws make positions leave the table, see below.
+
+`Solver` memoizes every decision position in a transposition table. `build` solves all
+game starts with up to `max_items` items per player on a process pool and writes the
+best action and win probability of every reachable decision position to a file: an
+open-addressing hash table of fixed-width slots, looked up in O(1) through a memory map
+by `PolicyTable`. Positions outside of it return None; `Solver` answers them on demand.
+
+Run from the `app` directory:
+    python -m core.solver build --max-items 1 --workers 8 --out log/policy.bin
+    python -m core.solver show --seed 42 --table log/policy.bin
+"""
+
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.engine import (
+    ADRENALINE,
+    BEER,
+    GLASS,
+    HANDCUFF,
+    HANDSAW,
+    INVERTER,
+    ITEM_ACTION_OFFSET,
+    ITEM_DRAWS_ON_START,
+    PHONE,
+    PILLS,
+    PILLS_OUTCOMES,
+    SMOKE,
+    Action,
+    GameState,
+    new_game,
+)
+from core.models.items import N_ITEMS
+# Inventories are packed as in PackedState, 4 bits per item count
+from core.packed import ITEM_BITS, pack_inventory
+from core.rng import derive_seed
+
+# (hp_me, hp_other, max_hp, live, blank, known, damage, extra_turns, item_used,
+#  adrenaline, tied_me, tied_other, inventory_me, inventory_other)
+Position = Tuple[int, int, int, int, int, int, int, int, int, int, int, int, int, int]
+
+# What the mover knows of the next shell
+UNKNOWN, NEXT_LIVE, NEXT_BLANK = 0, 1, 2
+
+HEADER = struct.Struct("<4sHHQQ")
+MAGIC = b"BRSV"
+VERSION = 1
+# Position key (low and high word), win probability of the mover, best action
+SLOT = struct.Struct("<QQfB")
+EMPTY = 0xFF
+# Share of used slots at most, longer probe chains above it
+LOAD_FACTOR = 0.7
+
+_HEAL_CHANCE = PILLS_OUTCOMES.count(1) / len(PILLS_OUTCOMES)
+
+
+def _loadout_odds() -> List[Tuple[float, int, int]]:
+    # Mirrors engine._reload: n = round(normal(5, 1)) clipped to [2, 7], then
+    # live = n/2 + n/2 * uniform(-0.2, 0.3), rounded, and both counts at least one
+    def normal_cdf(x: float) -> float:
+        return 0.5 * (1 + math.erf((x - 5) / math.sqrt(2)))
+
+    odds: Dict[Tuple[int, int], float] = {}
+    for n in range(2, 8):
+        low = -math.inf if n == 2 else n - 0.5
+        high = math.inf if n == 7 else n + 0.5
+        p_n = normal_cdf(high) - normal_cdf(low)
+        # Both rounded counts only change where the live count crosses a half-integer
+        start, stop = n * 0.4, n * 0.65
+        cuts = [start] + [k + 0.5 for k in range(n + 1) if start < k + 0.5 < stop] + [stop]
+        for a, b in zip(cuts, cuts[1:]):
+            middle = (a + b) / 2
+            live, blank = max(1, round(middle)), max(1, round(n - middle))
+            odds[live, blank] = odds.get((live, blank), 0.0) + p_n * (b - a) / (stop - start)
+    return [(p, live, blank) for (live, blank), p in sorted(odds.items())]
+
+
+# Probability, live and blank count of every loadout
+LOADOUTS = _loadout_odds()
+
+
+def position_of(state: GameState, known: int = UNKNOWN) -> Position:
+    """
+    The position of an engine state, seen by the seat to move.
+
+    Args:
+    - state (GameState): A running game.
+    - known (int): What the seat to move knows of the next shell, `NEXT_LIVE` or
+      `NEXT_BLANK` after a GLASS for instance.
+
+    Returns:
+    - Position: The position, as stored in the tables.
+    """
+    me = state.turn
+    other = 1 - me
+    return _canonical(
+        state.hp[me],
+        state.hp[other],
+        state.max_hp,
+        state.live_shells(),
+        len(state.rounds) - state.live_shells(),
+        known,
+        state.damage,
+        state.extra_turns,
+        int(state.item_used),
+        int(state.adrenaline[me]),
+        state.tied[me],
+        state.tied[other],
+        pack_inventory(state.inventory[me]),
+        pack_inventory(state.inventory[other]),
+    )
+
+
+def _canonical(
+    hp_me, hp_other, max_hp, live, blank, known, damage, extra, used, adrenaline,
+    tied_me, tied_other, inv_me, inv_other,
+) -> Position:
+    if not live or not blank:
+        # The next shell is no secret
+        known = UNKNOWN
+    return (
+        hp_me,
+        hp_other,
+        max_hp,
+        live,
+        blank,
+        known,
+        damage,
+        extra,
+        used,
+        adrenaline,
+        max(0, tied_me),
+        max(0, tied_other),
+        inv_me,
+        inv_other,
+    )
+
+
+def pack_position(position: Position) -> Tuple[int, int]:
+    """
+    Packs a position into two 64-bit words: the scalars and the mover's items, and the
+    opponent's items.
+    """
+    (
+        hp_me, hp_other, max_hp, live, blank, known, damage, extra, used, adrenaline,
+        tied_me, tied_other, inv_me, inv_other,
+    ) = position
+    low = 0
+    for value, bits in (
+        (hp_me, 3),
+        (hp_other, 3),
+        (max_hp, 3),
+        (live, 4),
+        (blank, 4),
+        (known, 2),
+        (damage - 1, 1),
+        (extra, 2),
+        (used, 1),
+        (adrenaline, 1),
+        (tied_me, 2),
+        (tied_other, 2),
+    ):
+        low = low << bits | value
+    return low | inv_me << 28, inv_other
+
+
+def start_positions(max_items: int) -> Iterator[Position]:
+    """
+    Every position a game can start from with at most `max_items` items per player.
+    """
+    inventories: List[List[int]] = [[0]]
+    for _ in range(max_items):
+        one_more = {
+            inventory + (1 << (ITEM_BITS * item))
+            for inventory in inventories[-1]
+            for item in range(N_ITEMS)
+        }
+        inventories.append(sorted(one_more))
+    for draws in sorted(set(ITEM_DRAWS_ON_START)):
+        if draws > max_items:
+            continue
+        for hp in range(3, 7):
+            for _, live, blank in LOADOUTS:
+                for inv_me in inventories[draws]:
+                    for inv_other in inventories[draws]:
+                        yield (
+                            hp, hp, hp, live, blank, UNKNOWN, 1, 0, 0, 0, 0, 0, inv_me, inv_other
+                        )
+
+
+class Solver:
+    """
+    Memoized expectimax over positions. Values are win probabilities of the seat to move.
+
+    Attributes:
+    - table (Dict[Position, Tuple[float, int]]): The transposition table, the value and
+      the best action of every decision position solved so far.
+    """
+
+    def __init__(self) -> None:
+        self.table: Dict[Position, Tuple[float, int]] = {}
+        # A game runs over several magazines, each level of the search is a few frames
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+    def solve(self, position: Position) -> Tuple[float, int]:
+        """
+        Returns the win probability of the seat to move and its best action.
+        """
+        entry = self.table.get(position)
+        if entry is not None:
+            return entry
+        best_value, best_action = -1.0, Action.SHOOT_OPPONENT
+        for action in self.legal_actions(position):
+            value = self.action_value(position, action)
+            if value > best_value:
+                best_value, best_action = value, action
+        entry = self.table[position] = (best_value, int(best_action))
+        return entry
+
+    def value(self, position: Position) -> float:
+        return self.solve(position)[0]
+
+    @staticmethod
+    def legal_actions(position: Position) -> List[int]:
+        """
+        The actions `core.engine.legal_actions` allows in this position.
+        """
+        actions = [Action.SHOOT_OPPONENT, Action.SHOOT_SELF]
+        if position[8]:
+            return actions
+        adrenaline, tied_other = position[9], position[11]
+        inventory = position[13] if adrenaline else position[12]
+        for item in range(N_ITEMS):
+            if not (inventory >> (ITEM_BITS * item)) & 0xF:
+                continue
+            if item == HANDCUFF and tied_other > 0:
+                continue
+            if item == ADRENALINE and adrenaline:
+                continue
+            actions.append(item + ITEM_ACTION_OFFSET)
+        return actions
+
+    def action_value(self, position: Position, action: int) -> float:
+        """
+        The win probability of the seat to move after playing `action`, both seats
+        playing optimally afterwards.
+        """
+        (
+            hp_me, hp_other, max_hp, live, blank, known, damage, extra, used, adrenaline,
+            tied_me, tied_other, inv_me, inv_other,
+        ) = position
+        if known == NEXT_LIVE:
+            p_live = 1.0
+        elif known == NEXT_BLANK:
+            p_live = 0.0
+        else:
+            p_live = live / (live + blank)
+
+        if action == Action.SHOOT_SELF or action == Action.SHOOT_OPPONENT:
+            value = 0.0
+            if p_live > 0:
+                if action == Action.SHOOT_SELF:
+                    hit_me, hit_other = max(0, hp_me - damage), hp_other
+                else:
+                    hit_me, hit_other = hp_me, max(0, hp_other - damage)
+                value += p_live * self._settle(
+                    hit_me, hit_other, max_hp, live - 1, blank, 1, extra, 0,
+                    tied_me - 1, tied_other - 1, inv_me, inv_other, True,
+                )
+            if p_live < 1:
+                if action == Action.SHOOT_SELF:
+                    # A blank on yourself keeps the turn
+                    value += (1 - p_live) * self._settle(
+                        hp_me, hp_other, max_hp, live, blank - 1, 1, extra + 1, 0,
+                        tied_me, tied_other, inv_me, inv_other, True,
+                    )
+                else:
+                    value += (1 - p_live) * self._settle(
+                        hp_me, hp_other, max_hp, live, blank - 1, 1, extra, 0,
+                        tied_me - 1, tied_other - 1, inv_me, inv_other, True,
+                    )
+            return value
+
+        item = action - ITEM_ACTION_OFFSET
+        # Under adrenaline the item comes from the opponent
+        if adrenaline:
+            inv_other -= 1 << (ITEM_BITS * item)
+        else:
+            inv_me -= 1 << (ITEM_BITS * item)
+        if item != ADRENALINE:
+            used = 1
+
+        def settle(
+            hp_me=hp_me,
+            live=live,
+            blank=blank,
+            known=known,
+            damage=damage,
+            extra=extra,
+            tied_other=tied_other,
+            adrenaline=0,
+        ):
+            return self._settle(
+                hp_me, hp_other, max_hp, live, blank, damage, extra, used,
+                tied_me, tied_other, inv_me, inv_other, False, known, adrenaline,
+            )
+
+        if item == HANDSAW:
+            return settle(damage=damage * 2)
+        if item == BEER:
+            value = 0.0
+            if p_live > 0:
+                value += p_live * settle(live=live - 1, known=UNKNOWN)
+            if p_live < 1:
+                value += (1 - p_live) * settle(blank=blank - 1, known=UNKNOWN)
+            return value
+        if item == SMOKE:
+            return settle(hp_me=min(hp_me + 1, max_hp))
+        if item == HANDCUFF:
+            return settle(tied_other=3, extra=extra + 1)
+        if item == GLASS or item == PHONE:
+            # The phone lands on the next shell one time in n, the rest is forgotten
+            p_next = 1.0 if item == GLASS else 1 / (live + blank)
+            if known != UNKNOWN or p_live in (0.0, 1.0):
+                return settle()
+            value = (1 - p_next) * settle() if p_next < 1 else 0.0
+            value += p_next * p_live * settle(known=NEXT_LIVE)
+            value += p_next * (1 - p_live) * settle(known=NEXT_BLANK)
+            return value
+        if item == PILLS:
+            healed = settle(hp_me=min(hp_me + 2, max_hp))
+            hurt = settle(hp_me=max(0, hp_me - 1))
+            return _HEAL_CHANCE * healed + (1 - _HEAL_CHANCE) * hurt
+        if item == INVERTER:
+            flipped = {UNKNOWN: UNKNOWN, NEXT_LIVE: NEXT_BLANK, NEXT_BLANK: NEXT_LIVE}[known]
+            return settle(live=blank, blank=live, known=flipped)
+        # ADRENALINE
+        return settle(adrenaline=1)
+
+    def _settle(
+        self,
+        hp_me: int,
+        hp_other: int,
+        max_hp: int,
+        live: int,
+        blank: int,
+        damage: int,
+        extra: int,
+        used: int,
+        tied_me: int,
+        tied_other: int,
+        inv_me: int,
+        inv_other: int,
+        end_turn: bool,
+        known: int = UNKNOWN,
+        adrenaline: int = 0,
+    ) -> float:
+        # Value for the seat that just moved, once the win, the end of the turn and
+        # the recharge of the engine's `apply_action` are applied
+        if hp_me <= 0:
+            return 0.0
+        if hp_other <= 0:
+            return 1.0
+        mine = True
+        if end_turn:
+            used, known = 0, UNKNOWN
+            if extra:
+                extra -= 1
+            else:
+                mine = False
+        if live + blank:
+            outcomes = [(1.0, live, blank)]
+        else:
+            tied_me = tied_other = 0
+            known = UNKNOWN
+            outcomes = LOADOUTS
+        value = 0.0
+        for p, live, blank in outcomes:
+            if mine:
+                position = _canonical(
+                    hp_me, hp_other, max_hp, live, blank, known, damage, extra, used, adrenaline,
+                    tied_me, tied_other, inv_me, inv_other,
+                )
+                value += p * self.value(position)
+            else:
+                position = _canonical(
+                    hp_other, hp_me, max_hp, live, blank, UNKNOWN, 1, 0, 0, 0,
+                    tied_other, tied_me, inv_other, inv_me,
+                )
+                value += p * (1 - self.value(position))
+        return value
+
+
+def _solve_chunk(positions: List[Position]) -> bytes:
+    solver = Solver()
+    for position in positions:
+        solver.solve(position)
+    records = bytearray()
+    for position, (value, action) in solver.table.items():
+        low, high = pack_position(position)
+        records += SLOT.pack(low, high, value, action)
+    return bytes(records)
+
+
+def build(path: str, max_items: int = 1, workers: int = 1) -> int:
+    """
+    Solves every game start with up to `max_items` items per player and writes the
+    table of all reachable decision positions.
+
+    Args:
+    - path (str): The table file to write.
+    - max_items (int): Items per player at the start, up to 4.
+    - workers (int): Number of worker processes, 1 solves in the current process.
+
+    Returns:
+    - int: The number of positions in the table.
+    """
+    roots = list(start_positions(max_items))
+    entries: Dict[Tuple[int, int], Tuple[float, int]] = {}
+
+    def merge(records: bytes):
+        for low, high, value, action in SLOT.iter_unpack(records):
+            entries[low, high] = (value, action)
+
+    if workers <= 1:
+        merge(_solve_chunk(roots))
+    else:
+        # Roots next to each other share most of their positions, keep them together
+        chunks = workers * 4
+        bounds = [len(roots) * i // chunks for i in range(chunks + 1)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = [roots[a:b] for a, b in zip(bounds, bounds[1:]) if b > a]
+            for records in pool.map(_solve_chunk, parts):
+                merge(records)
+
+    n_slots = 1
+    while n_slots * LOAD_FACTOR < len(entries):
+        n_slots *= 2
+    slots = bytearray(SLOT.pack(0, 0, 0.0, EMPTY) * n_slots)
+    mask = n_slots - 1
+    # In key order, so the file does not depend on the number of workers
+    for (low, high), (value, action) in sorted(entries.items()):
+        index = derive_seed(low, high) & mask
+        while slots[index * SLOT.size + SLOT.size - 1] != EMPTY:
+            index = (index + 1) & mask
+        SLOT.pack_into(slots, index * SLOT.size, low, high, value, action)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, max_items, n_slots, len(entries)))
+        file.write(slots)
+    return len(entries)
+
+
+class PolicyTable:
+    """
+    Read-only view of a table written by `build`, memory-mapped.
+
+    Attributes:
+    - max_items (int): Items per player at the start of the games it covers.
+    - entries (int): Number of positions in the table.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._map, 0)
+        magic, version, self.max_items, self._n_slots, self.entries = header
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a policy table of version {VERSION}")
+        self._mask = self._n_slots - 1
+
+    def lookup(self, position: Position) -> Optional[Tuple[int, float]]:
+        """
+        Returns the best action and the win probability of the seat to move, None if
+        the position is not in the table.
+        """
+        low, high = pack_position(position)
+        index = derive_seed(low, high) & self._mask
+        while True:
+            offset = HEADER.size + index * SLOT.size
+            slot_low, slot_high, value, action = SLOT.unpack_from(self._map, offset)
+            if action == EMPTY:
+                return None
+            if slot_low == low and slot_high == high:
+                return action, value
+            index = (index + 1) & self._mask
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Solve the game and query the policy table")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Write the table of optimal actions")
+    build_parser.add_argument("--max-items", type=int, default=1)
+    build_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    build_parser.add_argument("--out", default="log/policy.bin")
+    show_parser = commands.add_parser("show", help="Solve the start of a game")
+    show_parser.add_argument("--seed", type=int, default=0)
+    show_parser.add_argument("--table", help="Also look the position up in this table")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        entries = build(args.out, args.max_items, args.workers)
+        print(f"Wrote {entries} positions to {args.out}")
+        return
+
+    state, _ = new_game(args.seed)
+    position = position_of(state)
+    solver = Solver()
+    value, action = solver.solve(position)
+    print(f"hp={state.hp} shells={[int(r) for r in state.rounds]} items={state.inventory}")
+    print(f"seat {state.turn} plays {Action(action).name}, wins with p={value:.4f}")
+    for other in solver.legal_actions(position):
+        print(f"  {Action(other).name:<15} {solver.action_value(position, other):.4f}")
+    print(f"{len(solver.table)} positions solved")
+    if args.table:
+        table = PolicyTable(args.table)
+        print(f"table: {table.lookup(position)}")
+        table.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Hierarchical timing wheel.
+
+Time is cut in ticks of `resolution` seconds. Level 0 has one slot per tick for the
+next 64 ticks, level 1 one slot per 64 ticks for the next 64 * 64 ticks, and so on.
+A timer sits in the slot of the coarsest level it fits in, and moves down one level
+when its slot comes up. Scheduling and cancelling are O(1), whatever the number of
+timers, and advancing costs O(1) per tick plus the timers due.
+"""
+
+from typing import Any, Dict, Hashable, List, Optional
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+
+
+class Timer:
+    """
+    A scheduled timer. `payload` is whatever the owner wants back when it fires.
+    """
+
+    __slots__ = ("tick", "payload", "key", "slot")
+
+    def __init__(self, tick: int, payload: Any, key: Optional[Hashable]) -> None:
+        self.tick = tick
+        self.payload = payload
+        self.key = key
+        self.slot: Optional[Dict["Timer", None]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.slot is not None
+
+
+class TimingWheel:
+    """
+    Timers grouped by key, e.g. by room or chat, so all timers of a key can be cancelled at once.
+
+    Attributes:
+    - resolution (float): Seconds per tick.
+    - tick (int): The next tick to process.
+    """
+
+    def __init__(self, resolution: float = 0.1, now: float = 0.0, levels: int = 4) -> None:
+        self.resolution = resolution
+        self.tick = int(now / resolution)
+        # Slots are dicts used as ordered sets, so a timer is removed from its slot in O(1)
+        self._levels = [[{} for _ in range(SLOTS)] for _ in range(levels)]
+        self._keys: Dict[Hashable, Dict[Timer, None]] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _place(self, timer: Timer):
+        delta = timer.tick - self.tick
+        if delta < 0:
+            slot = self._levels[0][self.tick & SLOT_MASK]
+        else:
+            top = len(self._levels) - 1
+            level = 0
+            while level < top and delta >= 1 << (SLOT_BITS * (level + 1)):
+                level += 1
+            # Timers beyond the last level wait in its farthest slot and are placed again
+            tick = min(timer.tick, self.tick + (1 << (SLOT_BITS * (top + 1))) - 1)
+            slot = self._levels[level][(tick >> (SLOT_BITS * level)) & SLOT_MASK]
+        slot[timer] = None
+        timer.slot = slot
+
+    def schedule(self, at: float, payload: Any = None, key: Optional[Hashable] = None) -> Timer:
+        """
+        Schedules a timer.
+
+        Args:
+        - at (float): When the timer fires, on the clock passed to `advance`.
+        - payload (Any): Returned with the timer when it fires.
+        - key (Optional[Hashable]): Groups the timer for `cancel_key`.
+
+        Returns:
+        - Timer: The timer, to cancel it.
+        """
+        # Rounded up, so a timer never fires early
+        timer = Timer(-int(-at // self.resolution), payload, key)
+        self._place(timer)
+        if key is not None:
+            self._keys.setdefault(key, {})[timer] = None
+        self._count += 1
+        return timer
+
+    def _forget(self, timer: Timer):
+        timer.slot = None
+        self._count -= 1
+        if timer.key is not None:
+            timers = self._keys[timer.key]
+            del timers[timer]
+            if not timers:
+                del self._keys[timer.key]
+
+    def cancel(self, timer: Timer) -> bool:
+        """
+        Cancels a timer.
+
+        Returns:
+        - bool: False if the timer has already fired or been cancelled.
+        """
+        if timer.slot is None:
+            return False
+        del timer.slot[timer]
+        self._forget(timer)
+        return True
+
+    def cancel_key(self, key: Hashable) -> int:
+        """
+        Cancels all timers of a key.
+
+        Returns:
+        - int: The number of cancelled timers.
+        """
+        timers = list(self._keys.get(key, ()))
+        for timer in timers:
+            self.cancel(timer)
+        return len(timers)
+
+    def advance(self, now: float) -> List[Timer]:
+        """
+        Moves the wheel to `now`.
+
+        Returns:
+        - List[Timer]: The timers due, in firing order.
+        """
+        target = int(now // self.resolution)
+        fired: List[Timer] = []
+        while self.tick <= target:
+            if not self._count:
+                # Nothing to move or fire, jump straight to the target
+                self.tick = target + 1
+                break
+            index = self.tick & SLOT_MASK
+            if index == 0:
+                self._cascade()
+            slot = self._levels[0][index]
+            if slot:
+                timers = list(slot)
+                slot.clear()
+                for timer in timers:
+                    self._forget(timer)
+                fired += timers
+            self.tick += 1
+        return fired
+
+    def _cascade(self):
+        for level in range(1, len(self._levels)):
+            index = (self.tick >> (SLOT_BITS * level)) & SLOT_MASK
+            slot = self._levels[level][index]
+            if slot:
+                timers = list(slot)
+                slot.clear()
+                for timer in timers:
+                    self._place(timer)
+            if index != 0:
+                break
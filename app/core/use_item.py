@@ -1,4 +1,3 @@
-import random
 from core.adrenaline import adrenaline
 from core.shotgun import Shotgun
 from core.models.turn_model import Dealer
@@ -47,21 +46,21 @@ def use_item(
 
         match item:
             case ItemType.HANDSAW:
-                player.inventory.handsaw -= 1
+                player.delete_item(item)
                 shotgun.damage *= 2
                 return (
                     "🧨Careful, the weapon now deals x2 damage",
                     f"{player.data.name} uses🪚",
                 )
             case ItemType.BEER:
-                player.inventory.beer -= 1
+                player.delete_item(item)
                 round = shotgun.shaking()
                 return (
                     f"⤴️ The {round} flew out of the shotgun",
                     f"{player.data.name} uses 🍺. The ⤴️{round} flew out of the shotgun ",
                 )
             case ItemType.SMOKE:
-                player.inventory.smoke -= 1
+                player.delete_item(item)
                 player.smoke()
                 return (
                     f"🚬You now have {player.data.hp} hp",
@@ -70,21 +69,21 @@ def use_item(
             case ItemType.HANDCUFF:
                 if target.tied > 0:
                     return ("You cannot re-link a linked player", None)
-                player.inventory.handcuff -= 1
+                player.delete_item(item)
                 target.tied = 3
-                dealer.extend_turn()
+                dealer.skip_turn()
                 return (
                     f"🔗{target.data.name} is tied for 1 turn",
                     f"🔗 {player.data.name} has tied you up",
                 )
             case ItemType.GLASS:
-                player.inventory.magnifying_glass -= 1
+                player.delete_item(item)
                 return (
                     f"🔍 You see the {str(shotgun.inspect())} inside",
                     f"{player.data.name} uses 🔍. Very interesting...",
                 )
             case ItemType.PHONE:
-                player.inventory.phone -= 1
+                player.delete_item(item)
                 words = {
                     1: 'FIRST',
                     2: 'SECOND',
@@ -95,14 +94,14 @@ def use_item(
                     7: 'SEVENTH',
                     8: 'EIGHTH'
                 }
-                pos = random.randint(0, len(shotgun.rounds)-1)
+                pos = dealer.rng.randint(0, len(shotgun.rounds)-1)
                 return (
                     f"📞 ...The {words[pos+1]} bullet\nis {'🫧BLANK🫧' if shotgun.rounds[::-1][pos].value == '🫧' else '💥LIVE💥'}...",
                     f"📞{player.data.name} calling an unknown number...",
                 )
             case ItemType.PILLS:
-                player.inventory.pills -= 1
-                if random.choice([1,1,2,2,2]) == 1:
+                player.delete_item(item)
+                if dealer.rng.choice([1,1,2,2,2]) == 1:
                     player.smoke(2)
                     return (
                         f"💊You're trying spoiled pills. They're working. You are being healed for 2⚡️",
@@ -115,7 +114,7 @@ def use_item(
                         f"💊🤢{player.data.name} tries the spoiled pills. It was a bad pack. Lose 1⚡️",
                     )
             case ItemType.INVERTER:
-                player.inventory.inverter -= 1
+                player.delete_item(item)
                 shotgun.invert()
                 return (
                     f"🔀You start the inverter. ALL the live bullets became blank bullets. ALL the blank have become live.",
@@ -123,11 +122,9 @@ def use_item(
                 )
             case ItemType.ADRENALINE:
                 if player.still_under_adrenaline():
-                    return (
-                        f"💉That's enough for you.",
-                    )
-                    
-                player.inventory.adrenaline -= 1
+                    return (f"💉That's enough for you.", None)
+
+                player.delete_item(item)
                 player.set_adrenaline_effect(target=target)
                 return (
                     f"💉You feel the speedup. You can use one item from your opponent's inventory.",
@@ -0,0 +1,411 @@
+"""
+Vectorized environment for training agents: many games stepped at once over NumPy arrays.
+
+`VectorEnv` plays the rules of `core.engine` on `n` games kept in arrays, with the shells
+of every game packed as in `core.packed`: a bitmask and a length. `reset(n)` starts the
+games and `step(actions)` plays one action in each of them, gym style. A finished or
+truncated game is started again in the same step, its result is in the rewards and in
+`info["winner"]`.
+
+Observations are what the seat to move knows, see `OBS_*`: its own and the opponent's
+vitals and items, the numbers of live and blank shells left, and the shells it has seen
+itself through GLASS and PHONE. A reveal lasts until the shell leaves the gun or the
+gun is reloaded; an inverter flips the revealed shells with the others. The action
+mask follows `engine.legal_actions`: items held (the opponent's under adrenaline), one
+item besides adrenaline per turn as in `Dealer.use_items`, no handcuffs on a tied
+opponent and no adrenaline twice. Masked actions are still played, and rejected, as
+the engine would.
+
+The rewards are +1 to the seat that moved if it won the game with its action, -1 if it
+lost it (pills, a live shell on itself), 0 otherwise. Games of self-play pass the
+rewards of both seats through the same arrays, `info["mover"]` tells whose they are.
+
+The rules are the engine's, but the random draws are not: all games share one NumPy
+generator, so a game cannot be replayed by the engine from its seed.
+
+Run from the `app` directory:
+    python -m core.vector_env --envs 16384 --steps 300    # random legal actions, steps/s
+"""
+
+import argparse
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from core.engine import (
+    ADRENALINE,
+    BEER,
+    GLASS,
+    HANDCUFF,
+    HANDSAW,
+    INVERTER,
+    ITEM_ACTION_OFFSET,
+    ITEM_DRAWS_ON_RECHARGE,
+    ITEM_DRAWS_ON_START,
+    MAX_ITEMS,
+    N_ACTIONS,
+    PHONE,
+    PILLS,
+    PILLS_OUTCOMES,
+    SMOKE,
+    Action,
+    GameState,
+)
+from core.models.items import N_ITEMS
+from core.rng import SplitMix64
+
+MAX_SHELLS = 8
+# Observation layout, for the seat to move
+OBS_HP = 0  # own HP, opponent's HP, max HP
+OBS_INVENTORY = 3  # own item counts, then the opponent's
+OBS_SHELLS = 3 + 2 * N_ITEMS  # live and blank shells left
+OBS_TURN = OBS_SHELLS + 2  # damage, extra turns, item used
+OBS_TIED = OBS_TURN + 3  # own and opponent's handcuffs
+OBS_ADRENALINE = OBS_TIED + 2  # own and opponent's adrenaline
+OBS_KNOWN_LIVE = OBS_ADRENALINE + 2  # seen live, by position from the next shell
+OBS_KNOWN_BLANK = OBS_KNOWN_LIVE + MAX_SHELLS  # seen blank, by position
+OBS_SIZE = OBS_KNOWN_BLANK + MAX_SHELLS
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(1 << MAX_SHELLS)], dtype=np.int8)
+# The bits of a shell mask of some length, by position from the next shell, the highest bit
+BY_POSITION = np.array(
+    [
+        [
+            [index >= 0 and bits >> index & 1 == 1 for index in range(length - 1, length - 9, -1)]
+            for bits in range(1 << MAX_SHELLS)
+        ]
+        for length in range(MAX_SHELLS + 1)
+    ]
+)
+# Chance that pills heal instead of hurting
+PILLS_HEAL = PILLS_OUTCOMES.count(1) / len(PILLS_OUTCOMES)
+
+
+class VectorEnv:
+    """
+    `n` games of Buckshot Roulette stepped together.
+
+    Args:
+    - max_steps (int): Actions after which a game is truncated.
+    - seed (Optional[int]): Seed of the generator of all games.
+    """
+
+    def __init__(self, max_steps: int = 1000, seed: Optional[int] = None) -> None:
+        self.max_steps = max_steps
+        self.rng = np.random.default_rng(seed)
+        self.n = 0
+
+    def reset(self, n: int) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Starts `n` new games.
+
+        Returns:
+        - Tuple[np.ndarray, Dict[str, Any]]: The observations, `(n, OBS_SIZE)` float32,
+          and the info: `action_mask` `(n, N_ACTIONS)` bool and `seat`, the seat to move.
+        """
+        self.n = n
+        self._rows = np.arange(n)
+        self.hp = np.zeros((n, 2), np.int8)
+        self.max_hp = np.zeros(n, np.int8)
+        self.inventory = np.zeros((n, 2, N_ITEMS), np.int8)
+        self.shells = np.zeros(n, np.int64)
+        self.length = np.zeros(n, np.int64)
+        # Shells seen by each seat, as a bitmask over the same positions as `shells`
+        self.known = np.zeros((n, 2), np.int64)
+        self.damage = np.ones(n, np.int8)
+        self.turn = np.zeros(n, np.int64)
+        self.extra_turns = np.zeros(n, np.int8)
+        self.item_used = np.zeros(n, bool)
+        self.tied = np.zeros((n, 2), np.int8)
+        self.adrenaline = np.zeros((n, 2), bool)
+        self.steps = np.zeros(n, np.int64)
+        self._new_games(np.ones(n, bool))
+        return self.observe(), {"action_mask": self.action_mask(), "seat": self.turn.copy()}
+
+    def step(
+        self, actions: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]:
+        """
+        Plays one `Action` in every game.
+
+        Args:
+        - actions (np.ndarray): `(n,)` actions of the seats to move.
+
+        Returns:
+        - Tuple: observations, rewards of the seats that moved (float32), terminated and
+          truncated flags, and the info: `action_mask` and `seat` of the next move,
+          `winner` of the games that ended (-1 otherwise) and `mover`, the seats the
+          rewards are for.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        if actions.shape != (self.n,) or ((actions < 0) | (actions >= N_ACTIONS)).any():
+            raise ValueError("Expected one valid action per game")
+        mover = self.turn.copy()
+        other = 1 - mover
+        # The seats to move in the flat views of the per-seat arrays
+        own = self._rows * 2 + mover
+        self.steps += 1
+
+        item = actions - ITEM_ACTION_OFFSET
+        is_item = item >= 0
+        if is_item.any():
+            self._use_items(is_item, np.where(is_item, item, 0), own)
+        shots = ~is_item
+        if shots.any():
+            self._shoot(shots, actions == Action.SHOOT_SELF, own)
+        # Shells that left the gun are no longer known
+        self.known &= ((1 << self.length) - 1)[:, None]
+
+        dead = self.hp <= 0
+        terminated = dead[:, 0] | dead[:, 1]
+        winner = np.where(dead[:, 0], 1, np.where(dead[:, 1], 0, -1))
+        reward = np.where(
+            winner == mover, 1.0, np.where(winner == other, -1.0, 0.0)
+        ).astype(np.float32)
+        reload = ~terminated & (self.length == 0)
+        if reload.any():
+            self._reload(reload, ITEM_DRAWS_ON_RECHARGE)
+            self.tied[reload] = 0
+        truncated = ~terminated & (self.steps >= self.max_steps)
+        done = terminated | truncated
+        if done.any():
+            self._new_games(done)
+
+        info = {
+            "action_mask": self.action_mask(),
+            "seat": self.turn.copy(),
+            "winner": winner,
+            "mover": mover,
+        }
+        return self.observe(), reward, terminated, truncated, info
+
+    def _use_items(self, is_item: np.ndarray, item: np.ndarray, own: np.ndarray):
+        # Mirrors engine._use_item, `own` indexes the seats to move in the flat views
+        hp, tied, known = self.hp.reshape(-1), self.tied.reshape(-1), self.known.reshape(-1)
+        adrenaline = self.adrenaline.reshape(-1)
+        inventory = self.inventory.reshape(-1)
+        under_adrenaline = adrenaline.take(own)
+        # Under adrenaline the player spends the opponent's items
+        slot = (own ^ under_adrenaline) * N_ITEMS + item
+        accepted = is_item & (inventory.take(slot) > 0) & ~self.item_used
+        self.item_used |= accepted & (item != ADRENALINE)
+        accepted &= ~(
+            ((item == HANDCUFF) & (tied.take(own ^ 1) > 0))
+            | ((item == ADRENALINE) & under_adrenaline)
+        )
+        # Any item attempt ends the adrenaline effect
+        adrenaline[own[is_item]] = False
+        if not accepted.any():
+            return
+        inventory[slot[accepted]] -= 1
+
+        def games(kind: int) -> np.ndarray:
+            return self._rows[accepted & (item == kind)]
+
+        saw = games(HANDSAW)
+        self.damage[saw] *= 2
+        beer = games(BEER)
+        self.length[beer] -= 1
+        self.shells[beer] &= (1 << self.length[beer]) - 1
+        smoke = games(SMOKE)
+        self._heal(smoke, own[smoke], 1)
+        cuffs = games(HANDCUFF)
+        tied[own[cuffs] ^ 1] = 3
+        self.extra_turns[cuffs] += 1
+        glass = games(GLASS)
+        known[own[glass]] |= 1 << (self.length[glass] - 1)
+        phone = games(PHONE)
+        if phone.size:
+            position = (self.rng.random(phone.size) * self.length[phone]).astype(np.int64)
+            known[own[phone]] |= 1 << (self.length[phone] - 1 - position)
+        pills = games(PILLS)
+        if pills.size:
+            healed = self.rng.random(pills.size) < PILLS_HEAL
+            self._heal(pills[healed], own[pills[healed]], 2)
+            hurt = own[pills[~healed]]
+            hp[hurt] = np.maximum(hp[hurt] - 1, 0)
+        inverter = games(INVERTER)
+        self.shells[inverter] ^= (1 << self.length[inverter]) - 1
+        adrenaline[own[games(ADRENALINE)]] = True
+
+    def _heal(self, games: np.ndarray, seats: np.ndarray, amount: int):
+        hp = self.hp.reshape(-1)
+        hp[seats] = np.minimum(hp[seats] + amount, self.max_hp[games])
+
+    def _shoot(self, shots: np.ndarray, shoot_self: np.ndarray, own: np.ndarray):
+        # Mirrors engine._shoot and _end_turn
+        rows = self._rows[shots]
+        own, shoot_self = own[shots], shoot_self[shots]
+        self.length[rows] -= 1
+        live = (self.shells[rows] >> self.length[rows]) & 1 == 1
+        self.shells[rows] &= (1 << self.length[rows]) - 1
+        hp = self.hp.reshape(-1)
+        target = np.where(shoot_self, own, own ^ 1)
+        dealt = np.where(live, self.damage[rows], 0)
+        hp[target] = np.maximum(hp[target] - dealt, 0)
+        self.damage[rows] = 1
+
+        # A blank on oneself keeps the turn, any other shot counts down the handcuffs
+        again = shoot_self & ~live
+        self.extra_turns[rows[again]] += 1
+        ticking = rows[~again]
+        self.tied[ticking] = np.maximum(self.tied[ticking] - 1, 0)
+        self.adrenaline.reshape(-1)[own] = False
+
+        extra = self.extra_turns[rows] > 0
+        self.extra_turns[rows[extra]] -= 1
+        self.turn[rows[~extra]] ^= 1
+        self.item_used[rows] = False
+
+    def _reload(self, games: np.ndarray, draws: Tuple[int, ...]):
+        # Mirrors engine._reload, with NumPy draws
+        rows = self._rows[games]
+        k = rows.size
+        rng = self.rng
+        n = np.clip(np.rint(rng.normal(5, 1, k)), 2, 7)
+        live = n / 2 + n / 2 * rng.uniform(-0.2, 0.3, k)
+        blank = n - live
+        live = np.maximum(1, np.rint(live)).astype(np.int64)
+        length = live + np.maximum(1, np.rint(blank)).astype(np.int64)
+        # The live shells take the first `live` places of a random order of the shells
+        keys = rng.random((k, MAX_SHELLS))
+        keys[np.arange(MAX_SHELLS) >= length[:, None]] = 2.0
+        ranks = np.argsort(np.argsort(keys, axis=1), axis=1)
+        self.shells[rows] = ((ranks < live[:, None]) << np.arange(MAX_SHELLS)).sum(axis=1)
+        self.length[rows] = length
+        self.known[rows] = 0
+
+        # Mirrors engine._distribute: both seats draw as many items, overflow is dropped
+        count = np.asarray(draws)[rng.integers(len(draws), size=k)]
+        inventory = self.inventory.reshape(-1)
+        for seat in (0, 1):
+            total = self.inventory[rows, seat].sum(axis=1)
+            for draw in range(max(draws)):
+                adding = (draw < count) & (total < MAX_ITEMS)
+                total += adding
+                added = rows[adding] * 2 + seat
+                inventory[added * N_ITEMS + rng.integers(N_ITEMS, size=added.size)] += 1
+
+    def _new_games(self, games: np.ndarray):
+        # Mirrors engine.new_game
+        rows = self._rows[games]
+        hp = self.rng.integers(3, 7, size=rows.size)
+        self.hp[rows] = hp[:, None]
+        self.max_hp[rows] = hp
+        self.turn[rows] = self.rng.integers(2, size=rows.size)
+        self.inventory[rows] = 0
+        self.damage[rows] = 1
+        self.extra_turns[rows] = 0
+        self.item_used[rows] = False
+        self.tied[rows] = 0
+        self.adrenaline[rows] = False
+        self.steps[rows] = 0
+        self._reload(games, ITEM_DRAWS_ON_START)
+
+    def observe(self) -> np.ndarray:
+        """
+        The observations of the seats to move, `(n, OBS_SIZE)` float32.
+        """
+        # Gathers through flat indices are much cheaper than indexing by rows and seats
+        own = self._rows * 2 + self.turn
+        opponent = own ^ 1
+        obs = np.empty((self.n, OBS_SIZE), np.float32)
+        hp = self.hp.reshape(-1)
+        obs[:, OBS_HP] = hp.take(own)
+        obs[:, OBS_HP + 1] = hp.take(opponent)
+        obs[:, OBS_HP + 2] = self.max_hp
+        inventory = self.inventory.reshape(-1, N_ITEMS)
+        obs[:, OBS_INVENTORY : OBS_INVENTORY + N_ITEMS] = inventory.take(own, axis=0)
+        obs[:, OBS_INVENTORY + N_ITEMS : OBS_SHELLS] = inventory.take(opponent, axis=0)
+        live = POPCOUNT.take(self.shells)
+        obs[:, OBS_SHELLS] = live
+        obs[:, OBS_SHELLS + 1] = self.length - live
+        obs[:, OBS_TURN] = self.damage
+        obs[:, OBS_TURN + 1] = self.extra_turns
+        obs[:, OBS_TURN + 2] = self.item_used
+        tied = self.tied.reshape(-1)
+        obs[:, OBS_TIED] = tied.take(own)
+        obs[:, OBS_TIED + 1] = tied.take(opponent)
+        adrenaline = self.adrenaline.reshape(-1)
+        obs[:, OBS_ADRENALINE] = adrenaline.take(own)
+        obs[:, OBS_ADRENALINE + 1] = adrenaline.take(opponent)
+
+        # Position 0 is the next shell
+        by_position = BY_POSITION.reshape(-1, MAX_SHELLS)
+        length = self.length << MAX_SHELLS
+        seen = by_position.take(length | self.known.reshape(-1).take(own), axis=0)
+        live = by_position.take(length | self.shells, axis=0)
+        obs[:, OBS_KNOWN_LIVE:OBS_KNOWN_BLANK] = seen & live
+        obs[:, OBS_KNOWN_BLANK:] = seen & ~live
+        return obs
+
+    def action_mask(self) -> np.ndarray:
+        """
+        The actions of the seats to move that will not be rejected, `(n, N_ACTIONS)` bool.
+        """
+        own = self._rows * 2 + self.turn
+        under_adrenaline = self.adrenaline.reshape(-1).take(own)
+        # Under adrenaline the items are the opponent's
+        source = own ^ under_adrenaline
+        mask = np.zeros((self.n, N_ACTIONS), bool)
+        mask[:, Action.SHOOT_OPPONENT] = True
+        mask[:, Action.SHOOT_SELF] = True
+        items = self.inventory.reshape(-1, N_ITEMS).take(source, axis=0) > 0
+        items &= ~self.item_used[:, None]
+        items[:, HANDCUFF] &= self.tied.reshape(-1).take(own ^ 1) <= 0
+        items[:, ADRENALINE] &= ~under_adrenaline
+        mask[:, ITEM_ACTION_OFFSET:] = items
+        return mask
+
+    def game(self, index: int) -> GameState:
+        """
+        The game `index` as an engine state, to inspect it or carry on in the engine.
+        Its random stream is a new one, the generator of the environment is not part of it.
+        """
+        state = GameState(int(self.max_hp[index]), int(self.turn[index]), SplitMix64())
+        state.hp = self.hp[index].tolist()
+        state.inventory = self.inventory[index].tolist()
+        shells = int(self.shells[index])
+        state.rounds = [bool(shells >> i & 1) for i in range(self.length[index])]
+        state.damage = int(self.damage[index])
+        state.extra_turns = int(self.extra_turns[index])
+        state.item_used = bool(self.item_used[index])
+        state.tied = self.tied[index].tolist()
+        state.adrenaline = self.adrenaline[index].tolist()
+        return state
+
+
+def random_actions(mask: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    A uniformly random legal action per game.
+    """
+    scores = rng.random(mask.shape) * mask
+    return scores.argmax(axis=1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput of the vectorized environment")
+    parser.add_argument("--envs", type=int, default=16384)
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    env = VectorEnv(seed=args.seed)
+    _, info = env.reset(args.envs)
+    rng = np.random.default_rng(args.seed + 1)
+    games = 0
+    started = time.perf_counter()
+    for _ in range(args.steps):
+        _, _, terminated, _, info = env.step(random_actions(info["action_mask"], rng))
+        games += int(terminated.sum())
+    elapsed = time.perf_counter() - started
+    steps = args.envs * args.steps
+    print(
+        f"{steps} steps in {elapsed:.2f}s: {steps / elapsed:,.0f} steps/s, "
+        f"{games} games finished"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,24 @@ from aiogram import Router, F
 from aiogram.types import Message
 import logging
 
+from handlers.rooms_manager import MANAGER
+
 router = Router()
-logger = logging.getLogger()
+# A record per message, sampled, see utils.logs
+logger = logging.getLogger("buckshot.messages")
 
 
 @router.message()
 async def cmd_start(message: Message):
     logger.info(
-        f"chat: {message.chat.username} | user: {message.from_user.username} | mess: {message.text}"
+        "chat: %s | user: %s | mess: %s",
+        message.chat.username,
+        message.from_user.username,
+        message.text,
+        extra={
+            "chat_id": message.chat.id,
+            "room_id": MANAGER.room_of(message.chat.id),
+            "action": "unhandled",
+        },
     )
     return
@@ -1,88 +1,242 @@
-import random
 import re
+from typing import Optional
 from aiogram import F, Bot, Router, types
 from aiogram.filters import Command
 from aiogram.types import Message
+from core.engine import action_to_scene
+from core.mcts import SearchPool
 from core.models.items import ItemType
-from core.player import Player
 from core.models.turn_model import TurnResult
-from core.room_manager import RoomsManager
+from core.room_manager import RoomsManager, TurnOutcome, is_solo_dealer, solo_dealer_id
+from core.matchmaking import Matchmaker
+from core.sharding import LocalRooms, ShardedRooms
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
-from utils.storage import STORAGE
+from utils.storage import GAME_LOG, ROOMS, STORAGE
+from middlewares import RoomOrderMiddleware
 
-from core.game_states import GameStates
+from handlers.game_states import GameStates
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
 from aiogram.filters import StateFilter
 import asyncio
+import logging
+import time
 from utils.edit_message_with_delay import edit_message
+from utils.outbox import Outbox
+from utils.scheduler import Scheduler
+from utils.profiling import TIMINGS, Timed
+from utils.metrics import (
+    GAMES_FINISHED,
+    GAMES_STARTED,
+    LIVE_ROOMS,
+    LOBBY_SIZE,
+    MAKE_TURN_SECONDS,
+    METRICS,
+    OUTBOX_DEPTH,
+    SEATED_PLAYERS,
+)
+from config import config
 
 
 
 router = Router()
-MANAGER = RoomsManager()
+# Rooms live in worker processes if shards are configured, otherwise in the bot process.
+# Time spent in them is the engine time of the slow-update profile
+if config.shards:
+    MANAGER = Timed(
+        ShardedRooms(
+            config.shards,
+            config.root_seed,
+            config.game_log_path,
+            config.room_idle_timeout,
+            log_flush_interval=config.game_log_flush_interval,
+        )
+    )
+else:
+    MANAGER = Timed(
+        LocalRooms(
+            RoomsManager(
+                root_seed=config.root_seed,
+                log=GAME_LOG,
+                rooms=ROOMS,
+                players_to_rooms=ROOMS.player_rooms() if ROOMS is not None else None,
+                idle_timeout=config.room_idle_timeout,
+            )
+        )
+    )
+MATCHMAKER = Matchmaker(timeout=config.matchmaking_timeout)
+# Orders the updates of every room, the matchmaker seats its matches in the same order
+ROOM_ORDER = RoomOrderMiddleware(
+    MANAGER.room_of,
+    max_queue=config.room_queue_size,
+    duplicate_window=config.duplicate_tap_window,
+)
+OUTBOX = Outbox(config.send_rate_per_chat, config.send_burst_per_chat, config.send_rate_global)
+# Moves by the first character of the button text
+ACTIONS = {
+    "🔼": "him",
+    "🔽": "me",
+    "🍺": ItemType.BEER,
+    "🚬": ItemType.SMOKE,
+    "🪚": ItemType.HANDSAW,
+    "🔗": ItemType.HANDCUFF,
+    "🔍": ItemType.GLASS,
+    "💉": ItemType.ADRENALINE,
+    "🔀": ItemType.INVERTER,
+    "📞": ItemType.PHONE,
+    "💊": ItemType.PILLS,
+}
+# Delayed work of every room: timers are keyed by chat id, adrenaline ones by (chat id, "adrenaline")
+SCHEDULER = Scheduler()
+# Moves of the /solo dealers are searched in worker processes
+SEARCH = SearchPool(config.solo_workers, config.solo_move_budget, config.root_seed)
+# Moves a dealer plays in a row at most, a guard against a move the room keeps refusing
+MAX_DEALER_MOVES = 32
+
+
+@METRICS.collector
+async def collect_metrics():
+    stats = await MANAGER.stats()
+    LIVE_ROOMS.set(stats["live_rooms"])
+    SEATED_PLAYERS.set(stats["seated_players"])
+    LOBBY_SIZE.set(len(MATCHMAKER))
+    OUTBOX_DEPTH.set(OUTBOX.stats()["depth"])
+
+
+def send_to_player(bot: Bot, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+    """
+    Queues a message to a seated player. A /solo dealer has no chat, its messages are
+    dropped and the future holds None.
+    """
+    if is_solo_dealer(chat_id):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+    return OUTBOX.send_message(bot, chat_id, text, **kwargs)
+
+
+def cancel_timers(*chat_ids: int):
+    """
+    Cancels the pending timers of the players of a closed room.
+    """
+    for chat_id in chat_ids:
+        SCHEDULER.cancel_key(chat_id)
+        SCHEDULER.cancel_key((chat_id, "adrenaline"))
 
 
 @router.message(Command("find"), StateFilter(None))
 async def find_game(message: Message, bot: Bot, state: FSMContext):
-    
-    if len(MANAGER.search_lobby) > 0:
-        user_id = next(iter(MANAGER.search_lobby))
-        user_data = MANAGER.search_lobby.pop(user_id)
-        room_id = random.randint(100000, 999999)
-        
-        message = message.model_copy(update={"text": "/join " + str(room_id)})
-        await join(message=message, bot=bot, state=state)
-        
-        second_user_message = user_data['message']
-        second_user_message = second_user_message.model_copy(update={"text": "/join " + str(room_id)})
-        
-        second_user_state = FSMContext(
-            storage=STORAGE,
-            key=StorageKey(
-                chat_id=second_user_message.chat.id,
-                user_id=second_user_message.from_user.id,  
-                bot_id=bot.id
+    # The state is set first, a match started by the next tick moves the player in game.
+    # The lobby message is queued before the player, so it precedes the game messages
+    await state.set_state(GameStates.in_search)
+    lobby = OUTBOX.send_message(
+        bot,
+        message.chat.id,
+        "⏳You are in the waiting lobby. As soon as another player tries to find a game, he will join you.",
+    )
+    MATCHMAKER.enqueue(message.from_user.id, payload=message)
+    await lobby
+
+
+async def start_match(bot: Bot, first: Message, second: Message):
+    """
+    Seats two matched players in a new room, the same way as two /join commands. The
+    seating waits its turn with the updates of both players, and a player who has left
+    the lobby meanwhile is not seated: the other one waits for the next match.
+    """
+    async with ROOM_ORDER.hold(first.chat.id, second.chat.id):
+        players = []
+        for user_message in (first, second):
+            user_state = FSMContext(
+                storage=STORAGE,
+                key=StorageKey(
+                    chat_id=user_message.chat.id,
+                    user_id=user_message.from_user.id,
+                    bot_id=bot.id
+                )
             )
+            players.append((user_message, user_state))
+        searching = [
+            await user_state.get_state() == GameStates.in_search.state
+            for _, user_state in players
+        ]
+        if not all(searching):
+            for (user_message, _), still_searching in zip(players, searching):
+                if still_searching:
+                    MATCHMAKER.enqueue(user_message.from_user.id, payload=user_message)
+            return
+
+        room_id = await MANAGER.new_room_id()
+        for user_message, user_state in players:
+            # A player who left and came back meanwhile has a new ticket
+            MATCHMAKER.cancel(user_message.from_user.id)
+            user_message = user_message.model_copy(update={"text": "/join " + str(room_id)})
+            await join(message=user_message, bot=bot, state=user_state)
+
+
+async def run_matchmaking(bot: Bot, interval: float):
+    """
+    Pairs the waiting players in batches every interval and releases the expired ones.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        matches, expired = MATCHMAKER.tick()
+        results = await asyncio.gather(
+            *(start_match(bot, first.payload, second.payload) for first, second in matches),
+            return_exceptions=True,
         )
-        
-        await join(message=second_user_message, bot=bot, state=second_user_state)
-        
-    else:
-        MANAGER.search_lobby[message.from_user.id] = {'message': message}
-        await message.answer("⏳You are in the waiting lobby. As soon as another player tries to find a game, he will join you.")
-        await state.set_state(GameStates.in_search)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error("Failed to start a match", exc_info=result)
+        for ticket in expired:
+            user_message: Message = ticket.payload
+            user_state = FSMContext(
+                storage=STORAGE,
+                key=StorageKey(
+                    chat_id=user_message.chat.id,
+                    user_id=user_message.from_user.id,
+                    bot_id=bot.id
+                )
+            )
+            await user_state.clear()
+            try:
+                await OUTBOX.send_message(
+                    bot, user_message.chat.id, "⌛Nobody was found. Try /find again later"
+                )
+            except Exception:
+                pass
     
 
 @router.message(Command("leave"))
 @router.message(F.text.in_(["🚪Leave"]))
 async def new_round(message: Message, bot: Bot, state: FSMContext):
-    if state == GameStates.in_search:
-        #TODO
-        pass
-    
+    if await state.get_state() == GameStates.in_search.state:
+        MATCHMAKER.cancel(message.from_user.id)
+
     await state.clear()
     try:
-        first_player, second_player = MANAGER.get_players_chatid(message.chat.id)
+        first_player, second_player = await MANAGER.get_players_chatid(message.chat.id)
     except Exception as e:
         await message.answer("farewell!", reply_markup=types.ReplyKeyboardRemove())
         return
 
-    MANAGER.del_player_from_rooms(first_player)
-    MANAGER.del_player_from_rooms(second_player)
-
-    if first_player is not None:
-        await bot.send_message(
-            first_player,
-            f"{message.from_user.first_name} has left the game",
-            reply_markup=types.ReplyKeyboardRemove(),
-        )
-    if second_player is not None:
-        await bot.send_message(
-            second_player,
-            f"{message.from_user.first_name} has left the game",
-            reply_markup=types.ReplyKeyboardRemove(),
+    await MANAGER.del_player_from_rooms(first_player)
+    await MANAGER.del_player_from_rooms(second_player)
+    cancel_timers(first_player, second_player)
+    GAMES_FINISHED.inc("left")
+
+    await asyncio.gather(
+        *(
+            send_to_player(
+                bot,
+                player,
+                f"{message.from_user.first_name} has left the game",
+                reply_markup=types.ReplyKeyboardRemove(),
+            )
+            for player in (first_player, second_player)
+            if player is not None
         )
+    )
 
 
 @router.message(
@@ -94,15 +248,12 @@ async def new_round(message: Message, bot: Bot, state: FSMContext):
 )
 async def join(message: Message, bot: Bot, state: FSMContext):
 
-    room_id = extract_code_from_string(message.text)
+    room_id = extract_code_from_string(message.text) or await MANAGER.new_room_id()
+    # Creating the room or taking its free seat is one step, see RoomsManager.join_room
+    turn_result = await MANAGER.join_room(room_id, message.from_user.first_name, message.chat.id)
+    await state.set_state(GameStates.in_game)
 
-    if not room_id or not MANAGER.check_room(room_id):
-        room_id = room_id or random.randint(100000, 999999)
-        MANAGER.create_room(room_id)
-        MANAGER.reg_player_in_room(
-            message.from_user.first_name, message.chat.id, room_id
-        )
-        await state.set_state(GameStates.in_game)
+    if turn_result is None:
         await state.set_data({"room": room_id})
         await message.answer(
             f"You are in the room `{room_id}` now. Waiting to second player. Send him the code!",
@@ -110,14 +261,9 @@ async def join(message: Message, bot: Bot, state: FSMContext):
         )
         return
 
-    room = MANAGER.get_room(room_id)
-    MANAGER.reg_player_in_room(message.from_user.first_name, message.chat.id, room_id)
-    await state.set_state(GameStates.in_game)
     await state.set_data({"room_id": room_id})
-    first_player, second_player = MANAGER.get_players_chatid(message.chat.id)
-
-    turn_result = room.start()
-    first_player, second_player = MANAGER.get_players_chatid(
+    GAMES_STARTED.inc()
+    first_player, second_player = await MANAGER.get_players_chatid(
         turn_result.on_start_first_id
     )
     passive_user_id = (
@@ -129,10 +275,42 @@ async def join(message: Message, bot: Bot, state: FSMContext):
         active_user_id=turn_result.on_start_first_id,
         passive_user_id=passive_user_id,
         need_update=True,
-        loadout_show_time=101
+        loadout_show_time=None
     )
 
-async def send_info(bot: Bot, user_id: int, turn_result: TurnResult):
+# After a game the player is still in the in_game state, as for /rematch
+@router.message(StateFilter(None, GameStates.in_game), Command("solo"))
+async def solo(message: Message, bot: Bot, state: FSMContext):
+    """
+    Starts a game against the dealer, who takes the second seat of a new room.
+    """
+    if MANAGER.room_of(message.chat.id) is not None:
+        await message.answer("Leave your current game first")
+        return
+    room_id = await MANAGER.new_room_id()
+    dealer_id = solo_dealer_id(room_id)
+    await MANAGER.create_room(room_id)
+    await MANAGER.reg_player_in_room(message.from_user.first_name, message.chat.id, room_id)
+    await MANAGER.reg_player_in_room("🎩Dealer", dealer_id, room_id)
+    await state.set_state(GameStates.in_game)
+    await state.set_data({"room_id": room_id})
+
+    turn_result = await MANAGER.start_game(room_id)
+    GAMES_STARTED.inc()
+    first_id = turn_result.on_start_first_id
+    await send_game_messages(
+        bot,
+        turn_result,
+        active_user_id=first_id,
+        passive_user_id=dealer_id if first_id == message.chat.id else message.chat.id,
+        need_update=True,
+        loadout_show_time=None
+    )
+    if first_id == dealer_id:
+        await play_dealer(bot, dealer_id)
+
+
+def send_info(bot: Bot, user_id: int, turn_result: TurnResult) -> asyncio.Future:
     res = (
         turn_result.first_player_hp
         + "Items: "
@@ -142,7 +320,7 @@ async def send_info(bot: Bot, user_id: int, turn_result: TurnResult):
         + "Items: "
         + ",".join(turn_result.second_player_items)
     )
-    await bot.send_message(user_id, res)
+    return send_to_player(bot, user_id, res)
 
 
 async def send_game_messages(
@@ -151,7 +329,7 @@ async def send_game_messages(
     active_user_id: int,
     passive_user_id: int,
     need_update: bool,
-    loadout_show_time = 4
+    loadout_show_time: Optional[float] = 4
 ):
 
     active_user_items = (
@@ -175,21 +353,42 @@ async def send_game_messages(
         builder.row(types.KeyboardButton(text="🔽"))
     else:
         builder.row(types.KeyboardButton(text="🕓Please, wait🕓"))
-    await bot.send_message(
-        active_user_id,
-        turn_result.active_player_action_result,
-        reply_markup=builder.as_markup(resize_keyboard=True),
-    )
-    await send_info(bot, active_user_id, turn_result)
-    
+    # Everything is queued before the first await, so the outbox merges the messages
+    # of every chat and sends both chats concurrently
+    sent = [
+        send_to_player(
+            bot,
+            active_user_id,
+            turn_result.active_player_action_result,
+            reply_markup=builder.as_markup(resize_keyboard=True),
+        ),
+        send_info(bot, active_user_id, turn_result),
+    ]
+
+    loadouts = []
     if(turn_result.rounds):
-        msg1 = await bot.send_message(active_user_id, turn_result.rounds, protect_content=True)
-        msg2 = await bot.send_message(passive_user_id, turn_result.rounds, protect_content=True)
-        asyncio.create_task(edit_message(msg1, sleep=loadout_show_time))
-        asyncio.create_task(edit_message(msg2, sleep=loadout_show_time))
+        loadouts = [
+            send_to_player(bot, active_user_id, turn_result.rounds, protect_content=True),
+            send_to_player(bot, passive_user_id, turn_result.rounds, protect_content=True),
+        ]
 
-    if not turn_result.passive_player_action_result:
-        return
+    if turn_result.passive_player_action_result:
+        sent += send_passive_messages(bot, turn_result, passive_user_id, passive_user_items, need_update)
+
+    await asyncio.gather(*sent)
+    loadouts = await asyncio.gather(*loadouts)
+    if loadout_show_time is not None:
+        for msg in filter(None, loadouts):
+            SCHEDULER.call_later(loadout_show_time, edit_message, OUTBOX, bot, msg, key=msg.chat.id)
+
+
+def send_passive_messages(
+    bot: Bot,
+    turn_result: TurnResult,
+    passive_user_id: int,
+    passive_user_items,
+    need_update: bool,
+) -> list:
 
     builder = ReplyKeyboardBuilder()
     if turn_result.give_turn:
@@ -201,91 +400,127 @@ async def send_game_messages(
         builder.row(types.KeyboardButton(text="🔽"))
     else:
         builder.row(types.KeyboardButton(text="🕓Please, wait🕓"))
-    await bot.send_message(
-        passive_user_id,
-        turn_result.passive_player_action_result,
-        reply_markup=builder.as_markup(resize_keyboard=True),
-    )
+    sent = [
+        send_to_player(
+            bot,
+            passive_user_id,
+            turn_result.passive_player_action_result,
+            reply_markup=builder.as_markup(resize_keyboard=True),
+        )
+    ]
     if turn_result.give_turn or need_update:
-        await send_info(bot, passive_user_id, turn_result)
+        sent.append(send_info(bot, passive_user_id, turn_result))
+    return sent
 
 
 @router.message(GameStates.in_game, F.text, F.text.not_in(["🚪Leave"]), F.text.not_contains("/"))
 async def in_game(message: Message, bot: Bot, state: FSMContext):
+    action = ACTIONS.get(message.text[0], None)
+
     try:
-        room_id = MANAGER.get_room_id_by_player(message.chat.id)
+        outcome = await MANAGER.play_turn(message.chat.id, action)
     except Exception:
         await state.clear()
         return
 
-    room = MANAGER.get_room(room_id)
-    active_user, passive_user = room.solve_players()
-
-    if message.chat.id != active_user.data.chat_id:
+    if not outcome.your_turn:
         await message.answer("Please, wait your turn")
         return
 
-    need_update = False
-
-    action_mapping = {
-        "🔼": "him",
-        "🔽": "me",
-        "🍺": ItemType.BEER,
-        "🚬": ItemType.SMOKE,
-        "🪚": ItemType.HANDSAW,
-        "🔗": ItemType.HANDCUFF,
-        "🔍": ItemType.GLASS,
-        "💉": ItemType.ADRENALINE,
-        "🔀": ItemType.INVERTER,
-        "📞": ItemType.PHONE,
-        "💊": ItemType.PILLS,
-    }
-
-    action = action_mapping.get(message.text[0], None)
-
-    if action is None:
+    if outcome.turn_result is None:
         await message.answer("Make a valid turn")
         return
+    SCHEDULER.cancel_key((message.chat.id, "adrenaline"))
+
+    if await send_outcome(bot, outcome, message.chat.id) and is_solo_dealer(outcome.passive_id):
+        await play_dealer(bot, outcome.passive_id)
+
 
-    turn_result = room.make_turn(action, message.chat.id)
+async def send_outcome(bot: Bot, outcome: TurnOutcome, chat_id: int) -> bool:
+    """
+    Sends the result of a move played by `chat_id` to both players.
 
+    Returns:
+    - bool: False if the move has ended the game.
+    """
+    if outcome.turn_seconds is not None:
+        MAKE_TURN_SECONDS.observe(outcome.turn_seconds)
+
+    turn_result = outcome.turn_result
     if turn_result.is_game_ended:
-        room_id = random.randint(100000, 999999)
+        GAMES_FINISHED.inc("won")
+        if is_solo_dealer(outcome.winner_id) or is_solo_dealer(outcome.loser_id):
+            again = "/solo"
+        else:
+            again = f"/rematch {await MANAGER.new_room_id()}"
         kb = [
             [types.KeyboardButton(text="🚪Leave")],
-            [types.KeyboardButton(text=f"/rematch {room_id}")],
+            [types.KeyboardButton(text=again)],
         ]
         keyboard_die = types.ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
         keyboard_win = types.ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
 
-        if passive_user.data.hp < 1:
-            await send_game_end_message(
-                bot, room, keyboard_die, keyboard_win, passive_user, active_user
-            )
-        else:
-            await send_game_end_message(
-                bot, room, keyboard_die, keyboard_win, active_user, passive_user
-            )
+        cancel_timers(outcome.loser_id, outcome.winner_id)
+        await send_game_end_message(
+            bot, keyboard_die, keyboard_win, outcome.loser_id, outcome.winner_id
+        )
+        return False
 
-    else:
-        await send_game_messages(
+    await send_game_messages(
+        bot,
+        turn_result,
+        outcome.active_id,
+        outcome.passive_id,
+        need_update=False,
+    )
+    if outcome.adrenaline_left is not None and not is_solo_dealer(chat_id):
+        SCHEDULER.call_later(
+            max(0.0, outcome.adrenaline_left),
+            OUTBOX.send_message,
             bot,
-            turn_result,
-            active_user.data.chat_id,
-            passive_user.data.chat_id,
-            need_update,
+            chat_id,
+            "💉🦥The adrenaline has worn off, your opponent's items are out of reach.",
+            key=(chat_id, "adrenaline"),
         )
+    return True
+
+
+async def play_dealer(bot: Bot, dealer_id: int):
+    """
+    Plays the moves of a /solo dealer for as long as it is its turn. The moves are
+    searched in `SEARCH`, the event loop only waits for them.
+    """
+    for _ in range(MAX_DEALER_MOVES):
+        try:
+            observation = await MANAGER.observe(dealer_id)
+        except Exception:
+            # The player has left
+            return
+        if observation is None:
+            return
+        started = time.perf_counter()
+        action = await SEARCH.best_move(observation)
+        timings = TIMINGS.get()
+        if timings is not None:
+            timings.search += time.perf_counter() - started
+        try:
+            outcome = await MANAGER.play_turn(dealer_id, action_to_scene(action))
+        except Exception:
+            return
+        if outcome.turn_result is None or not await send_outcome(bot, outcome, dealer_id):
+            return
 
 
 async def send_game_end_message(
-    bot: Bot, room, keyboard_die, keyboard_win, loser: Player, winner: Player
+    bot: Bot, keyboard_die, keyboard_win, loser_id: int, winner_id: int
 ):
-    await bot.send_message(loser.data.chat_id, "⚰️You died", reply_markup=keyboard_die)
-    await bot.send_message(
-        winner.data.chat_id, "💼Congratulations, you've won!", reply_markup=keyboard_win
+    # Both players have already left the room in MANAGER.play_turn
+    await asyncio.gather(
+        send_to_player(bot, loser_id, "⚰️You died", reply_markup=keyboard_die),
+        send_to_player(
+            bot, winner_id, "💼Congratulations, you've won!", reply_markup=keyboard_win
+        ),
     )
-    MANAGER.del_player_from_rooms(loser.data.chat_id)
-    MANAGER.del_player_from_rooms(winner.data.chat_id)
 
 
 def extract_code_from_string(input_string):
@@ -297,3 +532,46 @@ def extract_code_from_string(input_string):
         return int(code)
     else:
         return None
+
+
+def flush_game_log(interval: float):
+    """
+    Writes the buffered records of the games still running and runs again after the interval.
+    """
+    SCHEDULER.call_later(interval, flush_game_log, interval)
+    try:
+        GAME_LOG.flush()
+    except OSError:
+        logging.exception("Failed to flush the game log")
+
+
+async def reap_idle_rooms(bot: Bot, interval: float):
+    """
+    Closes idle rooms, resetting the state of their players, and runs again after the interval.
+    """
+    SCHEDULER.call_later(interval, reap_idle_rooms, bot, interval)
+    try:
+        evicted = await MANAGER.reap()
+    except Exception:
+        logging.exception("Failed to reap idle rooms")
+        return
+    cancel_timers(*evicted)
+    for chat_id in evicted:
+        if is_solo_dealer(chat_id):
+            continue
+        state = FSMContext(
+            storage=STORAGE,
+            key=StorageKey(chat_id=chat_id, user_id=chat_id, bot_id=bot.id),
+        )
+        await state.clear()
+        try:
+            await OUTBOX.send_message(
+                bot,
+                chat_id,
+                "⌛The game was closed due to inactivity",
+                reply_markup=types.ReplyKeyboardRemove(),
+            )
+        except Exception:
+            pass
+    if evicted:
+        logging.info("Evicted %d idle players, rooms: %s", len(evicted), await MANAGER.stats())
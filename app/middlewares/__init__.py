@@ -0,0 +1,3 @@
+from .metrics import HandlerMetrics, TelegramMetrics
+from .profiling import ProfilingMiddleware
+from .room_order import RoomOrderMiddleware
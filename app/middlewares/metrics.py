@@ -0,0 +1,100 @@
+"""
+Middlewares feeding `utils.metrics`: handler latency and Bot API requests.
+"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Collection, Dict, Mapping, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import Message
+
+from utils.metrics import HANDLER_SECONDS, TELEGRAM_ERRORS, TELEGRAM_REQUESTS
+
+# A record per update, sampled, see utils.logs
+updates_logger = logging.getLogger("buckshot.updates")
+
+
+class HandlerMetrics(BaseMiddleware):
+    """
+    Inner message middleware timing every handler, labelled by the handler and by the
+    command or move of the message. Unknown commands and texts share a label, so the
+    number of series stays bounded. Every update is also logged to `buckshot.updates`
+    with its chat, room, action and latency.
+
+    Args:
+    - actions (Mapping[str, Any]): Moves by the first character of the text.
+    - commands (Collection[str]): Commands labelled by their name.
+    - room_of (Optional[Callable[[int], Optional[int]]]): The room of a chat, for the log.
+    """
+
+    def __init__(
+        self,
+        actions: Mapping[str, Any],
+        commands: Collection[str],
+        room_of: Optional[Callable[[int], Optional[int]]] = None,
+    ) -> None:
+        self.actions = actions
+        self.commands = frozenset(commands)
+        self.room_of = room_of
+
+    def action_of(self, text: str) -> str:
+        if not text:
+            return "other"
+        if text[0] == "/":
+            command = text[1:].split(maxsplit=1)[0].split("@")[0] if len(text) > 1 else ""
+            return "/" + command if command in self.commands else "/other"
+        action = self.actions.get(text[0])
+        if action is None:
+            return "text"
+        return getattr(action, "value", action)
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        # Before the handler, which may close the room
+        room_id = self.room_of(event.chat.id) if self.room_of is not None else None
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            name = f"{callback.__module__}.{callback.__name__}"
+            action = self.action_of(event.text)
+            HANDLER_SECONDS.observe(elapsed, name, action)
+            updates_logger.info(
+                "Handled by %s",
+                name,
+                extra={
+                    "chat_id": event.chat.id,
+                    "room_id": room_id,
+                    "action": action,
+                    "latency": round(elapsed, 6),
+                },
+            )
+
+
+class TelegramMetrics(BaseRequestMiddleware):
+    """
+    Session middleware counting Bot API requests and their errors by method.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        name = method.__api_method__
+        TELEGRAM_REQUESTS.inc(name)
+        try:
+            return await make_request(bot, method)
+        except Exception as error:
+            TELEGRAM_ERRORS.inc(name, type(error).__name__)
+            raise
@@ -0,0 +1,71 @@
+"""
+Finds the slow updates and splits their time between the engine, the /solo search and
+Telegram.
+"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from utils.profiling import SLOW_UPDATES, TIMINGS, Timings
+
+logger = logging.getLogger()
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """
+    Inner message middleware timing every handler. Updates slower than `threshold`
+    seconds are logged and kept in `utils.profiling.SLOW_UPDATES`, with their time in
+    the rooms (engine), waiting for /solo moves (search) and the rest, spent sending.
+
+    Args:
+    - threshold (float): Seconds above which an update is slow.
+    """
+
+    def __init__(self, threshold: float = 0.5) -> None:
+        self.threshold = threshold
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        timings = Timings()
+        token = TIMINGS.set(timings)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            total = time.perf_counter() - started
+            TIMINGS.reset(token)
+            if total >= self.threshold:
+                self.record(event, data, total, timings)
+
+    def record(self, event: Message, data: Dict[str, Any], total: float, timings: Timings):
+        callback = data["handler"].callback
+        slow = {
+            "at": time.time(),
+            "handler": f"{callback.__module__}.{callback.__name__}",
+            "chat_id": event.chat.id,
+            "text": (event.text or "")[:32],
+            "total": round(total, 6),
+            "engine": round(timings.engine, 6),
+            "search": round(timings.search, 6),
+            "send": round(total - timings.engine - timings.search, 6),
+            "messages": timings.messages,
+        }
+        SLOW_UPDATES.append(slow)
+        logger.warning(
+            "Slow update %.0f ms in %s (engine %.1f ms, search %.1f ms, send %.1f ms, %d messages)",
+            total * 1e3,
+            slow["handler"],
+            timings.engine * 1e3,
+            timings.search * 1e3,
+            slow["send"] * 1e3,
+            timings.messages,
+            extra={"chat_id": event.chat.id, "latency": round(total, 6)},
+        )
@@ -0,0 +1,220 @@
+"""
+Keeps the updates of a room in order while different rooms are processed in parallel.
+
+Every message is keyed by the room of its chat, or by the chat itself while the player
+is not seated; `/join N` and `/rematch N` of a player not seated are keyed by room N, so
+players joining the same room take turns. Updates of one key run one by one in arrival
+order, updates of different keys run concurrently, so the dispatcher can handle many
+updates at the same time without two moves of the same game racing each other. A chat
+keeps its key while it has updates queued or running, so joining a room never reorders
+the player's own updates. Work started outside of an update, as seating the players
+paired by the matchmaker, takes its turn in the same lanes with `hold`.
+
+A text is dropped as a double tap only while the same text of the chat is still queued
+or running: a move repeated after its answer, as a second shot after a blank, is kept.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+)
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+logger = logging.getLogger()
+
+# Commands naming the room to join, as parsed by handlers.rooms_manager
+JOIN_COMMAND = re.compile(r"/(?:join|rematch)(?:@\w+)? (\d{6})")
+
+
+class _Lane:
+    """
+    The updates of one key: the number queued or running, and the ones waiting their turn.
+    """
+
+    __slots__ = ("pending", "waiters")
+
+    def __init__(self) -> None:
+        self.pending = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+
+class RoomOrderMiddleware(BaseMiddleware):
+    """
+    Outer message middleware serializing updates per room.
+
+    Args:
+    - room_of (Callable[[int], Optional[int]]): The room of a chat, None if not seated.
+    - max_queue (int): Updates of one key queued or running, more are dropped.
+    - duplicate_window (float): Seconds within which the same text from a chat is dropped
+      while the first one is still queued or running.
+    """
+
+    def __init__(
+        self,
+        room_of: Callable[[int], Optional[int]],
+        max_queue: int = 16,
+        duplicate_window: float = 0.5,
+    ) -> None:
+        self.room_of = room_of
+        self.max_queue = max_queue
+        self.duplicate_window = duplicate_window
+        self._lanes: Dict[Hashable, _Lane] = {}
+        # chat id -> [key, updates of the chat queued or running,
+        #             {text: [texts queued or running, time of the last one]}]
+        self._chats: Dict[int, List[Any]] = {}
+        self.dropped_duplicates = 0
+        self.dropped_overflow = 0
+
+    def _is_duplicate(self, chat_id: int, text: Optional[str]) -> bool:
+        if text is None or self.duplicate_window <= 0:
+            return False
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return False
+        # Only a text not answered yet can be tapped twice
+        same = chat[2].get(text)
+        return same is not None and time.monotonic() - same[1] <= self.duplicate_window
+
+    def _key(self, chat_id: int, text: Optional[str]) -> Hashable:
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            return chat[0]
+        room_id = self.room_of(chat_id)
+        if room_id is not None:
+            return ("room", room_id)
+        join = JOIN_COMMAND.match(text) if text else None
+        return ("chat", chat_id) if join is None else ("room", int(join.group(1)))
+
+    def _release(self, key: Hashable, lane: _Lane):
+        lane.pending -= 1
+        while lane.waiters:
+            waiter = lane.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        if not lane.pending:
+            del self._lanes[key]
+
+    def _leave_chat(self, chat_id: int, text: Optional[str]):
+        chat = self._chats[chat_id]
+        chat[1] -= 1
+        if not chat[1]:
+            del self._chats[chat_id]
+        elif text is not None:
+            same = chat[2][text]
+            same[0] -= 1
+            if not same[0]:
+                del chat[2][text]
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat_id = event.chat.id
+        text = event.text
+        if self._is_duplicate(chat_id, text):
+            self.dropped_duplicates += 1
+            return None
+
+        key = self._key(chat_id, text)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        elif lane.pending >= self.max_queue:
+            self.dropped_overflow += 1
+            logger.warning("Dropped an update of %s: %d updates queued", key, lane.pending)
+            return None
+        lane.pending += 1
+        self._join_chat(chat_id, key, text)
+        try:
+            await self._wait_turn(key, lane)
+            try:
+                return await handler(event, data)
+            finally:
+                self._release(key, lane)
+        finally:
+            self._leave_chat(chat_id, text)
+
+    def _join_chat(self, chat_id: int, key: Hashable, text: Optional[str]):
+        chat = self._chats.setdefault(chat_id, [key, 0, {}])
+        chat[1] += 1
+        if text is not None:
+            same = chat[2].setdefault(text, [0, 0.0])
+            same[0] += 1
+            same[1] = time.monotonic()
+
+    async def _wait_turn(self, key: Hashable, lane: _Lane):
+        if lane.pending == 1:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled right after getting its turn: hand it to the next update
+                self._release(key, lane)
+            else:
+                lane.pending -= 1
+                if not lane.pending:
+                    del self._lanes[key]
+            raise
+
+    @asynccontextmanager
+    async def _hold_key(self, key: Hashable, chat_ids: List[int]) -> AsyncIterator[None]:
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.pending += 1
+        for chat_id in chat_ids:
+            self._join_chat(chat_id, key, None)
+        try:
+            await self._wait_turn(key, lane)
+            try:
+                yield
+            finally:
+                self._release(key, lane)
+        finally:
+            for chat_id in chat_ids:
+                self._leave_chat(chat_id, None)
+
+    @asynccontextmanager
+    async def hold(self, *chat_ids: int) -> AsyncIterator[None]:
+        """
+        Runs a block in turn with the updates of several chats, as if it was an update of
+        each of them: e.g. seating the players paired by the matchmaker, so that none of
+        them can leave halfway. Keys are taken in sorted order, so two holds never wait
+        for each other.
+        """
+        keys: Dict[Hashable, List[int]] = {}
+        for chat_id in chat_ids:
+            keys.setdefault(self._key(chat_id, None), []).append(chat_id)
+        async with AsyncExitStack() as stack:
+            for key in sorted(keys):
+                await stack.enter_async_context(self._hold_key(key, keys[key]))
+            yield
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "busy_keys": len(self._lanes),
+            "queued": sum(lane.pending for lane in self._lanes.values()),
+            "dropped_duplicates": self.dropped_duplicates,
+            "dropped_overflow": self.dropped_overflow,
+        }
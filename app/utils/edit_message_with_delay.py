@@ -1,8 +1,14 @@
-import asyncio
+from aiogram import Bot
+from aiogram.methods import EditMessageText
 from aiogram.types import Message
 
-async def edit_message(msg1: Message, new_text="❔", sleep=4):
-    if(sleep>=100):
-        return
-    await asyncio.sleep(sleep)
-    await msg1.edit_text(new_text)
+from utils.outbox import Outbox
+
+
+async def edit_message(outbox: Outbox, bot: Bot, msg1: Message, new_text="❔"):
+    """
+    Replaces the text of a sent message, e.g. to hide a loadout. Delays are up to the caller.
+    """
+    await outbox.send(
+        bot, EditMessageText(chat_id=msg1.chat.id, message_id=msg1.message_id, text=new_text)
+    )
@@ -0,0 +1,160 @@
+"""
+Logging that never waits on a disk or a terminal.
+
+Loggers only put records on a bounded queue; a `QueueListener` thread formats them and
+writes them to the console and to a log file rotated at midnight and gzipped. Records
+are formatted in that thread, so a message and its arguments cost the event loop
+nothing but the record itself; log values, not objects changed right after the call.
+When the writer falls behind, new records are dropped and counted instead of blocking.
+
+Records can carry the fields in `FIELDS` through `extra=`. The console shows them after
+the message, the file has one JSON object per line. High-volume loggers are sampled:
+only one record in `every` below WARNING goes through, marked with `sampled`.
+"""
+
+import gzip
+import itertools
+import json
+import logging
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Iterable
+
+from utils.metrics import LOG_RECORDS_DROPPED
+
+FIELDS = ("chat_id", "room_id", "action", "latency", "sampled")
+# Loggers with a record per update or per message
+SAMPLED_LOGGERS = ("buckshot.updates", "buckshot.messages")
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    The usual one-line format followed by the structured fields of the record.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = []
+        for name in FIELDS:
+            value = getattr(record, name, None)
+            if value is None:
+                continue
+            if name == "latency":
+                fields.append(f"latency={value * 1e3:.1f}ms")
+            else:
+                fields.append(f"{name}={value}")
+        return f"{line} | {' '.join(fields)}" if fields else line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, with the structured fields at the top level.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Lets one record in `every` through. Warnings and errors always pass.
+    """
+
+    def __init__(self, every: int) -> None:
+        super().__init__()
+        self.every = max(1, every)
+        self._count = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if next(self._count) % self.every:
+            return False
+        if self.every > 1:
+            record.sampled = self.every
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are, and drops them when the queue is full.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process: no need to format and strip the record here
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def setup_logging(
+    path: str,
+    level: int = logging.INFO,
+    queue_size: int = 10000,
+    sample_every: int = 1,
+    sampled: Iterable[str] = SAMPLED_LOGGERS,
+) -> QueueListener:
+    """
+    Routes all logging through a queue to the console and to `path`, and starts the
+    writer thread.
+
+    Args:
+    - path (str): The log file. Rotated files are `path.YYYY-MM-DD.gz` next to it.
+    - level (int): The level of the root logger.
+    - queue_size (int): Records waiting for the writer, more are dropped.
+    - sample_every (int): One record in this many of the `sampled` loggers is kept.
+    - sampled (Iterable[str]): Names of the high-volume loggers.
+
+    Returns:
+    - QueueListener: The writer, to stop on shutdown so the queue is flushed.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    console = logging.StreamHandler()
+    console.setFormatter(
+        StructuredFormatter("[%(asctime)s][%(levelname)s] %(message)s", "%d.%m.%Y %H:%M:%S")
+    )
+    file = TimedRotatingFileHandler(path, when="midnight", interval=7, backupCount=30, encoding="utf-8")
+    file.namer = gzip_namer
+    file.rotator = gzip_rotator
+    file.setFormatter(JsonFormatter())
+
+    records: queue.Queue = queue.Queue(queue_size)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(records))
+    root.setLevel(level)
+    for name in sampled:
+        logging.getLogger(name).addFilter(SampleFilter(sample_every))
+
+    listener = QueueListener(records, console, file, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,242 @@
+"""
+Prometheus metrics of the bot, served in the text exposition format.
+
+Counters and histograms are plain Python numbers updated in place, so recording costs
+a dict lookup and an addition and can stay on under full load. Values that already
+live elsewhere (rooms, lobby, outbox) are not tracked at all: collectors read them
+when Prometheus scrapes the endpoint.
+"""
+
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TURN_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, by label values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down, by label values.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+
+class Histogram(_Metric):
+    """
+    Observations counted in cumulative buckets, by label values.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.label_names, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {_number(total)}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics of the process and the collectors refreshing gauges on scrape.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, collect: Callable[[], Awaitable[None]]):
+        """
+        Registers a coroutine function called before every scrape.
+        """
+        self.collectors.append(collect)
+        return collect
+
+    async def render(self) -> str:
+        for collect in self.collectors:
+            try:
+                await collect()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Registry()
+
+HANDLER_SECONDS = METRICS.register(
+    Histogram("buckshot_handler_seconds", "Time to handle an update.", ["handler", "action"])
+)
+MAKE_TURN_SECONDS = METRICS.register(
+    Histogram("buckshot_make_turn_seconds", "Time spent in Scene.make_turn.", buckets=TURN_BUCKETS)
+)
+GAMES_STARTED = METRICS.register(Counter("buckshot_games_started_total", "Games started."))
+GAMES_FINISHED = METRICS.register(
+    Counter("buckshot_games_finished_total", "Games finished, by how they ended.", ["reason"])
+)
+TELEGRAM_REQUESTS = METRICS.register(
+    Counter("buckshot_telegram_requests_total", "Bot API requests, by method.", ["method"])
+)
+TELEGRAM_ERRORS = METRICS.register(
+    Counter("buckshot_telegram_errors_total", "Failed Bot API requests.", ["method", "error"])
+)
+LOOP_LAG_SECONDS = METRICS.register(
+    Histogram("buckshot_event_loop_lag_seconds", "Delay of the event loop in waking a sleeping task.")
+)
+LIVE_ROOMS = METRICS.register(Gauge("buckshot_live_rooms", "Rooms open right now."))
+SEATED_PLAYERS = METRICS.register(Gauge("buckshot_seated_players", "Players in a room."))
+LOBBY_SIZE = METRICS.register(Gauge("buckshot_lobby_players", "Players waiting for an opponent."))
+OUTBOX_DEPTH = METRICS.register(Gauge("buckshot_outbox_depth", "Messages waiting to be sent."))
+LOG_RECORDS_DROPPED = METRICS.register(
+    Counter("buckshot_log_records_dropped_total", "Log records dropped, the writer being behind.")
+)
+
+
+async def watch_loop_lag(interval: float = 0.5):
+    """
+    Sleeps `interval` seconds in a loop and records how late the event loop wakes up.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+
+class MetricsServer:
+    """
+    Serves `/metrics` from its own small aiohttp server. Other local-only endpoints can
+    be added to `app`.
+    """
+
+    def __init__(self, registry: Registry = METRICS) -> None:
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await self.registry.render()
+        return web.Response(body=body.encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self, host: str, port: int):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info("Metrics on http://%s:%s/metrics", host, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(
+    host: str,
+    port: int,
+    registry: Registry = METRICS,
+    setup: Optional[Callable[[web.Application], None]] = None,
+):
+    """
+    Runs a metrics server until cancelled. `setup` can add routes to its app.
+    """
+    server = MetricsServer(registry)
+    if setup is not None:
+        setup(server.app)
+    await server.start(host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
@@ -0,0 +1,263 @@
+"""
+Outbound message pipeline.
+
+Every chat has its own queue drained by its own task, so messages to one chat keep
+their order while different chats are served concurrently. Consecutive plain text
+messages queued for the same chat before they are sent are merged into one. Sends
+are paced by a token bucket per chat and a global one, and flood-control and
+server errors are retried here instead of in every handler. A network error can come
+after Telegram has already carried out the request, as a read timeout, so only edits,
+which do the same when sent twice, are retried then; other requests are only sent again
+when the connection failed before anything was sent.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from aiohttp import ClientConnectorError
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import (
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    SendMessage,
+    TelegramMethod,
+)
+
+from utils.profiling import TIMINGS
+
+logger = logging.getLogger()
+
+# Telegram's limit for the text of one message
+MAX_TEXT_LENGTH = 4096
+# Requests that do the same when sent twice, retried after any network error
+IDEMPOTENT = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+
+
+class TokenBucket:
+    """
+    Token bucket with reservations: a send takes a token even if none is left and
+    waits until the debt is refilled, so waiting senders are served in order.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """
+        Takes a token.
+
+        Returns:
+        - float: Seconds to wait before using it.
+        """
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def time_to_full(self, now: float) -> float:
+        self._refill(now)
+        return (self.capacity - self.tokens) / self.rate
+
+
+class _Outgoing:
+    __slots__ = ("bot", "method", "future")
+
+    def __init__(self, bot: Bot, method: TelegramMethod, future: asyncio.Future) -> None:
+        self.bot = bot
+        self.method = method
+        self.future = future
+
+
+def _merge(queued: _Outgoing, bot: Bot, method: TelegramMethod) -> bool:
+    # Only plain text messages of the same kind are merged, the keyboard of either one is kept
+    previous = queued.method
+    if queued.bot is not bot or type(previous) is not SendMessage or type(method) is not SendMessage:
+        return False
+    if previous.reply_markup is not None and method.reply_markup is not None:
+        return False
+    if (previous.parse_mode, previous.protect_content) != (method.parse_mode, method.protect_content):
+        return False
+    text = previous.text + "\n\n" + method.text
+    if len(text) > MAX_TEXT_LENGTH:
+        return False
+    queued.method = previous.model_copy(
+        update={"text": text, "reply_markup": previous.reply_markup or method.reply_markup}
+    )
+    return True
+
+
+def _can_resend(method: TelegramMethod, error: TelegramNetworkError) -> bool:
+    # aiogram raises the network error while handling the aiohttp one
+    return isinstance(method, IDEMPOTENT) or isinstance(error.__context__, ClientConnectorError)
+
+
+class Outbox:
+    """
+    Rate-limited, per-chat ordered message dispatcher.
+
+    Attributes:
+    - depth (int): Number of queued requests, the queue-depth metric.
+    - sent (int): Number of requests sent.
+    - merged (int): Number of messages merged into a queued one.
+    - retries (int): Number of retried requests.
+    - failed (int): Number of requests given up.
+    """
+
+    def __init__(
+        self,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        global_rate: float = 30.0,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_rate = global_rate
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._global_bucket: Optional[TokenBucket] = None
+        self._queues: Dict[int, Deque[_Outgoing]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.depth = 0
+        self.sent = 0
+        self.merged = 0
+        self.retries = 0
+        self.failed = 0
+
+    def send(self, bot: Bot, method: TelegramMethod) -> asyncio.Future:
+        """
+        Queues a request to a chat. Must be called from the event loop.
+
+        Args:
+        - bot (Bot): The bot sending the request.
+        - method (TelegramMethod): The request, with a `chat_id`.
+
+        Returns:
+        - asyncio.Future: Resolves to the result of the request. Merged messages share it.
+        """
+        chat_id = method.chat_id
+        timings = TIMINGS.get()
+        if timings is not None:
+            timings.messages += 1
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        elif queue and _merge(queue[-1], bot, method):
+            self.merged += 1
+            return queue[-1].future
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append(_Outgoing(bot, method, future))
+        self.depth += 1
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._run(chat_id, queue))
+        return future
+
+    def send_message(self, bot: Bot, chat_id: int, text: str, **kwargs: Any) -> asyncio.Future:
+        return self.send(bot, SendMessage(chat_id=chat_id, text=text, **kwargs))
+
+    async def _run(self, chat_id: int, queue: Deque[_Outgoing]):
+        loop = asyncio.get_running_loop()
+        if self._global_bucket is None:
+            self._global_bucket = TokenBucket(self.global_rate, self.global_rate, loop.time())
+        bucket = TokenBucket(self.chat_rate, self.chat_burst, loop.time())
+        try:
+            while True:
+                if not queue:
+                    # Linger until the bucket is full, so the chat's limit carries over bursts
+                    await asyncio.sleep(bucket.time_to_full(loop.time()))
+                    if not queue:
+                        break
+                    continue
+                item = queue.popleft()
+                self.depth -= 1
+                await self._execute(item, bucket)
+        finally:
+            del self._queues[chat_id]
+            del self._workers[chat_id]
+            for item in queue:
+                if not item.future.done():
+                    item.future.cancel()
+            self.depth -= len(queue)
+
+    async def _execute(self, item: _Outgoing, bucket: TokenBucket):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            await asyncio.sleep(bucket.reserve(loop.time()))
+            await asyncio.sleep(self._global_bucket.reserve(loop.time()))
+            try:
+                result = await item.bot(item.method)
+            except TelegramRetryAfter as e:
+                delay = e.retry_after
+            except TelegramServerError:
+                delay = self.backoff * 2**attempt
+            except TelegramNetworkError as e:
+                if not _can_resend(item.method, e):
+                    # Telegram may have delivered it already, a second copy would show
+                    self._fail(item, e)
+                    return
+                delay = self.backoff * 2**attempt
+            except Exception as e:
+                self._fail(item, e)
+                return
+            else:
+                self.sent += 1
+                if not item.future.done():
+                    item.future.set_result(result)
+                return
+
+            attempt += 1
+            if attempt > self.max_retries:
+                self._fail(item, Exception(f"Gave up sending to chat {item.method.chat_id}"))
+                return
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def _fail(self, item: _Outgoing, error: Exception):
+        self.failed += 1
+        logger.warning("Failed to send to chat %s: %s", item.method.chat_id, error)
+        if not item.future.done():
+            item.future.set_exception(error)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the pipeline counters.
+        """
+        return {
+            "depth": self.depth,
+            "chats": len(self._queues),
+            "sent": self.sent,
+            "merged": self.merged,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+    async def close(self, timeout: float = 5.0):
+        """
+        Waits up to `timeout` seconds for the queued requests, then stops the chat tasks.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.depth and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in list(self._workers.values()):
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
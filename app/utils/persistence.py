@@ -0,0 +1,373 @@
+"""
+Persistent FSM and room storage on an embedded SQLite file.
+
+Hot entries live in in-memory LRU caches, so reads and writes run at in-memory speed.
+Changed entries are marked dirty and `WriteBehind` flushes them to the file in one
+transaction per interval, from a worker thread. Entries are only evicted once their
+transaction has committed, and a failed flush puts them back among the dirty ones.
+Cache misses read the file from a worker thread as well, never on the event loop.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from core.game_log import GameLogWriter
+from core.scene import Scene
+from core.snapshot import dump_scene, load_scene, scene_players
+
+logger = logging.getLogger()
+
+# Marks a deleted entry in the dirty set
+_DELETED = object()
+
+
+class SQLiteBackend:
+    """
+    Synchronous access to the SQLite file. All calls are serialized by a lock,
+    so the flush thread and the event loop can share the connection.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rooms ("
+                "room_id INTEGER PRIMARY KEY, first_chat INTEGER, second_chat INTEGER, snapshot BLOB)"
+            )
+
+    def load_fsm(self, key: str) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def load_room(self, room_id: int) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT snapshot FROM rooms WHERE room_id = ?", (room_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def room_index(self) -> List[Tuple[int, Optional[int], Optional[int]]]:
+        with self._lock:
+            return self._conn.execute("SELECT room_id, first_chat, second_chat FROM rooms").fetchall()
+
+    def write_batch(
+        self,
+        fsm_upserts: List[tuple],
+        fsm_deletes: List[tuple],
+        room_upserts: List[tuple],
+        room_deletes: List[tuple],
+    ):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO fsm (key, state, data) VALUES (?, ?, ?)", fsm_upserts
+                )
+                self._conn.executemany("DELETE FROM fsm WHERE key = ?", fsm_deletes)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rooms (room_id, first_chat, second_chat, snapshot) "
+                    "VALUES (?, ?, ?, ?)",
+                    room_upserts,
+                )
+                self._conn.executemany("DELETE FROM rooms WHERE room_id = ?", room_deletes)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LRUCache:
+    """
+    In-memory LRU cache that tracks dirty entries. Dirty entries are never evicted
+    before they have been flushed and committed.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self._dirty: Dict[Any, Any] = {}
+        # Entries taken by a flush whose transaction has not committed yet
+        self._flushing: Dict[Any, Any] = {}
+
+    def get(self, key, default=None):
+        value = self._entries.get(key, default)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def put(self, key, value, dirty: bool = True):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if dirty:
+            self._dirty[key] = value
+        self._evict()
+
+    def mark_dirty(self, key):
+        if key in self._entries:
+            self._dirty[key] = self._entries[key]
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+        self._dirty[key] = _DELETED
+
+    def take_dirty(self) -> Dict[Any, Any]:
+        """
+        The dirty entries to flush. They stay in the cache until `flushed` or `restore_dirty`.
+        """
+        dirty, self._dirty = self._dirty, {}
+        self._flushing.update(dirty)
+        return dirty
+
+    def flushed(self):
+        """
+        The entries taken by `take_dirty` are committed and may be evicted.
+        """
+        self._flushing = {}
+        self._evict()
+
+    def restore_dirty(self, dirty: Dict[Any, Any]):
+        """
+        The flush of `dirty` failed: its entries are dirty again, unless changed since.
+        """
+        for key, value in dirty.items():
+            self._dirty.setdefault(key, value)
+        self._flushing = {}
+        self._evict()
+
+    def _evict(self):
+        if len(self._entries) <= self.capacity:
+            return
+        for key in list(self._entries):
+            if len(self._entries) <= self.capacity:
+                break
+            if key not in self._dirty and key not in self._flushing:
+                del self._entries[key]
+
+
+def _fsm_key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id}:{key.destiny}"
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage persisted to SQLite through a write-behind LRU cache.
+    """
+
+    def __init__(self, backend: SQLiteBackend, capacity: int = 100_000) -> None:
+        self.backend = backend
+        self.cache = LRUCache(capacity)
+
+    async def _record(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        db_key = _fsm_key(key)
+        record = self.cache.get(db_key)
+        if record is None:
+            # Read from a thread, the flush thread may hold the connection
+            loaded = await asyncio.to_thread(self.backend.load_fsm, db_key)
+            # A handler may have written the record meanwhile, that one is newer
+            record = self.cache.get(db_key)
+            if record is None:
+                record = loaded or (None, {})
+                self.cache.put(db_key, record, dirty=False)
+        return record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        self.cache.put(_fsm_key(key), (state, (await self._record(key))[1]))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self.cache.put(_fsm_key(key), ((await self._record(key))[0], data.copy()))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key))[1].copy()
+
+    async def close(self) -> None:
+        pass
+
+
+class PersistentRooms(MutableMapping[int, Scene]):
+    """
+    Mapping of room ids to scenes persisted to SQLite through a write-behind LRU cache.
+
+    Scenes are mutated by whoever fetched them, so every access marks the room dirty.
+    The mapping is synchronous, as `RoomsManager` uses it: callers on the event loop
+    `preload` a room first so that a cache miss does not read the file there.
+    """
+
+    def __init__(
+        self,
+        backend: SQLiteBackend,
+        capacity: int = 10_000,
+        log: Optional[GameLogWriter] = None,
+    ) -> None:
+        self.backend = backend
+        self.log = log
+        self.cache = LRUCache(capacity)
+        self.players: Dict[int, Tuple[Optional[int], Optional[int]]] = {
+            room_id: (first, second) for room_id, first, second in backend.room_index()
+        }
+
+    def player_rooms(self) -> Dict[int, int]:
+        """
+        Returns the room of every seated player, used to rebuild the player index after a restart.
+        """
+        return {
+            chat_id: room_id
+            for room_id, chats in self.players.items()
+            for chat_id in chats
+            if chat_id is not None
+        }
+
+    async def preload(self, room_id: int):
+        """
+        Reads a room missing from the cache from a worker thread.
+        """
+        if room_id in self.cache or room_id not in self.players:
+            return
+        data = await asyncio.to_thread(self.backend.load_room, room_id)
+        # Written or deleted meanwhile, the cache or the index is newer than the file
+        if data is None or room_id in self.cache or room_id not in self.players:
+            return
+        self.cache.put(room_id, load_scene(data, self.log), dirty=False)
+
+    def __getitem__(self, room_id: int) -> Scene:
+        scene = self.cache.get(room_id)
+        if scene is None:
+            if room_id not in self.players:
+                raise KeyError(room_id)
+            data = self.backend.load_room(room_id)
+            if data is None:
+                raise KeyError(room_id)
+            scene = load_scene(data, self.log)
+            self.cache.put(room_id, scene, dirty=False)
+        self.cache.mark_dirty(room_id)
+        return scene
+
+    def __setitem__(self, room_id: int, scene: Scene):
+        self.players[room_id] = (None, None)
+        self.cache.put(room_id, scene)
+
+    def __delitem__(self, room_id: int):
+        if room_id not in self.players:
+            raise KeyError(room_id)
+        del self.players[room_id]
+        self.cache.delete(room_id)
+
+    def pop(self, room_id: int, default: Any = None) -> Optional[Scene]:
+        """
+        Deletes a room without reading it back from the file: the scene is returned only
+        if it was cached.
+        """
+        if room_id not in self.players:
+            return default
+        scene = self.cache.get(room_id)
+        del self[room_id]
+        return scene
+
+    def __contains__(self, room_id) -> bool:
+        return room_id in self.players
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self.players))
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+
+class WriteBehind:
+    """
+    Periodically flushes the dirty entries of the FSM storage and the rooms in one batch.
+    """
+
+    def __init__(
+        self,
+        backend: SQLiteBackend,
+        storage: SQLiteStorage,
+        rooms: PersistentRooms,
+        interval: float = 1.0,
+    ) -> None:
+        self.backend = backend
+        self.storage = storage
+        self.rooms = rooms
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush the persistent storage")
+
+    async def flush(self):
+        fsm_dirty = self.storage.cache.take_dirty()
+        rooms_dirty = self.rooms.cache.take_dirty()
+        try:
+            await self._write(fsm_dirty, rooms_dirty)
+        except BaseException:
+            # Nothing was committed: the entries are flushed again next time
+            self.storage.cache.restore_dirty(fsm_dirty)
+            self.rooms.cache.restore_dirty(rooms_dirty)
+            raise
+        self.storage.cache.flushed()
+        self.rooms.cache.flushed()
+
+    async def _write(self, fsm_dirty: Dict[str, Any], rooms_dirty: Dict[int, Any]):
+        fsm_upserts, fsm_deletes = [], []
+        for key, record in fsm_dirty.items():
+            if record is _DELETED:
+                fsm_deletes.append((key,))
+            else:
+                fsm_upserts.append((key, record[0], json.dumps(record[1])))
+
+        # Scenes are serialized here, in the event loop, so no handler mutates them meanwhile
+        room_upserts, room_deletes = [], []
+        for room_id, scene in rooms_dirty.items():
+            if scene is _DELETED:
+                room_deletes.append((room_id,))
+                continue
+            players = scene_players(scene)
+            self.rooms.players[room_id] = players
+            room_upserts.append((room_id, *players, dump_scene(scene)))
+
+        if fsm_upserts or fsm_deletes or room_upserts or room_deletes:
+            await asyncio.to_thread(
+                self.backend.write_batch, fsm_upserts, fsm_deletes, room_upserts, room_deletes
+            )
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        self.backend.close()
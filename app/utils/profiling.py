@@ -0,0 +1,188 @@
+"""
+Where the time of an update goes, and an on-demand sampling profiler.
+
+Every update runs with a `Timings` in a context variable. Calls to the rooms go through
+`Timed`, which adds their duration to the engine time of the current update, and the
+outbox counts the messages queued by it. The moves searched for /solo dealers are
+counted apart. The rest of the handler's wall time is spent waiting on Telegram: sends,
+outbox pacing and retries. Updates slower than a threshold
+are kept in `SLOW_UPDATES` and logged.
+
+`SamplingProfiler` samples the stack of the event-loop thread from a background thread
+and writes the samples in the collapsed format of flamegraph.pl and speedscope. It only
+exists while a profile is being taken, so it costs nothing the rest of the time. Both
+are exposed on the local metrics server:
+    curl localhost:9464/debug/slow
+    curl -X POST 'localhost:9464/debug/profile?seconds=30'
+"""
+
+import asyncio
+import inspect
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional
+
+from aiohttp import web
+
+# The shortest sampling interval of a profile, in seconds: shorter ones only slow the bot down
+MIN_PROFILE_INTERVAL = 0.001
+
+
+class Timings:
+    """
+    Time spent by one update in each phase, in seconds.
+    """
+
+    __slots__ = ("engine", "search", "messages")
+
+    def __init__(self) -> None:
+        self.engine = 0.0
+        self.search = 0.0
+        self.messages = 0
+
+
+TIMINGS: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+# The slowest recent updates, newest last
+SLOW_UPDATES: Deque[Dict[str, Any]] = deque(maxlen=100)
+
+
+class Timed:
+    """
+    Proxy timing the coroutine methods of `target` as engine time of the current update.
+    Other attributes are passed through.
+    """
+
+    def __init__(self, target: Any) -> None:
+        self._target = target
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._target, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        async def timed(*args, **kwargs):
+            timings = TIMINGS.get()
+            if timings is None:
+                return await attribute(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return await attribute(*args, **kwargs)
+            finally:
+                timings.engine += time.perf_counter() - started
+
+        return timed
+
+
+def _frame_name(code) -> str:
+    filename = code.co_filename
+    # Shorten the paths of the bot's modules and the site-packages
+    for root in sys.path:
+        if root and filename.startswith(root):
+            filename = filename[len(root) :].lstrip(os.sep)
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every `interval` seconds from a background thread.
+
+    Args:
+    - thread_id (int): The thread to sample, usually the event loop's.
+    - interval (float): Seconds between samples.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._names: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = self._names.get(code)
+                if name is None:
+                    name = self._names[code] = _frame_name(code)
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def write_collapsed(self, path: str) -> int:
+        """
+        Writes one `stack count` line per distinct stack.
+
+        Returns:
+        - int: The number of samples.
+        """
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return sum(self.samples.values())
+
+
+class ProfilerControl:
+    """
+    HTTP endpoints to read the slow updates and take a profile of the running bot.
+
+    Args:
+    - directory (str): Where the collapsed-stack files are written.
+    - max_seconds (float): The longest profile an operator can ask for.
+    """
+
+    def __init__(self, directory: str, max_seconds: float = 300.0) -> None:
+        self.directory = directory
+        self.max_seconds = max_seconds
+        self._lock = asyncio.Lock()
+
+    def add_routes(self, app: web.Application):
+        app.router.add_get("/debug/slow", self.slow_updates)
+        app.router.add_post("/debug/profile", self.profile)
+
+    async def slow_updates(self, request: web.Request) -> web.Response:
+        return web.json_response(list(SLOW_UPDATES))
+
+    async def profile(self, request: web.Request) -> web.Response:
+        try:
+            seconds = float(request.query.get("seconds", 10))
+            interval = float(request.query.get("interval", 0.005))
+        except ValueError:
+            return web.json_response({"error": "seconds and interval must be numbers"}, status=400)
+        if not (math.isfinite(seconds) and seconds > 0):
+            return web.json_response({"error": "seconds must be a positive number"}, status=400)
+        if not (math.isfinite(interval) and interval > 0):
+            return web.json_response({"error": "interval must be a positive number"}, status=400)
+        seconds = min(seconds, self.max_seconds)
+        interval = max(interval, MIN_PROFILE_INTERVAL)
+        if self._lock.locked():
+            return web.json_response({"error": "a profile is already running"}, status=409)
+        async with self._lock:
+            profiler = SamplingProfiler(threading.get_ident(), interval)
+            profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                await asyncio.to_thread(profiler.stop)
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S.collapsed"))
+            samples = await asyncio.to_thread(profiler.write_collapsed, path)
+        return web.json_response({"path": path, "samples": samples, "seconds": seconds})
@@ -0,0 +1,86 @@
+"""
+One event-loop task firing all delayed work of the bot from a timing wheel.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable, Hashable, Optional, Set
+
+from core.timing_wheel import Timer, TimingWheel
+
+logger = logging.getLogger()
+
+
+class Scheduler:
+    """
+    Runs callbacks after a delay. A coroutine returned by a callback runs as a task.
+    The wheel is advanced by a single task, which sleeps while no timer is pending.
+    """
+
+    def __init__(self, resolution: float = 0.1) -> None:
+        self.resolution = resolution
+        self.wheel = TimingWheel(resolution, time.monotonic())
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def call_later(
+        self, delay: float, callback: Callable, *args: Any, key: Optional[Hashable] = None
+    ) -> Timer:
+        """
+        Schedules `callback(*args)` in `delay` seconds.
+
+        Args:
+        - delay (float): Seconds to wait.
+        - callback (Callable): A function or a coroutine function.
+        - key (Optional[Hashable]): Groups the timer, e.g. by chat, for `cancel_key`.
+
+        Returns:
+        - Timer: The timer, to cancel it.
+        """
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        timer = self.wheel.schedule(time.monotonic() + delay, (callback, args), key)
+        self._wake.set()
+        return timer
+
+    def cancel(self, timer: Timer) -> bool:
+        return self.wheel.cancel(timer)
+
+    def cancel_key(self, key: Hashable) -> int:
+        return self.wheel.cancel_key(key)
+
+    async def _run(self):
+        while True:
+            if not len(self.wheel):
+                self._wake.clear()
+                await self._wake.wait()
+            await asyncio.sleep(self.resolution)
+            for timer in self.wheel.advance(time.monotonic()):
+                callback, args = timer.payload
+                try:
+                    result = callback(*args)
+                except Exception:
+                    logger.exception("Scheduled callback failed")
+                    continue
+                if inspect.isawaitable(result):
+                    task = asyncio.create_task(self._guard(result))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+
+    async def _guard(self, awaitable):
+        try:
+            await awaitable
+        except Exception:
+            logger.exception("Scheduled callback failed")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
@@ -1,3 +1,17 @@
 from aiogram.fsm.storage.memory import MemoryStorage
+from config import config
+from core.game_log import GameLogWriter
 
-STORAGE = MemoryStorage()
\ No newline at end of file
+GAME_LOG = GameLogWriter(config.game_log_path) if config.game_log_path else None
+
+if config.storage_path:
+    from utils.persistence import PersistentRooms, SQLiteBackend, SQLiteStorage, WriteBehind
+
+    BACKEND = SQLiteBackend(config.storage_path)
+    STORAGE = SQLiteStorage(BACKEND)
+    ROOMS = PersistentRooms(BACKEND, log=GAME_LOG)
+    WRITE_BEHIND = WriteBehind(BACKEND, STORAGE, ROOMS, interval=config.storage_flush_interval)
+else:
+    STORAGE = MemoryStorage()
+    ROOMS = None
+    WRITE_BEHIND = None
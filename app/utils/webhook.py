@@ -0,0 +1,111 @@
+"""
+Webhook run mode: Telegram posts updates to a small aiohttp server.
+
+Updates are acknowledged as soon as they are accepted and processed in the background
+by at most `max_concurrency` tasks; when the pool is full, new requests wait for a free
+slot, which slows Telegram down instead of piling up work. `/healthz` answers while the
+process is alive, `/readyz` only while updates are accepted. On shutdown the server
+stops accepting updates (Telegram retries them on another instance) and drains the ones
+in flight.
+
+Every update must carry the secret token the webhook was set with: without a configured
+secret, a random one is generated at startup, so nobody but Telegram can post updates.
+"""
+
+import asyncio
+import logging
+import secrets
+from typing import Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger()
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Receives webhook updates and feeds them to the dispatcher.
+
+    Args:
+    - secret (Optional[str]): The secret token of the webhook, random if not set. Pass
+      `secret` to `Bot.set_webhook`.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = "/webhook",
+        secret: Optional[str] = None,
+        max_concurrency: int = 256,
+    ) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.ready = False
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._in_flight: Set[asyncio.Task] = set()
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get("/healthz", self.health)
+        self.app.router.add_get("/readyz", self.readiness)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def readiness(self, request: web.Request) -> web.Response:
+        if not self.ready:
+            return web.Response(status=503, text="not ready")
+        return web.Response(text="ready")
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if not self.ready:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            # Malformed updates are answered 400, a 500 would have Telegram retry them
+            return web.Response(status=400)
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            logger.exception("Failed to process update %s", update.update_id)
+        finally:
+            self._slots.release()
+
+    async def start(self, host: str, port: int):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.ready = True
+        logger.info("Webhook server listening on %s:%s%s", host, port, self.path)
+
+    async def stop(self, timeout: float = 30.0):
+        """
+        Stops accepting updates, waits up to `timeout` seconds for the ones in flight
+        and closes the server.
+        """
+        self.ready = False
+        if self._in_flight:
+            logger.info("Draining %d updates", len(self._in_flight))
+            await asyncio.wait(set(self._in_flight), timeout=timeout)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None